@@ -0,0 +1,102 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+"""Time the Psi staircase updates of the Heart Rate Discrimination task.
+
+Compare :py:class:`psychopy.data.PsiHandler` with the native
+:py:class:`cardioception.HRD.psi.PsiStaircase` (float64, float32 and with the tables
+memory-mapped from the cache) on the grid used by the task, for a simulated
+participant.
+
+Usage: python benchmarks/psi_update.py [--nTrials 60] [--seed 0]
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from cardioception.HRD.psi import PsiStaircase, openPsiGrid
+
+
+def psychopyHandler(nTrials: int):
+    from psychopy import data
+
+    return data.PsiHandler(
+        nTrials=nTrials,
+        intensRange=[-50.5, 50.5],
+        alphaRange=[-50.5, 50.5],
+        betaRange=[0.1, 25],
+        intensPrecision=1,
+        alphaPrecision=1,
+        betaPrecision=0.1,
+        delta=0.02,
+        stepType="lin",
+        expectedMin=0,
+    )
+
+
+def timeStaircase(
+    create: Callable, nTrials: int, seed: int, threshold: float = 10.0
+) -> Dict[str, Any]:
+    """Run a staircase and return the creation and update times (ms)."""
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    stairCase = create(nTrials)
+    creation = time.perf_counter() - start
+
+    updates: List[float] = []
+    intensities = []
+    for _ in range(nTrials):
+        alpha = stairCase.next()
+        intensities.append(float(alpha))
+        isMore = int(rng.random() < 0.01 + 0.98 * (alpha > threshold))
+        start = time.perf_counter()
+        stairCase.addResponse(isMore)
+        stairCase.estimateLambda()
+        updates.append(time.perf_counter() - start)
+
+    return {
+        "creation": creation * 1000,
+        "median": float(np.median(updates)) * 1000,
+        "max": float(np.max(updates)) * 1000,
+        "intensities": intensities,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nTrials", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    engines = {
+        "PsiStaircase (float64)": lambda n: PsiStaircase(nTrials=n),
+        "PsiStaircase (float32)": lambda n: PsiStaircase(nTrials=n, dtype="float32"),
+        "PsiStaircase (cached)": lambda n: PsiStaircase(nTrials=n, grid=openPsiGrid()),
+    }
+    try:
+        import psychopy  # noqa: F401
+
+        engines["psychopy.data.PsiHandler"] = psychopyHandler
+    except ImportError:
+        print("PsychoPy is not installed, only the native staircase is timed.")
+
+    results = {}
+    print(f"{'':<26}{'creation':>10}{'median':>10}{'max':>10}  (ms)")
+    for name, create in engines.items():
+        results[name] = timeStaircase(create, args.nTrials, args.seed)
+        print(
+            f"{name:<26}{results[name]['creation']:>10.1f}"
+            f"{results[name]['median']:>10.2f}{results[name]['max']:>10.2f}"
+        )
+
+    reference = results["PsiStaircase (float64)"]["intensities"]
+    for name, result in results.items():
+        same = np.mean(np.array(result["intensities"]) == np.array(reference))
+        print(f"{name}: {same:.0%} of the intensities match PsiStaircase (float64)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,47 +2,65 @@
 # Maintained by the Embodied Computation Group, Aarhus University
 
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 import numpy as np
 import pandas as pd
 import pkg_resources  # type: ignore
 import serial
-from systole import serialSim
 from systole.recording import Oximeter
 
+from cardioception.acquisition import AcquisitionService
+from cardioception.backends import createBackend, getBackend
+from cardioception.sources import SignalSerial
+from cardioception.stimuli import StimulusRegistry
+
 
 def getParameters(
     participant: str = "Participant",
     session: str = "001",
-    serialPort: str = "COM3",
+    serialPort: Union[str, Any] = "COM3",
     taskVersion: str = "Garfinkel",
     setup: str = "behavioral",
     screenNb: int = 0,
     fullscr: bool = True,
     resultPath: Optional[str] = None,
     systole_kw: dict = {},
+    backend: Union[str, Any] = "psychopy",
+    recordingWindow: float = 30.0,
 ) -> Dict:
     """Create Heartbeat Counting task parameters.
 
     Parameters
     ----------
+    backend : str | object
+        The display, audio and input backend. `"psychopy"` (default) runs the task
+        with PsychoPy. `"headless"` does not render, play sounds or wait, and reads
+        the responses from scripted input: pass a
+        :py:class:`cardioception.backends.HeadlessBackend` instance to provide the
+        input events or to accelerate the session time (`speed`).
     participant : str
         Subject ID. Default is 'exteroStairCase'.
+    recordingWindow : float
+        The length of the PPG recording kept in memory (seconds). Defaults to `30`.
+        The older samples are written to `spillFile`, so the memory usage does not
+        grow during long sessions.
     resultPath : str or None
         Where to save the results.
     screenNb : int
         Screen number. Used to parametrize py:func:`psychopy.visual.Window`.
         Default is set to 0.
-    serialPort: str
+    serialPort: str | object
         The USB port where the pulse oximeter is plugged. Should be written as a string
-        e.g. `"COM3"` for USB ports on Windows.
+        e.g. `"COM3"` for USB ports on Windows. With the `"test"` setup, a serial port
+        stand-in can be provided instead (e.g.
+        :py:class:`cardioception.sources.ReplaySerial` to replay previous sessions).
     session : int
         Session number. Default to '001'.
     setup : str
         Context of oximeter recording. `"behavioral"` will record through a Nonin
         pulse oximeter, `"test"` will use pre-recorded pulse time series (for testing
-        only).
+        only), streamed at the pace of the session clock.
     systole_kw : dict
         Additional keyword arguments for :py:class:`systole.recorder.Oxmeter`.
     taskVersion : str or None
@@ -50,6 +68,11 @@ def getParameters(
 
     Attributes
     ----------
+    backend : :py:class:`cardioception.backends.PsychopyBackend` |\
+        :py:class:`cardioception.backends.HeadlessBackend`
+        The backend providing the `core`, `event`, `visual` and `sound` modules
+        used by the task, and the session `clock` used for the waits, the event
+        markers and the pulse oximeter stand-in of the `"test"` setup.
     conditions : 1d array-like of str
         The conditions. Can be 'Rest', 'Training' or 'Count'.
     confScale : list
@@ -62,6 +85,9 @@ def getParameters(
         The sound that will be played when trial starts.
     noteStop : psychopy.sound.Sound instance
         The sound that will be played when trial ends.
+    oxiTask : :py:class:`cardioception.acquisition.AcquisitionService`
+        The pulse oximeter (:py:class:`systole.recording.Oximeter`), read
+        continuously in a background thread.
     path : str
         The task working directory.
     randomize : bool
@@ -69,6 +95,9 @@ def getParameters(
         taskVersion is not None, will use the default task parameter instead.
     rating : bool
         If `True` (default), will add a rating scale after the evaluation.
+    recordingWindow : float
+        The length of the PPG recording kept in memory (see the `recordingWindow`
+        argument).
     restLength : int
         The length of the resting period (seconds). Default is 300 seconds.
     restLogo : `psychopy.visual.ImageStim`
@@ -81,14 +110,35 @@ def getParameters(
         The screen number (Psychopy parameter). Default set to 0.
     serial : `serial.Serial`
         The serial port used to record the PPG activity.
+    spillFile : str
+        The binary file (`_ppg.rec`) where the PPG samples older than
+        `recordingWindow` are written during the recording. The full recording is
+        still saved in the usual `.npy` files.
     startKey : str
         The key to press to start the task and go to next steps.
+    stimuli : :py:class:`cardioception.stimuli.StimulusRegistry`
+        The visual stimuli presented during the trials, created once before the task
+        starts (see :py:func:`createStimuli`). The number of visual stimuli
+        constructed during each trial, by the registry or directly through the
+        backend `visual` module (see
+        :py:class:`cardioception.backends.CountingVisual`), is reported in the
+        `StimuliCreated` column of the results.
     taskVersion : str or None
         Task version to run. Can be 'Garfinkel', 'Shandry', 'test' or None.
     texts : dict
         Dictionary containing the texts to be presented.
     textSize : float
         Text size.
+    traceFile : str
+        The JSON lines file (`_trace.jsonl`) where the duration of each phase of the
+        trials is written by `tracer`. Use
+        :py:func:`cardioception.tracing.loadTrace` to read it.
+    tracer : :py:class:`cardioception.tracing.Tracer`
+        Created when the task starts. Records the duration of each phase of the
+        task, and writes them to `traceFile` after each trial.
+    traceSummary : dict
+        The number of occurrences and the median, 95th percentile and maximum
+        durations (seconds) of each phase, saved at the end of the task.
     triggers : dict
         Dictionary {str, callable or None}. The function will be executed
         before the corresponding trial sequence. The default values are
@@ -107,9 +157,9 @@ def getParameters(
         The window in which to draw objects.
 
     """
-    from psychopy import sound, visual
-
     parameters: Dict[str, Any] = {}
+    parameters["backend"] = createBackend(backend)
+    sound, visual = parameters["backend"].sound, parameters["backend"].visual
     parameters["restPeriod"] = True
     parameters["restLength"] = 30
     parameters["randomize"] = True
@@ -203,18 +253,41 @@ def getParameters(
     )
     parameters["heartLogo"].size *= 0.05
 
+    # Only the last seconds of the PPG recording are kept in memory, the older
+    # samples are written to a binary file in the result folder
+    parameters["recordingWindow"] = recordingWindow
+    parameters["spillFile"] = os.path.join(
+        parameters["resultPath"], f"{participant}{session}_ppg.rec"
+    )
+
+    # Duration of the phases of the trials
+    parameters["traceFile"] = os.path.join(
+        parameters["resultPath"], f"{participant}{session}_trace.jsonl"
+    )
+
     if setup == "behavioral":
         # PPG recording
         port = serial.Serial(serialPort)
-        parameters["oxiTask"] = Oximeter(
-            serial=port, sfreq=75, add_channels=1, **systole_kw
+        parameters["oxiTask"] = AcquisitionService(
+            Oximeter(serial=port, sfreq=75, add_channels=1, **systole_kw),
+            spillFile=parameters["spillFile"],
+            keepLength=parameters["recordingWindow"],
+            clock=parameters["backend"].clock,
         )
         parameters["oxiTask"].setup().read(duration=1)
     elif setup == "test":
-        # Use pre-recorded pulse time series for testing
-        port = serialSim()
-        parameters["oxiTask"] = Oximeter(
-            serial=port, sfreq=75, add_channels=1, **systole_kw
+        # Use pre-recorded pulse time series for testing, streamed at the pace of
+        # the session clock
+        port = (
+            SignalSerial(clock=parameters["backend"].clock)
+            if isinstance(serialPort, str)
+            else serialPort
+        )
+        parameters["oxiTask"] = AcquisitionService(
+            Oximeter(serial=port, sfreq=75, add_channels=1, **systole_kw),
+            spillFile=parameters["spillFile"],
+            keepLength=parameters["recordingWindow"],
+            clock=parameters["backend"].clock,
         )
         parameters["oxiTask"].setup().read(duration=1)
 
@@ -303,4 +376,72 @@ def getParameters(
     )
     parameters["textSize"] = 0.04
 
+    # Create the visual stimuli used during the trials
+    parameters["stimuli"] = createStimuli(parameters)
+
     return parameters
+
+
+def createStimuli(parameters: dict) -> StimulusRegistry:
+    """Create the visual stimuli presented during the task.
+
+    Parameters
+    ----------
+    parameters : dict
+        Task parameters. Requires the window, the texts and the text size.
+
+    Returns
+    -------
+    stimuli : :py:class:`cardioception.stimuli.StimulusRegistry`
+        The stimuli, indexed by role.
+    """
+    visual = getBackend(parameters).visual
+
+    texts, height = parameters["texts"], parameters["textSize"]
+    stimuli = StimulusRegistry(parameters["win"])
+
+    stimuli.add("start", visual.TextStim, height=height, text="Press space to continue")
+    stimuli.add(
+        "Rest", visual.TextStim, text=texts["Rest"], pos=(0.0, 0.2), height=height
+    )
+    stimuli.add(
+        "Count", visual.TextStim, text=texts["Count"], pos=(0.0, 0.2), height=height
+    )
+    stimuli.add(
+        "nCount", visual.TextStim, height=height, pos=(0, 0.2), text=texts["nCount"]
+    )
+    stimuli.add(
+        "notNumbers",
+        visual.TextStim,
+        height=height,
+        pos=(0, 0.2),
+        text="You should only provide numbers",
+    )
+    stimuli.add(
+        "noNumbers",
+        visual.TextStim,
+        height=height,
+        pos=(0, 0.2),
+        text="You should provide numbers",
+    )
+    stimuli.add("recorded", visual.TextStim, height=height, text="")
+    stimuli.add("confidence", visual.TextStim, text=texts["confidence"], height=height)
+    stimuli.add(
+        "ratingScale",
+        visual.RatingScale,
+        low=parameters["confScale"][0],
+        high=parameters["confScale"][1],
+        noMouse=True,
+        labels=parameters["labelsRating"],
+        acceptKeys="down",
+        markerStart=parameters["confScale"][0],
+    )
+    stimuli.add(
+        "done",
+        visual.TextStim,
+        height=height,
+        pos=(0.0, 0.0),
+        text="You have completed the task. Thank you for your participation.",
+    )
+
+    return stimuli.build()
@@ -6,6 +6,9 @@ from typing import Optional, Tuple
 import numpy as np
 import pandas as pd
 
+from cardioception.backends import getBackend
+from cardioception.tracing import Tracer, getTracer
+
 
 def run(
     parameters: dict,
@@ -23,15 +26,21 @@ def run(
 
     """
 
-    from psychopy import core, visual
+    backend = getBackend(parameters)
+    core = backend.core
+
+    # Duration of each phase of the task, written to the trace file
+    tracer = parameters["tracer"] = Tracer(parameters["traceFile"])
 
     # Run tutorial
     if runTutorial is True:
-        tutorial(parameters)
+        with tracer.span("tutorial"):
+            tutorial(parameters)
 
     # Rest
     if parameters["restPeriod"] is True:
-        rest(parameters, duration=parameters["restLength"])
+        with tracer.span("rest"):
+            rest(parameters, duration=parameters["restLength"])
 
     for condition, duration, nTrial in zip(
         parameters["conditions"],
@@ -39,41 +48,54 @@ def run(
         range(0, len(parameters["conditions"])),
     ):
 
+        # The spans of this iteration are saved with the trial number
+        tracer.trial = nTrial
+
         parameters["triggers"]["trialStart"]  # Send trigger or None
 
-        nCount, confidence, confidenceRT = trial(
-            condition, duration, nTrial, parameters
-        )
+        backend.visual.countCreated()
+        with tracer.span("trial", condition=condition):
+            nCount, confidence, confidenceRT = trial(
+                condition, duration, nTrial, parameters
+            )
 
         parameters["triggers"]["trialStop"]  # Send trigger or None
 
         # Store results in a DataFrame
-        parameters["results_df"] = pd.concat(
-            [
-                parameters["results_df"],
-                pd.DataFrame(
-                    {
-                        "nTrial": [nTrial],
-                        "Reported": [nCount],
-                        "Condition": [condition],
-                        "Duration": [duration],
-                        "Confidence": [confidence],
-                        "ConfidenceRT": [confidenceRT],
-                    }
-                ),
-            ],
-            ignore_index=True,
-        )
+        with tracer.span("results"):
+            parameters["results_df"] = pd.concat(
+                [
+                    parameters["results_df"],
+                    pd.DataFrame(
+                        {
+                            "nTrial": [nTrial],
+                            "Reported": [nCount],
+                            "Condition": [condition],
+                            "Duration": [duration],
+                            "Confidence": [confidence],
+                            "ConfidenceRT": [confidenceRT],
+                            "StimuliCreated": [backend.visual.countCreated()],
+                        }
+                    ),
+                ],
+                ignore_index=True,
+            )
 
         # Save the results at each iteration
-        parameters["results_df"].to_csv(
-            parameters["resultPath"]
-            + "/"
-            + parameters["participant"]
-            + parameters["session"]
-            + ".txt",
-            index=False,
-        )
+        with tracer.span("saveResults"):
+            parameters["results_df"].to_csv(
+                parameters["resultPath"]
+                + "/"
+                + parameters["participant"]
+                + parameters["session"]
+                + ".txt",
+                index=False,
+            )
+
+        # Write the spans of the trial, outside the time-critical phases
+        tracer.flush()
+
+    tracer.trial = None
 
     # Save results
     parameters["results_df"].to_csv(
@@ -85,14 +107,16 @@ def run(
         index=False,
     )
 
+    # Stop the acquisition thread
+    parameters["oxiTask"].close()
+    parameters["acquisitionStats"] = parameters["oxiTask"].stats()
+
+    # Duration of the phases of the task
+    parameters["traceSummary"] = tracer.close().summary()
+    print(f"Phase durations (ms):\n{tracer.report()}")
+
     # End of the task
-    end = visual.TextStim(
-        parameters["win"],
-        height=parameters["textSize"],
-        pos=(0.0, 0.0),
-        text="You have completed the task. Thank you for your participation.",
-    )
-    end.draw()
+    parameters["stimuli"].get("done").draw()
     parameters["win"].flip()
     core.wait(3)
 
@@ -128,176 +152,147 @@ def trial(
 
     """
 
-    from psychopy import core, event, visual
+    backend = getBackend(parameters)
+    core, event = backend.core, backend.event
+    tracer = getTracer(parameters)
 
     # Initialize default values
     confidence, confidenceRT = None, None
     nCounts: str = ""
 
     # Ask the participant to press 'Space' (default) to start the trial
-    messageStart = visual.TextStim(
-        parameters["win"], height=parameters["textSize"], text="Press space to continue"
-    )
-    messageStart.draw()
-    parameters["win"].flip()
-    event.waitKeys(keyList=parameters["startKey"])
+    parameters["stimuli"].get("start").draw()
     parameters["win"].flip()
+    with tracer.span("start"):
+        event.waitKeys(keyList=parameters["startKey"])
+        parameters["win"].flip()
 
-    parameters["oxiTask"].setup()
-    parameters["oxiTask"].read(duration=2)
+    with tracer.span("oximeterSetup"):
+        parameters["oxiTask"].setup()
+        parameters["oxiTask"].read(duration=2)
 
     # Show instructions
     if condition == "Rest":
-        message = visual.TextStim(
-            parameters["win"],
-            text=parameters["texts"]["Rest"],
-            pos=(0.0, 0.2),
-            height=parameters["textSize"],
-        )
-        message.draw()
+        parameters["stimuli"].get("Rest").draw()
         parameters["restLogo"].draw()
     elif (condition == "Count") | (condition == "Training"):
-        message = visual.TextStim(
-            parameters["win"],
-            text=parameters["texts"]["Count"],
-            pos=(0.0, 0.2),
-            height=parameters["textSize"],
-        )
-        message.draw()
+        parameters["stimuli"].get("Count").draw()
         parameters["heartLogo"].draw()
     parameters["win"].flip()
 
     # Wait for a beat to start the task
-    parameters["oxiTask"].waitBeat()
+    with tracer.span("waitBeat"):
+        parameters["oxiTask"].waitBeat()
     core.wait(3)
 
     # Sound signaling trial start
     if (condition == "Count") | (condition == "Training"):
-        parameters["oxiTask"].readInWaiting()
         # Add event marker
-        parameters["oxiTask"].channels["Channel_0"][-1] = 1
+        parameters["oxiTask"].trigger(1)
         parameters["noteStart"].play()
         parameters["triggers"]["listeningStart"]
         core.wait(1)
 
     # Record for a desired time length
-    parameters["oxiTask"].read(duration=duration - 1)
+    with tracer.span("recording"):
+        parameters["oxiTask"].read(duration=duration - 1)
 
     # Sound signaling trial stop
     if (condition == "Count") | (condition == "Training"):
         # Add event marker
-        parameters["oxiTask"].readInWaiting()
-        parameters["oxiTask"].channels["Channel_0"][-1] = 2
+        parameters["oxiTask"].trigger(2)
         parameters["noteStop"].play()
         parameters["triggers"]["listeningStop"]
         core.wait(3)
-        parameters["oxiTask"].readInWaiting()
 
     # Hide instructions
     parameters["win"].flip()
 
     # Save recording
-    parameters["oxiTask"].save(
-        parameters["resultPath"]
-        + "/"
-        + parameters["participant"]
-        + str(nTrial)
-        + "_"
-        + str(nTrial)
-    )
+    with tracer.span("saveRecording"):
+        parameters["oxiTask"].save(
+            parameters["resultPath"]
+            + "/"
+            + parameters["participant"]
+            + str(nTrial)
+            + "_"
+            + str(nTrial)
+        )
 
     ###############################
     # Record participant estimation
     ###############################
     if (condition == "Count") | (condition == "Training"):
         # Ask the participant to press 'Space' (default) to start the trial
-        messageCount = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            pos=(0, 0.2),
-            text=parameters["texts"]["nCount"],
-        )
+        messageCount = parameters["stimuli"].get("nCount")
         messageCount.draw()
         parameters["win"].flip()
 
         parameters["triggers"]["decisionStart"]  # Send trigger or None
+        backend.prompt("count", parameters, duration=duration)
+
+        with tracer.span("count"):
+            nCounts = ""
+            while True:
+
+                # Record new key
+                key = event.waitKeys(
+                    keyList=[
+                        "escape",
+                        "backspace",
+                        "return",
+                        "1",
+                        "2",
+                        "3",
+                        "4",
+                        "5",
+                        "6",
+                        "7",
+                        "8",
+                        "9",
+                        "0",
+                        "num_1",
+                        "num_2",
+                        "num_3",
+                        "num_4",
+                        "num_5",
+                        "num_6",
+                        "num_7",
+                        "num_8",
+                        "num_9",
+                        "num_0",
+                    ]
+                )
+
+                if key[0] == "escape":
+                    keys = event.getKeys()
+                    if "escape" in keys:
+                        print("User abort")
+                        parameters["win"].close()
+                        core.quit()
+                if key[0] == "backspace":
+                    if nCounts:
+                        nCounts = nCounts[:-1]
+                elif key[0] == "return":
+                    if not all(char.isdigit() for char in nCounts):
+                        parameters["stimuli"].get("notNumbers").draw()
+                        parameters["win"].flip()
+                        core.wait(2)
+                    elif nCounts == "":
+                        parameters["stimuli"].get("noNumbers").draw()
+                        parameters["win"].flip()
+                        core.wait(2)
+                    else:
+                        break
 
-        nCounts = ""
-        while True:
-
-            # Record new key
-            key = event.waitKeys(
-                keyList=[
-                    "escape",
-                    "backspace",
-                    "return",
-                    "1",
-                    "2",
-                    "3",
-                    "4",
-                    "5",
-                    "6",
-                    "7",
-                    "8",
-                    "9",
-                    "0",
-                    "num_1",
-                    "num_2",
-                    "num_3",
-                    "num_4",
-                    "num_5",
-                    "num_6",
-                    "num_7",
-                    "num_8",
-                    "num_9",
-                    "num_0",
-                ]
-            )
-
-            if key[0] == "escape":
-                keys = event.getKeys()
-                if "escape" in keys:
-                    print("User abort")
-                    parameters["win"].close()
-                    core.quit()
-            if key[0] == "backspace":
-                if nCounts:
-                    nCounts = nCounts[:-1]
-            elif key[0] == "return":
-                if not all(char.isdigit() for char in nCounts):
-                    messageError = visual.TextStim(
-                        parameters["win"],
-                        height=parameters["textSize"],
-                        pos=(0, 0.2),
-                        text="You should only provide numbers",
-                    )
-                    messageError.draw()
-                    parameters["win"].flip()
-                    core.wait(2)
-                elif nCounts == "":
-                    messageError = visual.TextStim(
-                        parameters["win"],
-                        height=parameters["textSize"],
-                        pos=(0, 0.2),
-                        text="You should provide numbers",
-                    )
-                    messageError.draw()
-                    parameters["win"].flip()
-                    core.wait(2)
                 else:
-                    break
-
-            else:
-                if key:
-                    nCounts += [s for s in key[0] if s.isdigit()][0]
+                    if key:
+                        nCounts += [s for s in key[0] if s.isdigit()][0]
 
-            # Show the text on the screen
-            recordedText = visual.TextStim(
-                parameters["win"], height=parameters["textSize"], text=nCounts
-            )
-            recordedText.draw()
-            messageCount.draw()
-            parameters["win"].flip()
+                # Show the text on the screen
+                parameters["stimuli"].get("recorded", text=nCounts).draw()
+                messageCount.draw()
+                parameters["win"].flip()
 
         parameters["triggers"]["decisionStop"]  # Send trigger or None
 
@@ -305,28 +300,21 @@ def trial(
         # Rating scale
         ##############
         if parameters["rating"] is True:
-            markerStart = np.random.choice(
-                np.arange(parameters["confScale"][0], parameters["confScale"][1])
-            )
-            ratingScale = visual.RatingScale(
-                parameters["win"],
-                low=parameters["confScale"][0],
-                high=parameters["confScale"][1],
-                noMouse=True,
-                labels=parameters["labelsRating"],
-                acceptKeys="down",
-                markerStart=markerStart,
-            )
-            message = visual.TextStim(
-                parameters["win"],
-                text=parameters["texts"]["confidence"],
-                height=parameters["textSize"],
-            )
+            with tracer.span("ratingSetup"):
+                markerStart = np.random.choice(
+                    np.arange(parameters["confScale"][0], parameters["confScale"][1])
+                )
+                ratingScale = parameters["stimuli"].reset(
+                    "ratingScale", markerStart=markerStart
+                )
+            backend.prompt("confidence", parameters, scale=ratingScale)
+            message = parameters["stimuli"].get("confidence")
             parameters["triggers"]["confidenceStart"]
-            while ratingScale.noResponse:
-                message.draw()
-                ratingScale.draw()
-                parameters["win"].flip()
+            with tracer.span("rating"):
+                while ratingScale.noResponse:
+                    message.draw()
+                    ratingScale.draw()
+                    parameters["win"].flip()
             confidence = ratingScale.getRating()
             confidenceRT = ratingScale.getRT()
             parameters["triggers"]["confidenceStop"]
@@ -347,7 +335,8 @@ def tutorial(parameters: dict):
         The window in which to draw objects.
     """
 
-    from psychopy import event, visual
+    backend = getBackend(parameters)
+    event, visual = backend.event, backend.visual
 
     # Tutorial 1
     messageStart = visual.TextStim(
@@ -526,7 +515,7 @@ def rest(parameters: dict, duration: float = 300.0):
 
     """
 
-    from psychopy import visual
+    visual = getBackend(parameters).visual
 
     # Show the resting state instructions
     messageStart = visual.TextStim(
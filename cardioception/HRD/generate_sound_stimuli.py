@@ -3,112 +3,156 @@
 # Adapted from: https://stackoverflow.com/questions/33879523/python-how-can-i-generate-a-wav-file-with-beeps
 # This script generates the BPM stimuli (wav files) used by the task.
 # Not called by the actual task, but included for reproducibility.
+#
+# Usage (regenerate the default stimuli in ./Sounds):
+#   python -m cardioception.HRD.generate_sound_stimuli --output Sounds
 
-import math
-import struct
+import argparse
+import os
 import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional
 
 import numpy as np
 
+from cardioception.HRD.sounds import synthesize
 
-def append_silence(audio: list, duration_milliseconds: int = 500):
-    """Add silence to the signal.
+
+def save_wav(audio: np.ndarray, file_name: str, sample_rate: int = 44100):
+    """Save the audio signal as wav file.
 
     Parameters
     ----------
-    audio : list
-        The signal where the sine should be added.
-    duration_milliseconds : int
-        The sine length.
-
-    Returns
-    -------
-    audio : list
-        The signal with the added silence.
+    audio : np.ndarray
+        The signal as 16 bits integers (see
+        :py:func:`cardioception.HRD.sounds.synthesize`).
+    file_name : str
+        The path to the wav file.
+    sample_rate : int
+        The sampling rate of the signal. Defaults to `44100`.
     """
-    num_samples = duration_milliseconds * (sample_rate / 1000.0)
-
-    for x in range(int(num_samples)):
-        audio.append(0.0)
-
-    return audio
-
-
-def append_sinewave(
-    audio: list, freq: int = 440, duration_milliseconds: int = 200, volume: float = 1.0
-):
-    """Add sinewave to the signal.
+    with wave.open(file_name, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.asarray(audio, dtype="<i2").tobytes())
+
+
+def generate_stimulus(
+    bpm: float,
+    output: str = "Sounds",
+    freq: float = 440.0,
+    tone_duration: float = 200.0,
+    volume: float = 0.5,
+    beats: int = 5,
+    sample_rate: int = 44100,
+) -> str:
+    """Generate one stimulus and save it as `<output>/<bpm>.wav`.
 
     Parameters
     ----------
-    audio : list
-        The signal where the sine should be added.
-    freq : int
-        The sine frequency.
-    duration_milliseconds : int
-        The sine length.
-    volume : float
-        The sine amplitude.
+    bpm : float
+        The frequency of the beeps (beats per minute).
+    output : str
+        The output directory.
+    freq, tone_duration, volume, beats, sample_rate :
+        See :py:func:`cardioception.HRD.sounds.synthesize`.
 
     Returns
     -------
-    audio : array
-        The signal with the added sound.
+    file_name : str
+        The path to the new wav file.
     """
-    num_samples = duration_milliseconds * (sample_rate / 1000.0)
+    audio = synthesize(
+        bpm,
+        freq=freq,
+        toneDuration=tone_duration,
+        volume=volume,
+        nBeats=beats,
+        sampleRate=float(sample_rate),
+    )
+    file_name = os.path.join(output, f"{float(bpm)}.wav")
+    save_wav(audio, file_name, sample_rate=sample_rate)
 
-    for x in range(int(num_samples)):
-        audio.append(volume * math.sin(2 * math.pi * freq * (x / sample_rate)))
+    return file_name
 
-    return audio
 
-
-def save_wav(audio: list, file_name: str):
-    """Save the audio signal as wav file.
+def generate_stimuli(
+    bpms: Optional[Iterable[float]] = None,
+    output: str = "Sounds",
+    n_jobs: Optional[int] = None,
+    **kwargs,
+) -> List[str]:
+    """Generate the stimuli for a grid of frequencies using a pool of processes.
 
     Parameters
     ----------
-    audio : list
-        The signal where the sine should be added.
-    freq : int
-        The sine frequency.
-    duration_milliseconds : int
-        The sine length.
-    volume : float
-        The sine amplitude.
-    """
-    # Open up a wav file
-    wav_file = wave.open(file_name, "w")
-
-    # wav params
-    nchannels, sampwidth = 1, 2
+    bpms : iterable | None
+        The frequencies (beats per minute). Defaults to 15 to 199.5 BPM with 0.5 BPM
+        steps (the stimuli shipped with the task).
+    output : str
+        The output directory. Created if it does not exist.
+    n_jobs : int | None
+        Number of processes. If `None`, use the number of CPUs. With `n_jobs=1`, the
+        stimuli are generated in the current process.
+    kwargs :
+        Additional parameters passed to :py:func:`generate_stimulus` (`freq`,
+        `tone_duration`, `volume`, `beats`, `sample_rate`).
 
-    # 44100 is the industry standard sample rate
-    nframes = len(audio)
-    wav_file.setparams(
-        (nchannels, sampwidth, sample_rate, nframes, "NONE", "not compressed")  # type: ignore
+    Returns
+    -------
+    file_names : list
+        The paths to the new wav files.
+    """
+    if bpms is None:
+        bpms = np.arange(15, 200, 0.5)
+    bpms = [float(bpm) for bpm in bpms]
+    os.makedirs(output, exist_ok=True)
+
+    if n_jobs == 1:
+        return [generate_stimulus(bpm, output, **kwargs) for bpm in bpms]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [
+            executor.submit(generate_stimulus, bpm, output, **kwargs) for bpm in bpms
+        ]
+        return [future.result() for future in futures]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate the HRD sound stimuli.")
+    parser.add_argument("--output", default="Sounds", help="Output directory.")
+    parser.add_argument("--start", type=float, default=15.0, help="Lowest BPM.")
+    parser.add_argument(
+        "--stop", type=float, default=200.0, help="Highest BPM (excluded)."
     )
+    parser.add_argument("--step", type=float, default=0.5, help="BPM step.")
+    parser.add_argument(
+        "--freq", type=float, default=440.0, help="Tone frequency (Hz)."
+    )
+    parser.add_argument(
+        "--tone-duration", type=float, default=200.0, help="Beep duration (ms)."
+    )
+    parser.add_argument(
+        "--volume", type=float, default=0.5, help="Tone amplitude (0-1)."
+    )
+    parser.add_argument("--beats", type=int, default=5, help="Number of beeps.")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="Sampling rate.")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of processes.")
+    args = parser.parse_args(argv)
+
+    file_names = generate_stimuli(
+        np.arange(args.start, args.stop, args.step),
+        output=args.output,
+        n_jobs=args.jobs,
+        freq=args.freq,
+        tone_duration=args.tone_duration,
+        volume=args.volume,
+        beats=args.beats,
+        sample_rate=args.sample_rate,
+    )
+    print(f"{len(file_names)} stimuli saved in {args.output}")
 
-    for sample in audio:
-        wav_file.writeframes(struct.pack("h", int(sample * 32767.0)))
-
-    wav_file.close()
-
-
-# Generate wav files for frequencies between 15 and 200 beats per minutes
-for bpm in np.arange(15, 200, 0.5):
-
-    rr = (60000 / bpm) - 200
-    audio: list = []
-    sample_rate = 44100.0
-
-    # Create
-    beats = 5
-    while beats > 0:
-
-        # Sound
-        audio = append_sinewave(audio, volume=0.5)
-        audio = append_silence(audio, duration_milliseconds=rr)
-        beats -= 1
 
-    save_wav(audio, "Sounds/" + str(bpm) + ".wav")
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,29 @@
 # Maintained by the Embodied Computation Group, Aarhus University
 
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 import pkg_resources  # type: ignore
 import serial
-from systole import serialSim
 from systole.recording import Oximeter
 
+from cardioception.acquisition import AcquisitionService
+from cardioception.backends import createBackend, getBackend
 from cardioception.HRD.languages import danish, danish_children, english, french
+from cardioception.HRD.psi import PsiStaircase, StoppingRule, openPsiGrid
+from cardioception.HRD.scheduler import SessionScheduler
+from cardioception.HRD.sounds import SoundCache, openStimulusBank, reachableBPMs
+from cardioception.peaks import StreamingPeakDetector
+from cardioception.sources import SignalSerial
+from cardioception.stimuli import StimulusRegistry
 
 
 def getParameters(
     participant: str = "SubjectTest",
     session: str = "001",
-    serialPort: str = "COM3",
+    serialPort: Union[str, Any] = "COM3",
     setup: str = "behavioral",
     stairType: str = "psi",
     exteroception: bool = True,
@@ -30,6 +37,14 @@ def getParameters(
     resultPath: Optional[str] = None,
     language: str = "english",
     systole_kw: dict = {},
+    seed: Optional[int] = None,
+    stoppingRule: Optional[str] = None,
+    timeBudget: Optional[float] = None,
+    backend: Union[str, Any] = "psychopy",
+    psiDtype: str = "float64",
+    recordingWindow: float = 30.0,
+    soundCacheSize: float = 256.0,
+    posteriorDtype: str = "float64",
 ):
     """Create Heart Rate Discrimination task parameters.
 
@@ -42,6 +57,12 @@ def getParameters(
 
     Parameters
     ----------
+    backend : str | object
+        The display, audio and input backend. `"psychopy"` (default) runs the task
+        with PsychoPy. `"headless"` does not render, play sounds or wait, and reads
+        the responses from scripted input: pass a
+        :py:class:`cardioception.backends.HeadlessBackend` instance to provide the
+        input events or to accelerate the session time (`speed`).
     device : str
         Select how the participant provide responses. Can be `'mouse'` or `'keyboard'`.
     exteroception : bool
@@ -65,33 +86,76 @@ def getParameters(
            the task contains 25 interoceptive trials and 25 exteroceptive trials.
     participant : str
         Subject ID. Default is 'Participant'.
+    posteriorDtype : str
+        The data type used to store the history of the Psi posteriors. Can be
+        `"float64"` (default) or `"float32"` (half the size on disk).
+    psiDtype : str
+        The data type of the likelihood tables and posteriors of the
+        `"nativePsi"` staircase. Can be `"float64"` (default) or `"float32"` (half
+        the memory and faster updates, the posterior differs by less than 1e-7).
     catchTrials : float
         Ratio of Psi trials allocated to extreme values (+20 or -20 bpm with some
         jitter) to control for range of stimuli presented. Default to `0.0` (no catch
         trials). If not `0.0`, recomended value is `0.2`.
+    recordingWindow : float
+        The length of the PPG recording kept in memory (seconds). Defaults to `30`.
+        The older samples are written to `spillFile`, so the memory usage does not
+        grow during long sessions.
     resultPath : str | None
         Where to save the results.
     screenNb : int
         Screen number. Used to parametrize py:func:`psychopy.visual.Window`. Defaults
         to `0`.
-    serialPort: str
+    seed : int | None
+        Seed of the random generator used to create the trial schedule. Use the same
+        seed to present the same sequence of trials again. If `None` (default), a new
+        seed is drawn.
+    serialPort: str | object
         The USB port where the pulse oximeter is plugged. Should be written as a string
-        e.g. `"COM3"` for USB ports on Windows.
+        e.g. `"COM3"` for USB ports on Windows. With the `"test"` setup, a serial port
+        stand-in can be provided instead (e.g.
+        :py:class:`cardioception.sources.ReplaySerial` to replay previous sessions).
     session : int
         Session number. Default to '001'.
     setup : str
         Context of oximeter recording. `"ehavioral"` will record through a Nonin
         pulse oximeter and `"test"` will use pre-recorded pulse time series (for
-        testing only).
+        testing only), streamed at the pace of the session clock.
+    soundCacheSize : float
+        Memory limit (MB) of the sound cache. The stimulus sounds that can be
+        presented are preloaded by order of likelihood until this limit is reached,
+        the others are read from the stimulus bank when needed. Defaults to `256`.
     stairType : str
-        Staircase type. Can be "psi" or "updown". Default set to "psi".
+        Staircase type. Can be "psi" (:py:class:`psychopy.data.PsiHandler`),
+        "nativePsi" (:py:class:`cardioception.HRD.psi.PsiStaircase`, same procedure
+        with faster updates) or "updown". Default set to "psi".
+    stoppingRule : str | None
+        If `"credibleInterval"` or `"entropy"`, each Psi staircase is retired once
+        the width of the credible interval of the threshold or the entropy of the
+        posterior is below the target (see
+        :py:class:`cardioception.HRD.psi.StoppingRule`). The remaining trials of
+        this modality are given to the other one, and the session ends when all the
+        staircases are retired. If `None` (default), all the trials are presented.
+        Cannot be used with `stairType="updown"`.
     systole_kw : dict
         Additional keyword arguments for :py:class:`systole.recorder.Oxmeter`.
+    timeBudget : float | None
+        The duration of the session (seconds), from the first trial to the end of
+        the task, breaks included. If provided, the modality of each trial is chosen
+        during the task by :py:class:`cardioception.HRD.scheduler.SessionScheduler`
+        and the session ends when the time is over. `nTrials` is then the maximum
+        number of trials. If `None` (default), the `nTrials` trials of `schedule`
+        are presented.
 
     Attributes
     ----------
     allowedKeys : list of str
         The possible response keys.
+    backend : :py:class:`cardioception.backends.PsychopyBackend` |\
+        :py:class:`cardioception.backends.HeadlessBackend`
+        The backend providing the `core`, `event`, `visual` and `sound` modules
+        used by the task, and the session `clock` used for the waits, the event
+        markers and the pulse oximeter stand-in of the `"test"` setup.
     confScale : list
         The range of the confidence rating scale.
     device : str
@@ -101,6 +165,23 @@ def getParameters(
         Cut off for extreme heart rate values during recording.
     ExteroCondition : bool
         If `True`, the task includes an exteroceptive (half of the trials).
+    flushEvery : int
+        Number of trials buffered before the results are appended to the result
+        file. Defaults to `1` (each trial is written as soon as it ends).
+    frameDropBudget : int
+        The number of frames that can be dropped during the decision and the rating
+        of a trial before a warning is raised (if `frameTiming` is `True`). Defaults
+        to `2`.
+    frameMonitor : :py:class:`cardioception.tracing.FrameMonitor` | None
+        Created when the task starts if `frameTiming` is `True`. The number of
+        frames dropped during the decision and the rating, and the jitter and the
+        maximum of the frame intervals are saved in the `DecisionDroppedFrames`,
+        `RatingDroppedFrames`, `FrameJitter` and `MaxFrameInterval` (ms) columns of
+        the results, and the totals of the session in `frameStats`.
+    frameTiming : bool
+        If `True`, the intervals between the frames are recorded during the
+        decision (mouse) and the confidence rating, where the screen is redrawn at
+        each frame. Defaults to `False`.
     isi : tuple
         Range of the inter-stimulus interval (seconds). Should be in the form of (low,
         high). At each trial the value is generated using a uniform distribution
@@ -116,6 +197,9 @@ def getParameters(
         threshold) across trials for the interoceptive condition.
     listenLogo, heartLogo : Psychopy visual instance
         Image used for the inference and recording phases, respectively.
+    maxFlushLatency : float
+        Maximum time (seconds) a trial can stay in the result buffer before it is
+        written to the result file. Defaults to `10.0`.
     maxRatingTime : float
         The maximum time for a confidence rating (in seconds).
     minRatingTime : float
@@ -141,24 +225,107 @@ def getParameters(
            during the experiment. If `nTrials=50` and `exteroception=False`, the task
            contains 50 interoceptive trials. If `nTrials=50` and `exteroception=True`,
            the task contains 25 interoceptive trials and 25 exteroceptive trials.
+    oxiTask : :py:class:`cardioception.acquisition.AcquisitionService`
+        The pulse oximeter (:py:class:`systole.recording.Oximeter`), read
+        continuously in a background thread. The task only posts the triggers and
+        reads the last samples from the ring buffer. The acquisition counters
+        (dropped samples, read latency and buffer high-water mark) are saved in
+        `acquisitionStats` at the end of the task.
     participant : str
         Subject ID. Default is 'Participant'.
+    peakDetection : str
+        The method used to estimate the heart rate during the interoceptive
+        listening phase. If `"streaming"` (default), the PPG samples are processed
+        at 75 Hz as they are received by `peakDetector`. If `"systole"`, the last 6
+        seconds of signal are resampled to 1000 Hz and processed using
+        :py:func:`systole.detection.ppg_peaks` (method used in previous versions).
+    peakDetector : :py:class:`cardioception.peaks.StreamingPeakDetector`
+        The incremental peak detector used if `peakDetection` is `"streaming"`.
+    posteriorDtype : str
+        The data type used to store the history of the Psi posteriors (see the
+        `posteriorDtype` argument).
+    psiDtype : str
+        The data type of the `"nativePsi"` staircases (see the `psiDtype`
+        argument).
+    psiGrid : :py:class:`cardioception.HRD.psi.PsiGrid`
+        The likelihood tables shared by the interoceptive and exteroceptive
+        `"nativePsi"` staircases. They are cached in the cardioception cache
+        directory (see :py:func:`cardioception.storage.cacheDir`) and memory-mapped
+        in the following sessions.
     path : str
         The task working directory.
+    recordingWindow : float
+        The length of the PPG recording kept in memory (see the `recordingWindow`
+        argument).
     resultPath : str | None
         Where to save the results.
+    schedule : :py:class:`cardioception.HRD.parameters.TrialSchedule`
+        The plan of all the trials (modality, staircase type, catch trial
+        intensity, interval, exteroceptive frequency and breaks), created from
+        `seed` by :py:func:`compileSchedule`. The tutorial plan is created when the
+        task starts (`tutorialSchedule`), see :py:func:`compileTutorial`.
+    scheduler : :py:class:`cardioception.HRD.scheduler.SessionScheduler` | None
+        If `timeBudget` is provided, chooses the modality of each trial from the
+        measured trial durations and the expected information gain of each
+        staircase. The trial type, the catch trial intensity and the exteroceptive
+        frequency are read from the next trial of this modality in `schedule` (a
+        staircase trial once all the planned trials of the modality were presented),
+        the intervals and the breaks from the current trial.
+    seed : int
+        The seed used to create `schedule`.
     serial : PySerial instance
         The serial port used to record the PPG activity.
     screenNb : int
         The screen number (Psychopy parameter). Default set to 0.
-    signal_df : pandas.DataFrame instance
-        Dataframe where the pulse signal recorded during the interoception
-        condition will be stored.
+    signalStore : :py:class:`cardioception.storage.SignalStore`
+        Created when the task starts. The raw pulse signal recorded during the
+        interoception trials is appended to the `_signal.bin` file after each trial.
+        Use :py:func:`cardioception.storage.loadSignal` to read it.
+    soundCache : :py:class:`cardioception.HRD.sounds.SoundCache`
+        The stimulus sounds, read from `stimulusBank` and loaded in memory before the
+        task starts. The sounds that can be presented are preloaded by order of
+        likelihood until the memory limit is reached.
+    soundCacheSize : float
+        Memory limit (MB) of the sound cache (see the `soundCacheSize` argument).
+    spillFile : str
+        The binary file (`_ppg.rec`) where the PPG samples older than
+        `recordingWindow` are written during the recording. The full recording is
+        still saved in the usual `.txt` files.
     stairCase : dict
         The staircase instances for 'psi' and 'UpDown'. Each entry contain
-        dictionary for 'Intero' and 'Extero conditions' (if relevant).
+        dictionary for 'Intero' and 'Extero conditions' (if relevant). The
+        staircases are updated in a background thread during the confidence rating
+        (see :py:class:`cardioception.HRD.psi.StaircaseWorker`). The time spent on
+        each update and the part hidden behind the rating phase are saved in
+        `staircaseTiming` at the end of the task.
+    stoppingRule : :py:class:`cardioception.HRD.psi.StoppingRule` | None
+        The stopping rule of the Psi staircases. The target, the minimum and the
+        maximum number of trials per modality can be changed by replacing this
+        instance (e.g. `StoppingRule("entropy", target=9.0, minTrials=30)`). The
+        entropy of the posterior and the width of the credible interval are saved
+        after each Psi trial (`PosteriorEntropy` and `ThresholdInterval` columns),
+        and the trial where each staircase was retired in `retired` (`Retired`
+        column).
+    stimuli : :py:class:`cardioception.stimuli.StimulusRegistry`
+        The visual stimuli presented during the trials, created once before the task
+        starts (see :py:func:`createStimuli`). The number of visual stimuli
+        constructed during each trial, by the registry or directly through the
+        backend `visual` module (see
+        :py:class:`cardioception.backends.CountingVisual`), is reported in the
+        `StimuliCreated` column of the results.
+    stimulusBank : :py:class:`cardioception.HRD.sounds.StimulusBank`
+        The memory-mapped file containing all the stimulus sounds. The file is
+        built in the cache directory (`~/.cardioception` or `CARDIOCEPTION_CACHE`)
+        the first time the task is launched, and named after a hash of the
+        synthesis parameters and of the package version (see
+        :py:func:`cardioception.HRD.sounds.bankKey`).
+    staircaisePosteriors : dict
+        The :py:class:`cardioception.storage.PosteriorStore` instances where the
+        posterior distributions are written after each Psi trial (one per modality).
+        Created when the task starts.
     staircaseType : 1d array-like
         Vector indexing stairce type (`'UpDown'`, `'psi'`, `'psiCatchTrial'`).
+        Read-only view of `schedule.staircaseType`.
     startKey : str
         The key to press to start the task and go to next steps.
     response_keys : dict
@@ -175,6 +342,16 @@ def getParameters(
         Long text elements.
     textSize : float
         Scalling parameter for text size.
+    traceFile : str
+        The JSON lines file (`_trace.jsonl`) where the duration of each phase of the
+        trials is written by `tracer`. Use
+        :py:func:`cardioception.tracing.loadTrace` to read it.
+    tracer : :py:class:`cardioception.tracing.Tracer`
+        Created when the task starts. Records the duration of each phase of the
+        task, and writes them to `traceFile` after each trial.
+    traceSummary : dict
+        The number of occurrences and the median, 95th percentile and maximum
+        durations (seconds) of each phase, saved at the end of the task.
     triggers : dict
         Dictionary {str, callable or None}. The function will be executed
         before the corresponding trial sequence. The default values are
@@ -203,9 +380,9 @@ def getParameters(
     behavioral results data frame.
 
     """
-    from psychopy import data, event, visual
-
     parameters: Dict[str, Any] = {}
+    parameters["backend"] = createBackend(backend)
+    event, visual = parameters["backend"].event, parameters["backend"].visual
     parameters["ExteroCondition"] = exteroception
     parameters["device"] = device
     if parameters["device"] == "keyboard":
@@ -227,8 +404,12 @@ def getParameters(
     parameters["lambdaIntero"] = []  # Save the history of lambda values
     parameters["lambdaExtero"] = []  # Save the history of lambda values
     parameters["nFinger"] = None
-    parameters["signal_df"] = pd.DataFrame([])  # Physiological recording
     parameters["results_df"] = pd.DataFrame([])  # Behavioral results
+    parameters["flushEvery"] = 1  # Trials buffered before writing results
+    parameters["maxFlushLatency"] = 10.0  # Max delay (s) before writing results
+    parameters["frameTiming"] = False  # Record the frame intervals of the responses
+    parameters["frameDropBudget"] = 2  # Dropped frames per trial before warning
+    parameters["frameMonitor"] = None
 
     # Set default path /Results/ 'Subject ID' /
     parameters["participant"] = participant
@@ -242,47 +423,26 @@ def getParameters(
     if not os.path.exists(parameters["resultPath"]):
         os.makedirs(parameters["resultPath"])
 
-    # Store posterior in a dictionary
+    # The posteriors are written to a memory-mapped file for each modality
     parameters["staircaisePosteriors"] = {}
-    parameters["staircaisePosteriors"]["Intero"] = []
-    if exteroception is True:
-        parameters["staircaisePosteriors"]["Extero"] = []
-
-    nCatch = int(parameters["nTrials"] * catchTrials)
-    nStaircase = parameters["nTrials"] - nCatch
+    if posteriorDtype not in ["float64", "float32"]:
+        raise ValueError("posteriorDtype should be 'float64' or 'float32'")
+    parameters["posteriorDtype"] = posteriorDtype
 
-    # Vector encoding the staircase type
-    if stairType == "psi":
-        sc = np.array(["psi"] * nStaircase)
-    elif stairType == "updown":
-        sc = np.array(["updown"] * nStaircase)
-    else:
-        raise ValueError("stairType should be 'psi' or 'updown'")
-
-    # Create and randomize condition vectors separately for each staircase
-    if exteroception is True:
-        # Create a modality vector containing nTrials/2 Intero and Extero conditions
-        parameters["Modality"] = np.hstack(
-            [np.array(["Extero", "Intero"] * int(parameters["nTrials"] / 2))]
-        )
-    elif exteroception is False:
-        # Create a modality vector containing nTrials/2 Intero and Extero conditions
-        parameters["Modality"] = np.array(["Intero"] * int(parameters["nTrials"]))
-    else:
-        raise ValueError("exteroception should be a boolean")
-
-    # Vector encoding the type of trial (psi, up/down or catch)
-    parameters["staircaseType"] = np.hstack(
-        [
-            sc,
-            np.array(["CatchTrial"] * int((parameters["nTrials"] * catchTrials))),
-        ]
+    # Precompute the plan of the session (modality, staircase type, catch trial
+    # intensities, intervals, exteroceptive frequencies and breaks)
+    parameters["schedule"] = compileSchedule(
+        nTrials=parameters["nTrials"],
+        exteroception=exteroception,
+        catchTrials=catchTrials,
+        stairType=stairType,
+        nBreaking=nBreaking,
+        isi=parameters["isi"],
+        seed=seed,
     )
-
-    # Shuffle all trials
-    shuffler = np.random.permutation(parameters["nTrials"])
-    parameters["Modality"] = parameters["Modality"][shuffler]
-    parameters["staircaseType"] = parameters["staircaseType"][shuffler]
+    parameters["seed"] = parameters["schedule"].seed
+    parameters["Modality"] = parameters["schedule"].modality
+    parameters["staircaseType"] = parameters["schedule"].staircaseType
 
     # Default parameters for the basic staircase are set here. Please see
     # PsychoPy Staircase Handler Documentation for full options. By default,
@@ -291,6 +451,31 @@ def getParameters(
     # options in parameters dictionary), one is initalized 'high' and the other
     # 'low'.
     parameters["stairCase"] = {}
+    if psiDtype not in ["float64", "float32"]:
+        raise ValueError("psiDtype should be 'float64' or 'float32'")
+    parameters["psiDtype"] = psiDtype
+
+    # Modality of each trial chosen during the task to fit in the time budget
+    if timeBudget is None:
+        parameters["scheduler"] = None
+    else:
+        parameters["scheduler"] = SessionScheduler(
+            budget=timeBudget,
+            modalities=["Intero", "Extero"] if exteroception is True else ["Intero"],
+            clock=parameters["backend"].clock,
+        )
+
+    # Adaptive termination of the Psi staircases
+    if stoppingRule is None:
+        parameters["stoppingRule"] = None
+    elif stairType == "updown":
+        raise ValueError("The stopping rule requires a Psi staircase")
+    else:
+        parameters["stoppingRule"] = StoppingRule(stoppingRule)
+
+    # The PsychoPy staircases (the native Psi staircase does not need PsychoPy)
+    if stairType in ["psi", "updown"]:
+        from psychopy import data
 
     if stairType == "updown":
 
@@ -335,6 +520,23 @@ def getParameters(
             expectedMin=0,
         )
 
+    elif stairType == "nativePsi":
+
+        # The likelihood tables are computed once and shared by the two modalities
+        parameters["psiGrid"] = openPsiGrid(
+            intensRange=(-50.5, 50.5),
+            alphaRange=(-50.5, 50.5),
+            betaRange=(0.1, 25.0),
+            intensPrecision=1.0,
+            alphaPrecision=1.0,
+            betaPrecision=0.1,
+            delta=0.02,
+            dtype=parameters["psiDtype"],
+        )
+        parameters["stairCase"]["Intero"] = PsiStaircase(
+            nTrials=nTrials, grid=parameters["psiGrid"]
+        )
+
     if exteroception is True:
         if stairType == "updown":
 
@@ -379,12 +581,33 @@ def getParameters(
                 expectedMin=0,
             )
 
+        elif stairType == "nativePsi":
+
+            parameters["stairCase"]["Extero"] = PsiStaircase(
+                nTrials=nTrials, grid=parameters["psiGrid"]
+            )
+
+    # Only the last seconds of the PPG recording are kept in memory, the older
+    # samples are written to a binary file in the result folder
+    parameters["recordingWindow"] = recordingWindow
+    parameters["spillFile"] = os.path.join(
+        parameters["resultPath"], f"{participant}{session}_ppg.rec"
+    )
+
+    # Duration of the phases of the trials
+    parameters["traceFile"] = os.path.join(
+        parameters["resultPath"], f"{participant}{session}_trace.jsonl"
+    )
+
     parameters["setup"] = setup
     if setup == "behavioral":
         # PPG recording
         port = serial.Serial(serialPort)
-        parameters["oxiTask"] = Oximeter(
-            serial=port, sfreq=75, add_channels=1, **systole_kw
+        parameters["oxiTask"] = AcquisitionService(
+            Oximeter(serial=port, sfreq=75, add_channels=1, **systole_kw),
+            spillFile=parameters["spillFile"],
+            keepLength=parameters["recordingWindow"],
+            clock=parameters["backend"].clock,
         )
         parameters["oxiTask"].setup().read(duration=1)
         
@@ -392,10 +615,18 @@ def getParameters(
         # parameters['oxiTask'] = Nonin3231USB(serial=port, add_channels=1).setup().read(1)
 
     elif setup == "test":
-        # Use pre-recorded pulse time series for testing
-        port = serialSim()
-        parameters["oxiTask"] = Oximeter(
-            serial=port, sfreq=75, add_channels=1, **systole_kw
+        # Use pre-recorded pulse time series for testing, streamed at the pace of
+        # the session clock
+        port = (
+            SignalSerial(clock=parameters["backend"].clock)
+            if isinstance(serialPort, str)
+            else serialPort
+        )
+        parameters["oxiTask"] = AcquisitionService(
+            Oximeter(serial=port, sfreq=75, add_channels=1, **systole_kw),
+            spillFile=parameters["spillFile"],
+            keepLength=parameters["recordingWindow"],
+            clock=parameters["backend"].clock,
         )
         parameters["oxiTask"].setup().read(duration=1)
 
@@ -466,9 +697,461 @@ def getParameters(
     parameters["heartLogo"].size *= 0.04
     parameters["textSize"] = 0.04
     parameters["HRcutOff"] = [40, 120]
+    parameters["peakDetection"] = "streaming"
+    parameters["peakDetector"] = StreamingPeakDetector(sfreq=75)
+
+    # Load the stimulus sounds from the memory-mapped bank before the task starts
+    parameters["soundCacheSize"] = soundCacheSize
+    parameters["stimulusBank"] = openStimulusBank()
+    parameters["soundCache"] = SoundCache(
+        bpms=_unique(
+            np.concatenate(
+                [
+                    parameters["schedule"].bpms(),
+                    reachableBPMs(listenRange=(40.0, parameters["HRcutOff"][1])),
+                ]
+            )
+        ),
+        maxMemory=parameters["soundCacheSize"],
+        loader=parameters["stimulusBank"].loader,
+        soundType=parameters["backend"].sound.Sound,
+    )
     if parameters["device"] == "keyboard":
         parameters["confScale"] = [1, 10]
     elif parameters["device"] == "mouse":
         parameters["myMouse"] = event.Mouse()
 
+    # Create the visual stimuli used during the trials
+    parameters["stimuli"] = createStimuli(parameters)
+
     return parameters
+
+
+def createStimuli(parameters: dict) -> StimulusRegistry:
+    """Create the visual stimuli presented during the task.
+
+    Parameters
+    ----------
+    parameters : dict
+        Task parameters. Requires the window, the texts, the text size and the
+        response device.
+
+    Returns
+    -------
+    stimuli : :py:class:`cardioception.stimuli.StimulusRegistry`
+        The stimuli, indexed by role.
+    """
+    visual = getBackend(parameters).visual
+
+    texts, height = parameters["texts"], parameters["textSize"]
+    stimuli = StimulusRegistry(parameters["win"])
+
+    # Task start, breaks and end
+    stimuli.add(
+        "taskStart", visual.TextStim, height=height, text=texts["textTaskStart"]
+    )
+    stimuli.add(
+        "next", visual.TextStim, height=height, pos=(0.0, -0.4), text=texts["textNext"]
+    )
+    stimuli.add("breaks", visual.TextStim, height=height, text=texts["textBreaks"])
+    stimuli.add("progress", visual.TextStim, height=height, pos=(0.0, 0.2), text="")
+    stimuli.add(
+        "done", visual.TextStim, height=height, pos=(0.0, 0.0), text=texts["done"]
+    )
+    stimuli.add(
+        "fixation", visual.GratingStim, mask="cross", size=0.1, pos=[0, 0], sf=0
+    )
+
+    # Listening phase
+    stimuli.add(
+        "listenIntero",
+        visual.TextStim,
+        height=height,
+        pos=(0.0, 0.2),
+        text=texts["textHeartListening"],
+    )
+    stimuli.add(
+        "listenExtero",
+        visual.TextStim,
+        height=height,
+        pos=(0.0, 0.2),
+        text=texts["textToneListening"],
+    )
+    stimuli.add(
+        "checkOximeter",
+        visual.TextStim,
+        height=height,
+        text=texts["checkOximeter"],
+        color="red",
+    )
+    stimuli.add(
+        "stayStill",
+        visual.TextStim,
+        height=height,
+        text=texts["stayStill"],
+        color="red",
+    )
+
+    # Decision phase
+    for modality in ["Intero", "Extero"]:
+        stimuli.add(
+            f"decision{modality}",
+            visual.TextStim,
+            height=height,
+            pos=(0, 0.4),
+            text=texts["Decision"][modality],
+        )
+    stimuli.add(
+        "responseText",
+        visual.TextStim,
+        height=height,
+        text=texts["responseText"],
+        pos=(0.0, -0.4),
+    )
+    if parameters["device"] == "keyboard":
+        stimuli.add("tooLate", visual.TextStim, height=height, text=texts["tooLate"])
+        stimuli.add(
+            "incorrect", visual.TextStim, height=height, color="red", text="False"
+        )
+        stimuli.add(
+            "correct", visual.TextStim, height=height, color="green", text="Correct"
+        )
+    elif parameters["device"] == "mouse":
+        stimuli.add(
+            "tooLate",
+            visual.TextStim,
+            height=height,
+            text=texts["tooLate"],
+            color="red",
+            pos=(0.0, -0.2),
+        )
+        stimuli.add(
+            "incorrect",
+            visual.TextStim,
+            height=height,
+            pos=(0.0, -0.2),
+            color="red",
+            text=texts["incorrectResponse"],
+        )
+        stimuli.add(
+            "correct",
+            visual.TextStim,
+            height=height,
+            pos=(0.0, -0.2),
+            color="green",
+            text=texts["correctResponse"],
+        )
+        stimuli.add(
+            "slower",
+            visual.TextStim,
+            height=height,
+            color="white",
+            text=texts["slower"],
+            pos=(-0.2, 0.2),
+        )
+        stimuli.add(
+            "faster",
+            visual.TextStim,
+            height=height,
+            color="white",
+            text=texts["faster"],
+            pos=(0.2, 0.2),
+        )
+
+    # Confidence rating
+    if parameters["device"] == "keyboard":
+        stimuli.add(
+            "confidence", visual.TextStim, height=height, text=texts["Confidence"]
+        )
+        stimuli.add(
+            "ratingScale",
+            visual.RatingScale,
+            low=parameters["confScale"][0],
+            high=parameters["confScale"][1],
+            noMouse=True,
+            labels=parameters["labelsRating"],
+            acceptKeys="down",
+            markerStart=parameters["confScale"][0],
+        )
+    elif parameters["device"] == "mouse":
+        stimuli.add(
+            "confidence",
+            visual.TextStim,
+            height=height,
+            pos=(0, 0.2),
+            text=texts["Confidence"],
+        )
+        stimuli.add(
+            "slider",
+            visual.Slider,
+            name="slider",
+            pos=(0, -0.2),
+            size=(0.7, 0.1),
+            labels=texts["VASlabels"],
+            granularity=1,
+            ticks=(0, 100),
+            style=("rating"),
+            color="LightGray",
+            flip=False,
+            labelHeight=0.1 * 0.6,
+        )
+        stimuli.get("slider").marker.size = (0.03, 0.03)
+
+    return stimuli.build()
+
+
+# Intensities of the catch trials, used in turn for each modality
+CATCH_ALPHAS = np.array([-30.0, 10.0, -20.0, 20.0, -10.0, 30.0])
+
+
+class TrialSchedule:
+    """The plan of every trial of a session, computed before the first trial.
+
+    Each attribute is a read-only array with one value per trial, so the task loop
+    only has to index the plan and the stimuli needed by the upcoming trials are
+    known in advance.
+
+    Parameters
+    ----------
+    seed : int
+        The seed of the random generator used to create the plan.
+    modality : np.ndarray
+        The modality of each trial (`"Intero"` or `"Extero"`).
+    staircaseType : np.ndarray
+        The staircase used in each trial (`"psi"`, `"updown"`, `"CatchTrial"`), or
+        the tutorial block (`"Feedback"` or `"Confidence"`).
+    alpha : np.ndarray
+        The intensity of the catch and tutorial trials (BPM). `NaN` when the
+        intensity is given by the staircase.
+    isi : np.ndarray
+        The interval between the fixation cross and the listening phase (seconds).
+    exteroBPM : np.ndarray
+        The frequency of the tones presented during the listening phase of the
+        exteroceptive trials (BPM). `NaN` for the interoceptive trials.
+    isBreak : np.ndarray
+        Boolean vector indicating the trials followed by a break.
+
+    """
+
+    def __init__(
+        self,
+        seed: int,
+        modality: np.ndarray,
+        staircaseType: np.ndarray,
+        alpha: np.ndarray,
+        isi: np.ndarray,
+        exteroBPM: np.ndarray,
+        isBreak: np.ndarray,
+    ):
+        self.seed = seed
+        self.modality = _readOnly(modality)
+        self.staircaseType = _readOnly(staircaseType)
+        self.alpha = _readOnly(alpha)
+        self.isi = _readOnly(isi)
+        self.exteroBPM = _readOnly(exteroBPM)
+        self.isBreak = _readOnly(isBreak)
+
+    def __len__(self) -> int:
+        return len(self.modality)
+
+    def trials(
+        self, modality: Optional[str] = None, staircaseType: Optional[str] = None
+    ) -> np.ndarray:
+        """The indexes of the trials matching a modality and a staircase type."""
+        mask: np.ndarray = np.ones(len(self), dtype=bool)
+        if modality is not None:
+            mask &= self.modality == modality
+        if staircaseType is not None:
+            mask &= self.staircaseType == staircaseType
+
+        return np.flatnonzero(mask)
+
+    def bpms(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """The stimulus frequencies known in advance for a range of trials.
+
+        These are the listening frequencies of the exteroceptive trials and, when
+        the intensity does not depend on the staircase, the response frequencies.
+
+        Parameters
+        ----------
+        start, stop : int
+            The range of trials. Defaults to all the trials.
+
+        Returns
+        -------
+        bpms : np.ndarray
+            The frequencies (BPM), in the order of the trials, without duplicates.
+        """
+        exteroBPM = self.exteroBPM[start:stop]
+        response = np.clip(exteroBPM + self.alpha[start:stop], 15.0, 199.0)
+        bpms = np.column_stack([exteroBPM, response]).ravel()
+
+        return _unique(bpms[~np.isnan(bpms)])
+
+
+def _unique(bpms: np.ndarray) -> np.ndarray:
+    """Remove the duplicated frequencies, keeping the first occurrences."""
+    _, first = np.unique(bpms, return_index=True)
+
+    return bpms[np.sort(first)]
+
+
+def _readOnly(array: np.ndarray) -> np.ndarray:
+    array = np.array(array)
+    array.setflags(write=False)
+
+    return array
+
+
+def compileSchedule(
+    nTrials: int = 120,
+    exteroception: bool = True,
+    catchTrials: float = 0.0,
+    stairType: str = "psi",
+    nBreaking: int = 20,
+    isi: Tuple[float, float] = (0.25, 0.25),
+    seed: Optional[int] = None,
+) -> TrialSchedule:
+    """Create the plan of all the trials of the Heart Rate Discrimination task.
+
+    The modalities and trial types are shuffled, and the intervals and exteroceptive
+    frequencies are drawn from a generator initialized with `seed`, so the same
+    session can be generated again from the seed. The catch trials use the
+    intensities in :py:data:`CATCH_ALPHAS` in turn, separately for each modality.
+
+    Parameters
+    ----------
+    nTrials : int
+        The total number of trials.
+    exteroception : bool
+        If `True`, half of the trials are exteroceptive.
+    catchTrials : float
+        Ratio of catch trials.
+    stairType : str
+        Staircase type. Can be `"psi"`, `"nativePsi"` or `"updown"`.
+    nBreaking : int
+        Number of trials to run before the break.
+    isi : tuple
+        Lower and upper bounds of the inter stimulus interval (seconds).
+    seed : int | None
+        The random seed. If `None`, a new seed is drawn from the operating system and
+        stored in the schedule.
+
+    Returns
+    -------
+    schedule : :py:class:`TrialSchedule`
+        The session plan.
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(2)[0])
+
+    nCatch = int(nTrials * catchTrials)
+    nStaircase = nTrials - nCatch
+
+    # Vector encoding the staircase type
+    if stairType in ["psi", "nativePsi"]:
+        sc = np.array(["psi"] * nStaircase)
+    elif stairType == "updown":
+        sc = np.array(["updown"] * nStaircase)
+    else:
+        raise ValueError("stairType should be 'psi', 'nativePsi' or 'updown'")
+
+    # Create a modality vector containing nTrials/2 Intero and Extero conditions
+    if exteroception is True:
+        modality = np.array(["Extero", "Intero"] * int(nTrials / 2))
+    elif exteroception is False:
+        modality = np.array(["Intero"] * int(nTrials))
+    else:
+        raise ValueError("exteroception should be a boolean")
+
+    # Vector encoding the type of trial (psi, up/down or catch), shuffle all trials
+    staircaseType = np.hstack([sc, np.array(["CatchTrial"] * nCatch)])
+    shuffler = rng.permutation(nTrials)
+    modality, staircaseType = modality[shuffler], staircaseType[shuffler]
+
+    # The catch trials of each modality use the catch intensities in turn
+    alpha = np.full(nTrials, np.nan)
+    for mod in np.unique(modality):
+        catch = np.flatnonzero((modality == mod) & (staircaseType == "CatchTrial"))
+        alpha[catch] = CATCH_ALPHAS[np.arange(len(catch)) % len(CATCH_ALPHAS)]
+
+    exteroBPM = rng.choice(np.arange(40, 100, 0.5), size=nTrials)
+    exteroBPM[modality != "Extero"] = np.nan
+    trials = np.arange(nTrials)
+
+    return TrialSchedule(
+        seed=seed,
+        modality=modality,
+        staircaseType=staircaseType,
+        alpha=alpha,
+        isi=rng.uniform(isi[0], isi[1], size=nTrials),
+        exteroBPM=exteroBPM,
+        isBreak=(trials % nBreaking == 0) & (trials != 0),
+    )
+
+
+def compileTutorial(
+    nFeedback: int = 5,
+    nConfidence: int = 8,
+    exteroception: bool = True,
+    isi: Tuple[float, float] = (0.25, 0.25),
+    seed: Optional[int] = None,
+) -> TrialSchedule:
+    """Create the plan of the tutorial trials.
+
+    The tutorial runs `nFeedback` trials with feedback (intensity of +/- 20 BPM) and
+    `nConfidence` trials with confidence rating (intensity of +/- 1, 10 or 30 BPM)
+    for the interoceptive condition, and for the exteroceptive condition if
+    `exteroception` is `True`.
+
+    Parameters
+    ----------
+    nFeedback : int
+        The number of trials with feedback in each modality.
+    nConfidence : int
+        The number of trials with confidence rating in each modality.
+    exteroception : bool
+        If `True`, add the exteroceptive tutorial trials.
+    isi : tuple
+        Lower and upper bounds of the inter stimulus interval (seconds).
+    seed : int | None
+        The random seed, usually the one of the main schedule (the tutorial uses an
+        independent random stream).
+
+    Returns
+    -------
+    schedule : :py:class:`TrialSchedule`
+        The tutorial plan, in the order of presentation.
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(2)[1])
+
+    modalities = ["Intero", "Extero"] if exteroception is True else ["Intero"]
+    modality = np.array(
+        [m for m in modalities for _ in range(nFeedback)]
+        + [m for m in modalities for _ in range(nConfidence)]
+    )
+    staircaseType = np.array(
+        ["Feedback"] * (nFeedback * len(modalities))
+        + ["Confidence"] * (nConfidence * len(modalities))
+    )
+    n = len(modality)
+
+    sign = rng.choice([-1.0, 1.0], size=n)
+    intensity = np.where(
+        staircaseType == "Feedback", 20.0, rng.choice([1.0, 10.0, 30.0], size=n)
+    )
+    exteroBPM = rng.choice(np.arange(40, 100, 0.5), size=n)
+    exteroBPM[modality != "Extero"] = np.nan
+
+    return TrialSchedule(
+        seed=seed,
+        modality=modality,
+        staircaseType=staircaseType,
+        alpha=sign * intensity,
+        isi=rng.uniform(isi[0], isi[1], size=n),
+        exteroBPM=exteroBPM,
+        isBreak=np.zeros(n, dtype=bool),
+    )
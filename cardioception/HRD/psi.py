@@ -0,0 +1,581 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+from cardioception.storage import cacheDir
+
+
+def _grid(bounds: Tuple[float, float], precision: float) -> np.ndarray:
+    """Linear grid, built the same way as in :py:class:`psychopy.data.PsiHandler`."""
+    return np.linspace(
+        bounds[0], bounds[1], int(round((bounds[1] - bounds[0]) / precision) + 1)
+    )
+
+
+class PsiGrid:
+    """The likelihood tables of the Psi staircase, shared read-only between staircases.
+
+    The tables only depend on the grids of intensities, thresholds and slopes, on the
+    lapse rate and on the data type. The same instance can be used by several
+    :py:class:`PsiStaircase` (e.g. the interoceptive and exteroceptive conditions).
+    If `fileName` is provided, the tables are written to this file the first time
+    and memory-mapped from it afterward, so they are computed once across sessions
+    (see :py:func:`openPsiGrid`).
+
+    Parameters
+    ----------
+    intensRange, alphaRange, betaRange : tuple
+        Lower and upper bounds of the intensities, thresholds and slopes. Default to
+        `(-50.5, 50.5)`, `(-50.5, 50.5)` and `(0.1, 25.0)`.
+    intensPrecision, alphaPrecision, betaPrecision : float
+        The step of each grid. Default to `1.0`, `1.0` and `0.1`.
+    delta : float
+        The lapse rate. Defaults to `0.02`.
+    dtype : str
+        The data type of the tables. Defaults to `"float64"`.
+    fileName : str | None
+        Path to the `.npy` file caching the tables. If `None` (default), the tables
+        are only computed in memory.
+
+    Attributes
+    ----------
+    likelihood : np.ndarray
+        The probability of a positive response for each threshold and slope
+        (flattened in the first dimension) and each intensity.
+    negEntropy : np.ndarray
+        The sum over the responses of :math:`p(r|\\lambda, x) \\log p(r|\\lambda,
+        x)`, with the same layout.
+
+    """
+
+    def __init__(
+        self,
+        intensRange: Tuple[float, float] = (-50.5, 50.5),
+        alphaRange: Tuple[float, float] = (-50.5, 50.5),
+        betaRange: Tuple[float, float] = (0.1, 25.0),
+        intensPrecision: float = 1.0,
+        alphaPrecision: float = 1.0,
+        betaPrecision: float = 0.1,
+        delta: float = 0.02,
+        dtype: str = "float64",
+        fileName: Optional[str] = None,
+    ):
+        self.delta = delta
+        self.dtype = np.dtype(dtype)
+        self.x = _grid(intensRange, intensPrecision)
+        self.alpha = _grid(alphaRange, alphaPrecision)
+        self.beta = _grid(betaRange, betaPrecision)
+        self.fileName = fileName
+        shape = (2, len(self.alpha) * len(self.beta), len(self.x))
+
+        tables: Optional[np.ndarray] = None
+        if (fileName is not None) and os.path.exists(fileName):
+            tables = np.load(fileName, mmap_mode="r").view(np.ndarray)
+            if (tables.shape != shape) or (tables.dtype != self.dtype):
+                tables = None  # Incomplete or stale file, computed again
+        if tables is None:
+            tables = self._compute()
+            if fileName is not None:
+                tmpName = fileName + ".tmp"
+                with open(tmpName, "wb") as f:
+                    np.save(f, tables)
+                os.replace(tmpName, fileName)
+                tables = np.load(fileName, mmap_mode="r").view(np.ndarray)
+            else:
+                tables.flags.writeable = False
+        self.likelihood, self.negEntropy = tables[0], tables[1]
+
+    def _compute(self) -> np.ndarray:
+        """Compute the likelihood and entropy tables."""
+        # P(r = 1 | alpha, beta, x) and sum over r of P(r | ...) * log(P(r | ...)),
+        # with the threshold and slope flattened in the first dimension
+        z = (self.x[None, None, :] - self.alpha[:, None, None]) / self.beta[
+            None, :, None
+        ]
+        p = ndtr(z) * (1 - self.delta) + self.delta / 2
+        p = p.reshape(-1, len(self.x))
+        tables = np.empty((2,) + p.shape, dtype=self.dtype)
+        tables[0] = p
+        tables[1] = p * np.log(p) + (1 - p) * np.log(1 - p)
+
+        return tables
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the tables (bytes)."""
+        return self.likelihood.nbytes + self.negEntropy.nbytes
+
+
+def openPsiGrid(**kwargs) -> PsiGrid:
+    """Load the Psi tables from the cache directory, computing them if needed.
+
+    The cache file is named after a hash of the grid parameters, so each set of
+    parameters has its own file in :py:func:`cardioception.storage.cacheDir`.
+
+    Parameters
+    ----------
+    kwargs :
+        The grid parameters (see :py:class:`PsiGrid`).
+
+    Returns
+    -------
+    grid : :py:class:`PsiGrid`
+        The grid, with the tables memory-mapped from the cache file.
+
+    Examples
+    --------
+    >>> grid = openPsiGrid(dtype="float32")
+    >>> intero = PsiStaircase(nTrials=30, grid=grid)
+    >>> extero = PsiStaircase(nTrials=30, grid=grid)
+
+    """
+    arguments = inspect.signature(PsiGrid).bind(**kwargs)
+    arguments.apply_defaults()
+    key = {k: v for k, v in arguments.arguments.items() if k != "fileName"}
+    key["dtype"] = np.dtype(key["dtype"]).name
+    key = {k: list(v) if isinstance(v, tuple) else v for k, v in key.items()}
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+    return PsiGrid(fileName=os.path.join(cacheDir(), f"HRD_psi_{digest}.npy"), **kwargs)
+
+
+class PsiStaircase:
+    """Psi adaptive staircase (Kontsevich & Tyler, 1999) for Yes/No responses.
+
+    This is a drop-in replacement for :py:class:`psychopy.data.PsiHandler` (with
+    `expectedMin=0` and `stepType="lin"`) designed to keep the update time short
+    between two trials. The likelihood of a positive response given each threshold,
+    slope and intensity (a cumulative normal with lapse rate `delta`) and the
+    Bernoulli entropy terms are computed once when the staircase is created, or read
+    from a :py:class:`PsiGrid` shared with other staircases. Each update then only requires two matrix-vector products over the posterior:
+
+    * the probability of a positive response at each intensity,
+    * the expected entropy of the posterior, using
+      :math:`E[H](x) = H(\\lambda) - \\sum_\\lambda p(\\lambda) \\sum_r
+      p(r|\\lambda, x) \\log p(r|\\lambda, x) + \\sum_r p(r|x) \\log p(r|x)`, so the
+      posterior does not need to be computed for every intensity and response.
+
+    As in PsychoPy, the posterior is updated using the intensity proposed by the
+    staircase. An `intensity` passed to :py:meth:`addResponse` is only recorded.
+
+    Parameters
+    ----------
+    nTrials : int
+        The number of trials.
+    intensRange, alphaRange, betaRange : tuple
+        Lower and upper bounds of the intensities, thresholds and slopes. Default to
+        `(-50.5, 50.5)`, `(-50.5, 50.5)` and `(0.1, 25.0)`.
+    intensPrecision, alphaPrecision, betaPrecision : float
+        The step of each grid. Default to `1.0`, `1.0` and `0.1`.
+    delta : float
+        The lapse rate. Defaults to `0.02`.
+    dtype : str
+        The data type of the likelihood tables and of the posterior. Use
+        `"float32"` to halve the memory usage and speed up the updates. Defaults to
+        `"float64"`.
+    grid : :py:class:`PsiGrid` | None
+        Precomputed tables (e.g. from :py:func:`openPsiGrid`). If provided, the
+        grid parameters above are ignored and the tables are not copied.
+
+    Attributes
+    ----------
+    intensities : list
+        The intensities presented so far.
+    data : list
+        The responses recorded so far.
+    finished : bool
+        `True` when `nTrials` intensities have been presented.
+
+    Examples
+    --------
+    >>> stairCase = PsiStaircase(nTrials=60, dtype="float32")
+    >>> alpha = stairCase.next()
+    >>> stairCase.addResponse(1)
+    >>> threshold, slope = stairCase.estimateLambda()
+
+    """
+
+    def __init__(
+        self,
+        nTrials: int,
+        intensRange: Tuple[float, float] = (-50.5, 50.5),
+        alphaRange: Tuple[float, float] = (-50.5, 50.5),
+        betaRange: Tuple[float, float] = (0.1, 25.0),
+        intensPrecision: float = 1.0,
+        alphaPrecision: float = 1.0,
+        betaPrecision: float = 0.1,
+        delta: float = 0.02,
+        dtype: str = "float64",
+        grid: Optional[PsiGrid] = None,
+    ):
+        if grid is None:
+            grid = PsiGrid(
+                intensRange,
+                alphaRange,
+                betaRange,
+                intensPrecision,
+                alphaPrecision,
+                betaPrecision,
+                delta=delta,
+                dtype=dtype,
+            )
+        self.grid = grid
+        self.nTrials = nTrials
+        self.delta = grid.delta
+        self.dtype = grid.dtype
+        self.x, self.alpha, self.beta = grid.x, grid.alpha, grid.beta
+        self._likelihood = grid.likelihood
+        self._negEntropy = grid.negEntropy
+
+        self._posterior: np.ndarray = np.full(
+            len(self.alpha) * len(self.beta),
+            1 / (len(self.alpha) * len(self.beta)),
+            dtype=self.dtype,
+        )
+        self.intensities: List[float] = []
+        self.data: List[int] = []
+        self.thisTrialN = -1
+        self.finished = False
+        self._update()
+
+    def _update(self):
+        """Find the intensity minimizing the expected entropy of the posterior."""
+        pPositive = np.clip(self._posterior @ self._likelihood, 1e-12, 1 - 1e-12)
+        expectedEntropy = (
+            pPositive * np.log(pPositive)
+            + (1 - pPositive) * np.log(1 - pPositive)
+            - self._posterior @ self._negEntropy
+        )
+        # The first minimum wins in case of tie (e.g. on the first trial, where the
+        # expected entropy is symmetric), as in PsychoPy
+        tolerance = 16 * np.finfo(self.dtype).eps * np.abs(expectedEntropy).max()
+        self.nextIntensityIndex = int(
+            np.flatnonzero(expectedEntropy <= expectedEntropy.min() + tolerance)[0]
+        )
+        self.nextIntensity = float(self.x[self.nextIntensityIndex])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> float:
+        """Advance to the next trial and return the intensity."""
+        self.finished = len(self.intensities) >= self.nTrials
+        if self.finished:
+            raise StopIteration
+        self.thisTrialN += 1
+        self.intensities.append(self.nextIntensity)
+
+        return self.nextIntensity
+
+    next = __next__
+
+    def addResponse(self, result: int, intensity: Optional[float] = None):
+        """Update the posterior with a new response.
+
+        Parameters
+        ----------
+        result : int
+            `1` for a positive response (e.g. `"More"`), `0` otherwise.
+        intensity : float | None
+            If provided, replace the last recorded intensity. This value is not
+            used to update the posterior (see :py:class:`psychopy.data.PsiHandler`).
+        """
+        self.data.append(result)
+        if intensity is not None:
+            self.intensities[-1] = intensity
+
+        likelihood = self._likelihood[:, self.nextIntensityIndex]
+        if not result:
+            likelihood = 1 - likelihood
+        self._posterior *= likelihood
+        self._posterior /= self._posterior.sum()
+        self._update()
+
+        return self
+
+    @property
+    def posterior(self) -> np.ndarray:
+        """The posterior distribution over thresholds (rows) and slopes (columns)."""
+        return self._posterior.reshape(len(self.alpha), len(self.beta))
+
+    def estimateLambda(self) -> Tuple[float, float]:
+        """The posterior mean of the threshold and of the slope."""
+        posterior: np.ndarray = self.posterior.astype(float)
+
+        return (
+            float(self.alpha @ posterior.sum(axis=1)),
+            float(self.beta @ posterior.sum(axis=0)),
+        )
+
+    def estimateThreshold(
+        self, thresh: float, lamb: Optional[Tuple[float, float]] = None
+    ) -> float:
+        """The intensity for which the probability of a positive response is `thresh`.
+
+        Parameters
+        ----------
+        thresh : float
+            The response probability.
+        lamb : tuple | None
+            The threshold and slope. Defaults to :py:meth:`estimateLambda`.
+        """
+        alpha, beta = self.estimateLambda() if lamb is None else lamb
+
+        return float(alpha + beta * ndtri((thresh - self.delta / 2) / (1 - self.delta)))
+
+
+def posterior(stairCase) -> np.ndarray:
+    """The current posterior distribution of a Psi staircase.
+
+    Parameters
+    ----------
+    stairCase : :py:class:`PsiStaircase` | :py:class:`psychopy.data.PsiHandler`
+        The staircase.
+
+    Returns
+    -------
+    posterior : np.ndarray
+        The (2d) posterior distribution over the alpha and beta parameters.
+    """
+    if isinstance(stairCase, PsiStaircase):
+        return stairCase.posterior
+
+    return stairCase._psi._probLambda[0, :, :, 0]
+
+
+def posteriorEntropy(stairCase) -> float:
+    """The entropy of the posterior distribution of a Psi staircase (bits).
+
+    Parameters
+    ----------
+    stairCase : :py:class:`PsiStaircase` | :py:class:`psychopy.data.PsiHandler`
+        The staircase.
+    """
+    return _entropy(posterior(stairCase).astype(float).ravel())
+
+
+def _entropy(p: np.ndarray) -> float:
+    """Entropy (bits) of a probability vector."""
+    p = p[p > 0]
+
+    return float(-np.sum(p * np.log2(p)))
+
+
+def expectedInformationGain(stairCase) -> float:
+    """The expected reduction of the posterior entropy after the next trial (bits).
+
+    The gain is computed for the intensity that will be presented next, averaging
+    over the two possible responses.
+
+    Parameters
+    ----------
+    stairCase : :py:class:`PsiStaircase` | :py:class:`psychopy.data.PsiHandler`
+        The staircase.
+    """
+    p: np.ndarray = posterior(stairCase).astype(float).ravel()
+    if isinstance(stairCase, PsiStaircase):
+        likelihood = stairCase._likelihood[:, stairCase.nextIntensityIndex]
+    else:
+        likelihood = stairCase._psi._probResponseGivenLambdaX[
+            1, :, :, stairCase._psi.nextIntensityIndex
+        ]
+    likelihood = np.asarray(likelihood, dtype=float).ravel()
+    pPositive = float(p @ likelihood)
+    expected = 0.0
+    for pResponse, update in [
+        (pPositive, p * likelihood),
+        (1 - pPositive, p * (1 - likelihood)),
+    ]:
+        if pResponse > 0:
+            expected += pResponse * _entropy(update / update.sum())
+
+    return _entropy(p) - expected
+
+
+def thresholdInterval(stairCase, level: float = 0.95) -> float:
+    """The width of the credible interval of the threshold (BPM).
+
+    Parameters
+    ----------
+    stairCase : :py:class:`PsiStaircase` | :py:class:`psychopy.data.PsiHandler`
+        The staircase.
+    level : float
+        The probability mass of the interval. Defaults to `0.95`.
+    """
+    alpha = (
+        stairCase.alpha if isinstance(stairCase, PsiStaircase) else stairCase._psi.alpha
+    )
+    cumulative = np.cumsum(posterior(stairCase).astype(float).sum(axis=1))
+    cumulative /= cumulative[-1]
+    lower = int(np.searchsorted(cumulative, (1 - level) / 2))
+    upper = int(np.searchsorted(cumulative, (1 + level) / 2))
+
+    return float(alpha[min(upper, len(alpha) - 1)] - alpha[lower])
+
+
+class StoppingRule:
+    """Retire a Psi staircase once the posterior is precise enough.
+
+    Parameters
+    ----------
+    criterion : str
+        `"credibleInterval"` (default) to use the width of the credible interval of
+        the threshold (see :py:func:`thresholdInterval`), or `"entropy"` to use the
+        entropy of the posterior (see :py:func:`posteriorEntropy`).
+    target : float | None
+        The staircase is retired when the criterion is below this value. Defaults to
+        `10.0` BPM for `"credibleInterval"` and `10.0` bits for `"entropy"`.
+    minTrials : int
+        The minimum number of Psi trials before the staircase can be retired.
+        Defaults to `20`.
+    maxTrials : int | None
+        The staircase is retired after this number of Psi trials, whatever the
+        criterion. If `None` (default), there is no limit other than the number of
+        trials of the session.
+    level : float
+        The probability mass of the credible interval. Defaults to `0.95`.
+
+    Examples
+    --------
+    >>> rule = StoppingRule("credibleInterval", target=8.0, minTrials=30)
+    >>> rule.isDone(stairCase, nTrials=35)
+    False
+
+    """
+
+    def __init__(
+        self,
+        criterion: str = "credibleInterval",
+        target: Optional[float] = None,
+        minTrials: int = 20,
+        maxTrials: Optional[int] = None,
+        level: float = 0.95,
+    ):
+        if criterion not in ["credibleInterval", "entropy"]:
+            raise ValueError("criterion should be 'credibleInterval' or 'entropy'")
+        self.criterion = criterion
+        self.target = 10.0 if target is None else target
+        self.minTrials = minTrials
+        self.maxTrials = maxTrials
+        self.level = level
+
+    def measure(self, stairCase) -> float:
+        """The current value of the criterion for this staircase."""
+        if self.criterion == "entropy":
+            return posteriorEntropy(stairCase)
+
+        return thresholdInterval(stairCase, level=self.level)
+
+    def isDone(self, stairCase, nTrials: int) -> bool:
+        """Whether the staircase should be retired.
+
+        Parameters
+        ----------
+        stairCase : :py:class:`PsiStaircase` | :py:class:`psychopy.data.PsiHandler`
+            The staircase.
+        nTrials : int
+            The number of Psi trials completed with this staircase.
+        """
+        if (self.maxTrials is not None) and (nTrials >= self.maxTrials):
+            return True
+        if nTrials < self.minTrials:
+            return False
+
+        return self.measure(stairCase) <= self.target
+
+
+class StaircaseWorker:
+    """Run the staircase updates in a background thread.
+
+    The update of the staircase (posterior, estimates and search of the next
+    intensity) can start as soon as the decision is known, and run while the
+    participant rates their confidence. The result is collected at the end of the
+    trial, usually without waiting. The updates are run in order, one at a time.
+
+    Attributes
+    ----------
+    timing : list of dict
+        For each update, the time spent computing it (`"duration"`), the time the
+        task waited for the result (`"wait"`) and the difference, i.e. the latency
+        hidden behind the rating phase (`"hidden"`), in seconds.
+
+    Examples
+    --------
+    >>> worker = StaircaseWorker()
+    >>> worker.submit(stairCase.addResponse, 1)  # When the decision is known
+    >>> # ... confidence rating ...
+    >>> worker.result()  # Before the next call to stairCase.next()
+    >>> worker.close()
+
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="StaircaseWorker"
+        )
+        self._pending: Optional[Future] = None
+        self.timing: List[Dict[str, float]] = []
+
+    @property
+    def pending(self) -> bool:
+        """`True` if an update was submitted and its result not collected yet."""
+        return self._pending is not None
+
+    def submit(self, update: Callable, *args, **kwargs):
+        """Start an update in the background.
+
+        Parameters
+        ----------
+        update : callable
+            The function updating the staircase, called with `args` and `kwargs`.
+        """
+        if self._pending is not None:
+            self.result()
+
+        def timedUpdate():
+            start = time.perf_counter()
+            output = update(*args, **kwargs)
+            return output, time.perf_counter() - start
+
+        self._pending = self._executor.submit(timedUpdate)
+
+        return self
+
+    def result(self) -> Any:
+        """Wait for the pending update and return its output."""
+        if self._pending is None:
+            raise RuntimeError("No staircase update was submitted.")
+        start = time.perf_counter()
+        output, duration = self._pending.result()
+        wait = time.perf_counter() - start
+        self._pending = None
+        self.timing.append(
+            {"duration": duration, "wait": wait, "hidden": max(duration - wait, 0.0)}
+        )
+
+        return output
+
+    def summary(self) -> Dict[str, float]:
+        """Total update, waiting and hidden times (seconds) over all the updates."""
+        return {
+            "updates": len(self.timing),
+            "duration": sum(t["duration"] for t in self.timing),
+            "wait": sum(t["wait"] for t in self.timing),
+            "hidden": sum(t["hidden"] for t in self.timing),
+        }
+
+    def close(self):
+        """Wait for the pending update and stop the thread."""
+        self._executor.shutdown(wait=True)
+
+        return self
@@ -0,0 +1,202 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Columns of the behavioral results data frame as (name, dtype, record field). The
+# record field is the name of the :py:class:`TrialRecord` attribute filling this
+# column, or `None` if the value is provided by the task loop.
+HRD_COLUMNS: List[Tuple[str, Any, Optional[str]]] = [
+    ("TrialType", object, None),
+    ("Condition", object, "condition"),
+    ("Modality", object, None),
+    ("StairCond", object, None),
+    ("Decision", object, "decision"),
+    ("DecisionRT", float, "decisionRT"),
+    ("Confidence", float, "confidence"),
+    ("ConfidenceRT", float, "confidenceRT"),
+    ("Alpha", float, "alpha"),
+    ("listenBPM", float, "listenBPM"),
+    ("responseBPM", float, "responseBPM"),
+    ("ResponseCorrect", object, "isCorrect"),
+    ("DecisionProvided", bool, "respProvided"),
+    ("RatingProvided", bool, "ratingProvided"),
+    ("nTrials", int, None),
+    ("EstimatedThreshold", float, None),
+    ("EstimatedSlope", float, None),
+    ("PosteriorEntropy", float, None),
+    ("ThresholdInterval", float, None),
+    ("Retired", bool, None),
+    ("StartListening", float, "startTrigger"),
+    ("StartDecision", float, "soundTrigger"),
+    ("ResponseMade", float, "responseMadeTrigger"),
+    ("RatingStart", float, "ratingStartTrigger"),
+    ("RatingEnds", float, "ratingEndTrigger"),
+    ("endTrigger", float, "endTrigger"),
+    ("StimuliCreated", int, None),
+    ("DecisionDroppedFrames", float, None),
+    ("RatingDroppedFrames", float, None),
+    ("FrameJitter", float, None),
+    ("MaxFrameInterval", float, None),
+]
+
+
+class TrialRecord:
+    """Outcome of one trial of the Heart Rate Discrimination task.
+
+    The attributes are described in :py:func:`cardioception.HRD.task.trial`. Iterating
+    over a record yields the attributes in the order of the tuple previously returned
+    by :py:func:`cardioception.HRD.task.trial`, so that existing code unpacking the
+    trial outputs keeps working.
+
+    """
+
+    __slots__ = (
+        "condition",
+        "listenBPM",
+        "responseBPM",
+        "decision",
+        "decisionRT",
+        "confidence",
+        "confidenceRT",
+        "alpha",
+        "isCorrect",
+        "respProvided",
+        "ratingProvided",
+        "startTrigger",
+        "soundTrigger",
+        "responseMadeTrigger",
+        "ratingStartTrigger",
+        "ratingEndTrigger",
+        "endTrigger",
+    )
+
+    condition: str
+    listenBPM: float
+    responseBPM: float
+    decision: Optional[str]
+    decisionRT: Optional[float]
+    confidence: Optional[float]
+    confidenceRT: Optional[float]
+    alpha: float
+    isCorrect: Optional[bool]
+    respProvided: bool
+    ratingProvided: bool
+    startTrigger: float
+    soundTrigger: float
+    responseMadeTrigger: float
+    ratingStartTrigger: Optional[float]
+    ratingEndTrigger: Optional[float]
+    endTrigger: float
+
+    def __init__(self, **kwargs):
+        for field in self.__slots__:
+            setattr(self, field, kwargs.pop(field, None))
+        if kwargs:
+            raise TypeError(f"Invalid trial record fields: {list(kwargs)}")
+
+    def __iter__(self) -> Iterator:
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"TrialRecord({fields})"
+
+
+class TrialBuffer:
+    """Preallocated columnar storage for the trial-level results.
+
+    One NumPy array is allocated per column when the session starts, and each trial
+    is written in place. The :py:class:`pandas.DataFrame` is only built when
+    requested (e.g. for saving or reporting).
+
+    Parameters
+    ----------
+    columns : list
+        The columns as a list of `(name, dtype, record field)` tuples (see
+        `HRD_COLUMNS`).
+    size : int
+        The expected number of trials. The buffer grows if more trials are added.
+
+    """
+
+    def __init__(self, columns: List[Tuple[str, Any, Optional[str]]], size: int):
+        self.columns = columns
+        self.n = 0
+        self.data: Dict[str, np.ndarray] = {
+            name: self._empty(dtype, max(size, 1)) for name, dtype, _ in columns
+        }
+        self._df: Optional[pd.DataFrame] = None
+
+    def __len__(self) -> int:
+        return self.n
+
+    @staticmethod
+    def _empty(dtype, size: int) -> np.ndarray:
+        if dtype is float:
+            return np.full(size, np.nan)
+        elif dtype is object:
+            return np.full(size, None, dtype=object)
+        return np.zeros(size, dtype=dtype)
+
+    def _grow(self):
+        for name, dtype, _ in self.columns:
+            new = self._empty(dtype, 2 * len(self.data[name]))
+            new[: self.n] = self.data[name][: self.n]
+            self.data[name] = new
+
+    def add(self, record: Optional[TrialRecord] = None, **values) -> int:
+        """Write a new trial in the buffer.
+
+        Parameters
+        ----------
+        record : :py:class:`TrialRecord` | None
+            The trial outputs.
+        values : dict
+            Values for the columns that are not filled by the record.
+
+        Returns
+        -------
+        idx : int
+            The index of the new row.
+        """
+        if self.n >= len(self.data[self.columns[0][0]]):
+            self._grow()
+        idx = self.n
+        for name, dtype, field in self.columns:
+            if name in values:
+                value = values[name]
+            elif (record is not None) and (field is not None):
+                value = getattr(record, field)
+            else:
+                continue
+            if value is None and dtype is not object:
+                continue
+            self.data[name][idx] = value
+        self.n += 1
+        self._df = None
+
+        return idx
+
+    def row(self, idx: int) -> Dict[str, Any]:
+        """Return one row as a dictionary of Python scalars (`None` for missing)."""
+        row: Dict[str, Any] = {}
+        for name, dtype, _ in self.columns:
+            value: Any = self.data[name][idx]
+            if dtype is not object:
+                value = value.item()
+                if dtype is float and np.isnan(value):
+                    value = None
+            row[name] = value
+        return row
+
+    def toDataFrame(self) -> pd.DataFrame:
+        """The trials recorded so far as a :py:class:`pandas.DataFrame`."""
+        if self._df is None:
+            self._df = pd.DataFrame(
+                {name: self.data[name][: self.n] for name, _, _ in self.columns}
+            )
+        return self._df
@@ -0,0 +1,163 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+from typing import Container, Dict, List, Optional, Union
+
+from cardioception.clock import SessionClock, VirtualClock
+from cardioception.HRD.psi import PsiStaircase, expectedInformationGain
+
+
+class SessionScheduler:
+    """Choose the modality of the next trial to fit the session in a time budget.
+
+    The duration of the trials is measured online for each modality. Before each
+    trial, the scheduler estimates the information that the next trial of each
+    modality would bring on the threshold (the expected reduction of the entropy of
+    the Psi posterior, see :py:func:`cardioception.HRD.psi.expectedInformationGain`)
+    and selects the modality with the largest gain per second. Because the gain
+    decreases as a posterior gets narrower, the trials are shared between the two
+    thresholds, with more trials for the modality that is faster or less precise.
+    The session ends when the remaining time is shorter than the expected duration
+    of the next trial.
+
+    For staircases without posterior (`"updown"`), the gain is replaced by
+    `1 / (n + 1)`, where `n` is the number of trials already presented, so the
+    modalities are balanced.
+
+    Parameters
+    ----------
+    budget : float
+        The duration of the session (seconds), counted from :py:meth:`start`. The
+        breaks are included.
+    modalities : list
+        The modalities that can be presented (e.g. `["Intero", "Extero"]`).
+    expectedDuration : float | dict
+        The duration of a trial (seconds) assumed before the first measure, for all
+        the modalities or per modality. Defaults to `12.0`. The estimate is the
+        average of this value and of the measured durations.
+    clock : :py:class:`cardioception.clock.SessionClock` | \
+        :py:class:`cardioception.clock.VirtualClock` | None
+        The session clock. Defaults to a real time clock.
+
+    Attributes
+    ----------
+    durations : dict
+        The measured duration of each trial, per modality (seconds).
+
+    Examples
+    --------
+    >>> scheduler = SessionScheduler(budget=30 * 60, modalities=["Intero", "Extero"])
+    >>> scheduler.start()
+    >>> modality = scheduler.next(parameters["stairCase"])
+    >>> # ... trial ...
+    >>> scheduler.record(modality, duration=11.2)
+
+    """
+
+    def __init__(
+        self,
+        budget: float,
+        modalities: List[str],
+        expectedDuration: Union[float, Dict[str, float]] = 12.0,
+        clock: Optional[Union[SessionClock, VirtualClock]] = None,
+    ):
+        self.budget = budget
+        self.clock = SessionClock() if clock is None else clock
+        self.modalities = list(modalities)
+        if isinstance(expectedDuration, dict):
+            self.expectedDuration = dict(expectedDuration)
+        else:
+            self.expectedDuration = {m: float(expectedDuration) for m in modalities}
+        self.durations: Dict[str, List[float]] = {m: [] for m in self.modalities}
+        self._startTime: Optional[float] = None
+
+    def start(self):
+        """Start counting the elapsed time."""
+        self._startTime = self.clock.getTime()
+
+        return self
+
+    @property
+    def elapsed(self) -> float:
+        """The time since :py:meth:`start` (seconds)."""
+        if self._startTime is None:
+            return 0.0
+
+        return self.clock.getTime() - self._startTime
+
+    @property
+    def remaining(self) -> float:
+        """The time left in the budget (seconds)."""
+        return self.budget - self.elapsed
+
+    def duration(self, modality: str) -> float:
+        """The expected duration of the next trial of this modality (seconds)."""
+        measured = self.durations[modality]
+
+        return (self.expectedDuration[modality] + sum(measured)) / (1 + len(measured))
+
+    def record(self, modality: str, duration: float):
+        """Add the measured duration of a trial.
+
+        Parameters
+        ----------
+        modality : str
+            The modality of the trial.
+        duration : float
+            The duration of the trial (seconds).
+        """
+        self.durations[modality].append(duration)
+
+        return self
+
+    def gain(self, modality: str, stairCase) -> float:
+        """The expected information gain of the next trial of this modality (bits).
+
+        Parameters
+        ----------
+        modality : str
+            The modality.
+        stairCase : object
+            The staircase of this modality.
+        """
+        if isinstance(stairCase, PsiStaircase) or hasattr(stairCase, "_psi"):
+            return expectedInformationGain(stairCase)
+
+        return 1 / (len(self.durations[modality]) + 1)
+
+    def next(self, stairCases: Dict, exclude: Container[str] = ()) -> Optional[str]:
+        """The modality of the next trial.
+
+        Parameters
+        ----------
+        stairCases : dict
+            The staircase of each modality (`parameters["stairCase"]`).
+        exclude : list | dict
+            The modalities that should not be presented anymore (e.g. staircases
+            retired by the stopping rule).
+
+        Returns
+        -------
+        modality : str | None
+            The modality with the largest expected gain per second among the ones
+            fitting in the remaining time, or `None` if the session should end.
+        """
+        remaining = self.remaining
+        candidates = [
+            m
+            for m in self.modalities
+            if (m not in exclude) and (self.duration(m) <= remaining)
+        ]
+        if not candidates:
+            return None
+
+        return max(
+            candidates, key=lambda m: self.gain(m, stairCases[m]) / self.duration(m)
+        )
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """The number of trials and the mean duration per modality."""
+        return {
+            m: {"trials": len(self.durations[m]), "duration": self.duration(m)}
+            for m in self.modalities
+        }
@@ -0,0 +1,551 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import wave
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pkg_resources  # type: ignore
+
+from cardioception.storage import cacheDir
+
+# Layout of the stimulus bank files: header (with the key of the synthesis
+# parameters), index (one entry per stimulus, offset and length in samples from the
+# start of the data) and int16 samples
+BANK_MAGIC = b"CARDSND2"
+BANK_HEADER = np.dtype(
+    [("magic", "S8"), ("sampleRate", "<f8"), ("nStimuli", "<i8"), ("key", "S16")]
+)
+BANK_INDEX = np.dtype([("bpm", "<f8"), ("offset", "<i8"), ("length", "<i8")])
+
+
+def reachableBPMs(
+    listenRange: Tuple[float, float] = (40.0, 120.0),
+    alphaRange: Tuple[float, float] = (-50.5, 50.5),
+    bpmRange: Tuple[float, float] = (15.0, 199.0),
+    step: float = 0.5,
+) -> np.ndarray:
+    """The stimulus frequencies that can be presented during the task.
+
+    Parameters
+    ----------
+    listenRange : tuple
+        Lower and upper bounds of the listening frequencies (BPM), i.e. the heart rate
+        cut-off (`parameters["HRcutOff"]`) and the exteroceptive tones.
+    alphaRange : tuple
+        Lower and upper bounds of the staircase intensities (BPM).
+    bpmRange : tuple
+        The response frequencies are clipped to this range in
+        :py:func:`cardioception.HRD.task.trial`.
+    step : float
+        The precision of the stimuli. Defaults to `0.5`.
+
+    Returns
+    -------
+    bpms : np.ndarray
+        The reachable frequencies, sorted by distance from the center of the
+        listening range so the most likely stimuli come first.
+    """
+    low = max(bpmRange[0], listenRange[0] + alphaRange[0])
+    high = min(bpmRange[1], listenRange[1] + alphaRange[1])
+    bpms = np.arange(np.ceil(low / step) * step, high + step / 2, step)
+    center = (listenRange[0] + listenRange[1]) / 2
+
+    return bpms[np.argsort(np.abs(bpms - center), kind="stable")]
+
+
+@lru_cache(maxsize=8)
+def _tone(
+    freq: float, toneDuration: float, volume: float, sampleRate: float
+) -> np.ndarray:
+    """A single beep as int16 samples (read-only, shared between calls)."""
+    x = np.arange(int(toneDuration * (sampleRate / 1000.0)))
+    tone = (volume * np.sin(2 * np.pi * freq * (x / sampleRate)) * 32767.0).astype(
+        np.int16
+    )
+    tone.flags.writeable = False
+    return tone
+
+
+def synthesize(
+    bpm: float,
+    freq: float = 440.0,
+    toneDuration: float = 200.0,
+    volume: float = 0.5,
+    nBeats: int = 5,
+    sampleRate: float = 44100.0,
+) -> np.ndarray:
+    """Render the stimulus sound for a given frequency.
+
+    The stimulus is a train of `nBeats` beeps (sine tones) separated by silences so
+    that the beeps are presented at `bpm` beats per minute. Using the default
+    parameters, the output is identical to the WAV files generated by
+    `generate_sound_stimuli.py`.
+
+    Parameters
+    ----------
+    bpm : float
+        The frequency of the beeps (beats per minute).
+    freq : float
+        The frequency of the tone (Hz). Defaults to `440`.
+    toneDuration : float
+        The duration of each beep (ms). Defaults to `200`.
+    volume : float
+        The amplitude of the tone (between 0 and 1). Defaults to `0.5`.
+    nBeats : int
+        The number of beeps. Defaults to `5`.
+    sampleRate : float
+        The sampling rate of the sound. Defaults to `44100`.
+
+    Returns
+    -------
+    audio : np.ndarray
+        The sound as `int16` samples.
+    """
+    tone = _tone(freq, toneDuration, volume, sampleRate)
+    rr = (60000 / float(bpm)) - toneDuration
+    nSilence = int(rr * (sampleRate / 1000.0))
+    audio: np.ndarray = np.zeros((nBeats, len(tone) + nSilence), dtype=np.int16)
+    audio[:, : len(tone)] = tone
+
+    return audio.ravel()
+
+
+def synthLoader(bpm: float) -> Tuple[np.ndarray, int]:
+    """Render the stimulus sound for :py:class:`SoundCache`.
+
+    Parameters
+    ----------
+    bpm : float
+        The tone frequency (beats per minute).
+
+    Returns
+    -------
+    audio : np.ndarray
+        The sound, as `float32` values between -1 and 1.
+    sampleRate : int
+        The sampling rate of the sound.
+    """
+    audio = synthesize(bpm).astype(np.float32) / 32767.0
+    return audio, 44100
+
+
+def verifySynthesis(bpms: Optional[Iterable[float]] = None) -> List[float]:
+    """Compare the synthesized sounds with the WAV files shipped with the task.
+
+    Parameters
+    ----------
+    bpms : iterable | None
+        The frequencies to check. If `None`, all the frequencies between 15 and 199.5
+        BPM (0.5 BPM step) are checked.
+
+    Returns
+    -------
+    mismatches : list
+        The frequencies for which the synthesized sound is not sample-by-sample
+        identical to the WAV file. An empty list means the synthesizer can be used
+        in place of the files.
+    """
+    if bpms is None:
+        bpms = np.arange(15, 200, 0.5)
+    mismatches = []
+    for bpm in bpms:
+        fileName = pkg_resources.resource_filename(
+            "cardioception.HRD", f"Sounds/{float(bpm)}.wav"
+        )
+        with wave.open(fileName, "rb") as wav:
+            stored = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+        if not np.array_equal(stored, synthesize(float(bpm))):
+            mismatches.append(float(bpm))
+
+    return mismatches
+
+
+def readWav(bpm: float) -> Tuple[np.ndarray, int]:
+    """Read and decode the stimulus file shipped with the task.
+
+    Parameters
+    ----------
+    bpm : float
+        The tone frequency (beats per minute).
+
+    Returns
+    -------
+    audio : np.ndarray
+        The decoded sound, as `float32` values between -1 and 1.
+    sampleRate : int
+        The sampling rate of the sound.
+    """
+    fileName = pkg_resources.resource_filename(
+        "cardioception.HRD", f"Sounds/{float(bpm)}.wav"
+    )
+    with wave.open(fileName, "rb") as wav:
+        sampleRate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    audio = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32767.0
+
+    return audio, sampleRate
+
+
+def _packageVersion() -> str:
+    """The installed version of cardioception."""
+    try:
+        return pkg_resources.get_distribution("cardioception").version
+    except pkg_resources.DistributionNotFound:
+        return "unknown"
+
+
+def bankKey(
+    bpms: Optional[Iterable[float]] = None, sampleRate: float = 44100.0, **kwargs
+) -> str:
+    """A hash of the parameters used to synthesize a stimulus bank.
+
+    The key covers the frequencies, the sampling rate, the other parameters of
+    :py:func:`synthesize` (default values included), the bank format and the
+    version of the package, so a bank built with different parameters or by
+    another version of the synthesizer is never reused.
+
+    Parameters
+    ----------
+    bpms, sampleRate, kwargs :
+        The parameters of :py:func:`buildStimulusBank`.
+
+    Returns
+    -------
+    key : str
+        16 hexadecimal characters.
+    """
+    if bpms is None:
+        bpms = np.arange(15, 200, 0.5)
+    arguments = inspect.signature(synthesize).bind(0.0, **kwargs)
+    arguments.apply_defaults()
+    key = {k: v for k, v in arguments.arguments.items() if k != "bpm"}
+    key["sampleRate"] = float(sampleRate)
+    key["bpms"] = [float(bpm) for bpm in bpms]
+    key["format"] = BANK_MAGIC.decode()
+    key["version"] = _packageVersion()
+
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def buildStimulusBank(
+    fileName: str,
+    bpms: Optional[Iterable[float]] = None,
+    sampleRate: float = 44100.0,
+    **kwargs,
+) -> str:
+    """Synthesize the stimuli and pack them in a single stimulus bank file.
+
+    Parameters
+    ----------
+    fileName : str
+        Path to the bank file. The file is written to a temporary file first and
+        moved to its final location when complete.
+    bpms : iterable | None
+        The frequencies (beats per minute). Defaults to 15 to 199.5 BPM with 0.5 BPM
+        steps.
+    sampleRate : float
+        The sampling rate of the sounds. Defaults to `44100`.
+    kwargs :
+        Other parameters passed to :py:func:`synthesize` (`freq`, `toneDuration`,
+        `volume`, `nBeats`).
+
+    Returns
+    -------
+    fileName : str
+        Path to the bank file.
+    """
+    if bpms is None:
+        bpms = np.arange(15, 200, 0.5)
+    bpms = list(bpms)
+    key = bankKey(bpms, sampleRate, **kwargs)
+    sounds = [synthesize(float(bpm), sampleRate=sampleRate, **kwargs) for bpm in bpms]
+    index: np.ndarray = np.zeros(len(sounds), dtype=BANK_INDEX)
+    index["bpm"] = [float(bpm) for bpm in bpms]
+    index["length"] = [len(audio) for audio in sounds]
+    index["offset"][1:] = np.cumsum(index["length"])[:-1]
+
+    tmpName = fileName + ".tmp"
+    with open(tmpName, "wb") as f:
+        f.write(
+            np.array(
+                [(BANK_MAGIC, sampleRate, len(sounds), key.encode())], BANK_HEADER
+            ).tobytes()
+        )
+        f.write(index.tobytes())
+        for audio in sounds:
+            f.write(audio.astype("<i2").tobytes())
+    os.replace(tmpName, fileName)
+
+    return fileName
+
+
+class StimulusBank:
+    """Read-only access to a stimulus bank file.
+
+    The file is opened once and memory-mapped. Requesting a stimulus only slices the
+    mapped file, without file lookup, copy or decoding.
+
+    Parameters
+    ----------
+    fileName : str
+        Path to the bank file (see :py:func:`buildStimulusBank`).
+
+    Attributes
+    ----------
+    key : str
+        The hash of the synthesis parameters of the bank (see :py:func:`bankKey`).
+
+    Examples
+    --------
+    >>> bank = openStimulusBank()
+    >>> audio = bank.get(72.5)  # int16 view of the mapped file
+
+    """
+
+    def __init__(self, fileName: str):
+        self.fileName = fileName
+        with open(fileName, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mmap, dtype=BANK_HEADER, count=1)[0]
+        if header["magic"] != BANK_MAGIC:
+            raise ValueError(f"{fileName} is not a valid stimulus bank.")
+        self.sampleRate = float(header["sampleRate"])
+        self.key = header["key"].decode()
+        index = np.frombuffer(
+            self._mmap,
+            dtype=BANK_INDEX,
+            count=int(header["nStimuli"]),
+            offset=BANK_HEADER.itemsize,
+        )
+        self._dataOffset = BANK_HEADER.itemsize + index.nbytes
+        self._index: Dict[float, Tuple[int, int]] = {
+            float(bpm): (int(offset), int(length)) for bpm, offset, length in index
+        }
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, bpm: float) -> bool:
+        return float(bpm) in self._index
+
+    @property
+    def bpms(self) -> List[float]:
+        """The frequencies available in the bank."""
+        return list(self._index.keys())
+
+    def get(self, bpm: float) -> np.ndarray:
+        """The stimulus for this frequency, as a read-only `int16` array.
+
+        Parameters
+        ----------
+        bpm : float
+            The tone frequency (beats per minute).
+        """
+        offset, length = self._index[float(bpm)]
+        return np.frombuffer(
+            self._mmap,
+            dtype="<i2",
+            count=length,
+            offset=self._dataOffset + offset * 2,
+        )
+
+    def loader(self, bpm: float) -> Tuple[np.ndarray, int]:
+        """Loader for :py:class:`SoundCache` reading the sounds from the bank."""
+        audio = self.get(bpm).astype(np.float32) / 32767.0
+        return audio, int(self.sampleRate)
+
+    def close(self):
+        """Unmap the bank file (the arrays returned by :py:meth:`get` should be
+        released first)."""
+        self._mmap.close()
+
+
+def openStimulusBank(
+    fileName: Optional[str] = None,
+    bpms: Optional[Iterable[float]] = None,
+    sampleRate: float = 44100.0,
+    **kwargs,
+) -> StimulusBank:
+    """Open the stimulus bank, building it first if it does not exist.
+
+    The bank is rebuilt if it was synthesized with other parameters or by another
+    version of the package (see :py:func:`bankKey`).
+
+    Parameters
+    ----------
+    fileName : str | None
+        Path to the bank file. Defaults to `HRD_stimuli_<key>.bank` in the
+        cardioception cache directory (see
+        :py:func:`cardioception.storage.cacheDir`), named after the hash of the
+        synthesis parameters.
+    bpms, sampleRate, kwargs :
+        The synthesis parameters (see :py:func:`buildStimulusBank`). The defaults
+        give the stimuli of the task.
+
+    Returns
+    -------
+    bank : :py:class:`StimulusBank`
+        The opened bank.
+    """
+    if bpms is not None:
+        bpms = list(bpms)
+    key = bankKey(bpms, sampleRate, **kwargs)
+    if fileName is None:
+        fileName = os.path.join(cacheDir(), f"HRD_stimuli_{key}.bank")
+    if os.path.exists(fileName):
+        try:
+            bank = StimulusBank(fileName)
+        except ValueError:  # Previous format of the bank files
+            pass
+        else:
+            if bank.key == key:
+                return bank
+            bank.close()
+    buildStimulusBank(fileName, bpms=bpms, sampleRate=sampleRate, **kwargs)
+
+    return StimulusBank(fileName)
+
+
+class SoundCache:
+    """In-memory cache of ready-to-play stimulus sounds.
+
+    The sounds are decoded and turned into :py:class:`psychopy.sound.Sound` instances
+    before the task starts, so the trials do not read and decode files right before
+    the response window opens. When the memory limit is reached, the least recently
+    used sounds are discarded and will be loaded again if requested.
+
+    Parameters
+    ----------
+    bpms : iterable | None
+        The frequencies to preload, in order of priority. Preloading stops when the
+        memory limit is reached. If `None`, nothing is preloaded.
+    maxMemory : float
+        Maximum size of the decoded sounds kept in memory (MB). Defaults to `128`.
+    loader : callable | None
+        Function returning the decoded sound and its sampling rate for a given
+        frequency. Defaults to :py:func:`synthLoader` (the sounds are synthesized
+        on the fly). Use :py:func:`readWav` to read the WAV files instead.
+    soundType : callable | None
+        The class of the playable sounds, called with the `value` and `sampleRate`
+        keyword arguments. Defaults to :py:class:`psychopy.sound.Sound`.
+
+    Attributes
+    ----------
+    hits, misses, evictions : int
+        Number of requests served from the cache, number of requests that needed to
+        load the sound, and number of sounds discarded to save memory.
+
+    Examples
+    --------
+    >>> soundCache = SoundCache(bpms=reachableBPMs())
+    >>> soundCache.get(72.5).play()
+    >>> soundCache.stats["hits"]
+    1
+
+    """
+
+    def __init__(
+        self,
+        bpms: Optional[Iterable[float]] = None,
+        maxMemory: float = 128.0,
+        loader: Optional[Callable[[float], Tuple[np.ndarray, int]]] = None,
+        soundType: Optional[Callable] = None,
+    ):
+        self.maxMemory = maxMemory * 1e6
+        self.loader = synthLoader if loader is None else loader
+        self.soundType = soundType
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.memory = 0
+        self._sounds: "OrderedDict[float, Tuple[object, int]]" = OrderedDict()
+        if bpms is not None:
+            self.prefetch(bpms)
+
+    def __len__(self) -> int:
+        return len(self._sounds)
+
+    def __contains__(self, bpm: float) -> bool:
+        return float(bpm) in self._sounds
+
+    def _load(self, bpm: float):
+        """Decode the sound and create the psychopy instance."""
+        if self.soundType is None:
+            from psychopy import sound
+
+            self.soundType = sound.Sound
+
+        audio, sampleRate = self.loader(bpm)
+        self._sounds[bpm] = (
+            self.soundType(value=audio, sampleRate=sampleRate),
+            audio.nbytes,
+        )
+        self.memory += audio.nbytes
+
+    def _evict(self):
+        """Discard the least recently used sounds until the memory limit is met."""
+        while (self.memory > self.maxMemory) and (len(self._sounds) > 1):
+            _, (_, nbytes) = self._sounds.popitem(last=False)
+            self.memory -= nbytes
+            self.evictions += 1
+
+    def prefetch(self, bpms: Iterable[float]):
+        """Load sounds in advance, without evicting the ones already in memory.
+
+        Parameters
+        ----------
+        bpms : iterable
+            The frequencies to load, in order of priority.
+        """
+        for bpm in bpms:
+            bpm = float(bpm)
+            if bpm in self._sounds:
+                continue
+            self._load(bpm)
+            if self.memory > self.maxMemory:
+                _, nbytes = self._sounds.pop(bpm)
+                self.memory -= nbytes
+                break
+
+        return self
+
+    def get(self, bpm: float):
+        """Return the sound for this frequency.
+
+        Parameters
+        ----------
+        bpm : float
+            The tone frequency (beats per minute).
+
+        Returns
+        -------
+        sound : :py:class:`psychopy.sound.Sound`
+            The sound, ready to be played.
+        """
+        bpm = float(bpm)
+        if bpm in self._sounds:
+            self.hits += 1
+            self._sounds.move_to_end(bpm)
+        else:
+            self.misses += 1
+            self._load(bpm)
+            self._evict()
+
+        return self._sounds[bpm][0]
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Hits, misses and evictions counts, number of sounds and memory (MB)."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._sounds),
+            "memory": round(self.memory / 1e6, 1),
+        }
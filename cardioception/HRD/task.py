@@ -2,14 +2,24 @@
 # Maintained by the Embodied Computation Group, Aarhus University
 
 import pickle
-import time
-from typing import Optional, Tuple
+from functools import partial
+from typing import Any, Callable, Optional, Tuple
 
 import numpy as np
-import pandas as pd
-import pkg_resources  # type: ignore
 from systole.detection import ppg_peaks
 
+from cardioception.backends import getBackend
+from cardioception.HRD.parameters import compileTutorial
+from cardioception.HRD.psi import (
+    StaircaseWorker,
+    posterior,
+    posteriorEntropy,
+    thresholdInterval,
+)
+from cardioception.HRD.results import HRD_COLUMNS, TrialBuffer, TrialRecord
+from cardioception.storage import PosteriorStore, ResultsWriter, SignalStore
+from cardioception.tracing import FrameMonitor, Tracer, getTracer, recordFrames
+
 
 def run(
     parameters: dict,
@@ -28,255 +38,348 @@ def run(
         If `True`, will present a tutorial with 10 training trial with feedback
         and 5 trials with confidence rating.
     """
-    from psychopy import core, visual
+    backend = getBackend(parameters)
+    core, sessionClock = backend.core, backend.clock
+
+    # Duration of each phase of the task, written to the trace file
+    tracer = parameters["tracer"] = Tracer(parameters["traceFile"])
+
+    # Frame intervals of the decision and rating phases (optional)
+    if parameters["frameTiming"] is True:
+        parameters["frameMonitor"] = FrameMonitor(
+            parameters["win"], budget=parameters["frameDropBudget"]
+        )
 
     # Initialization of the Pulse Oximeter
-    parameters["oxiTask"].setup().read(duration=1)
+    with tracer.span("oximeterSetup"):
+        parameters["oxiTask"].setup().read(duration=1)
+
+    # Preallocate the results buffer and open the results file, one row is
+    # appended after each trial
+    parameters["trialBuffer"] = TrialBuffer(HRD_COLUMNS, size=parameters["nTrials"])
+    parameters["resultsWriter"] = ResultsWriter(
+        parameters["resultPath"]
+        + "/"
+        + parameters["participant"]
+        + parameters["session"]
+        + ".txt",
+        columns=[name for name, _, _ in HRD_COLUMNS],
+        flushEvery=parameters["flushEvery"],
+        maxLatency=parameters["maxFlushLatency"],
+        keepRows=False,
+    )
+
+    # The raw PPG signal of each interoceptive trial is appended to this file
+    parameters["signalStore"] = SignalStore(
+        parameters["resultPath"] + "/" + parameters["participant"] + "_signal.bin",
+        sfreq=75,
+    )
+
+    # The posterior distribution after each Psi trial is written to a memory-mapped
+    # file, preallocated for the number of Psi trials in each modality. When the
+    # modalities are chosen during the task (time budget or stopping rule), any
+    # trial can be given to a modality, so the files are preallocated for all the
+    # trials and truncated at the end.
+    reallocate = (parameters["stoppingRule"] is not None) or (
+        parameters["scheduler"] is not None
+    )
+    for k in set(parameters["Modality"]):
+        parameters["staircaisePosteriors"][k] = PosteriorStore(
+            parameters["resultPath"]
+            + "/"
+            + parameters["participant"]
+            + k
+            + "_posterior.npy",
+            nTrials=(
+                parameters["nTrials"]
+                if reallocate
+                else int(
+                    np.sum(
+                        (parameters["Modality"] == k)
+                        & (parameters["staircaseType"] == "psi")
+                    )
+                )
+            ),
+            dtype=parameters["posteriorDtype"],
+        )
 
     # Show tutorial and training trials
     if runTutorial is True:
-        tutorial(parameters)
+        with tracer.span("tutorial"):
+            tutorial(parameters)
+
+    # The staircases are updated in a background thread
+    worker = StaircaseWorker()
+
+    # Number of Psi trials per modality, and trial where each staircase was retired
+    # by the stopping rule (if any)
+    psiTrials = {modality: 0 for modality in parameters["stairCase"]}
+    parameters["retired"] = {}
+
+    # With a time budget, the modality of each trial is chosen by the scheduler
+    scheduler = parameters["scheduler"]
+
+    schedule = parameters["schedule"]
+
+    # The planned trials of each modality, in order. When the modality of a trial is
+    # changed, the trial type and the catch trial intensity are taken from the next
+    # planned trial of the new modality, or from its staircase once all its planned
+    # trials were presented
+    planned = {m: list(np.flatnonzero(schedule.modality == m)) for m in psiTrials}
+    stairType = "updown" if "updown" in schedule.staircaseType else "psi"
 
-    for nTrial, modality, trialType in zip(
-        range(parameters["nTrials"]),
-        parameters["Modality"],
-        parameters["staircaseType"],
-    ):
+    for nTrial in range(parameters["nTrials"]):
+        modality = schedule.modality[nTrial]
+
+        # The trials of a retired staircase are given to the other modality, the
+        # session ends when all the staircases are retired or the time is over
+        if scheduler is not None:
+            modality = scheduler.next(
+                parameters["stairCase"], exclude=parameters["retired"]
+            )
+        elif modality in parameters["retired"]:
+            active = [m for m in psiTrials if m not in parameters["retired"]]
+            modality = active[0] if active else None
+        if modality is None:
+            print("... end of the session.")
+            break
+        slot = planned[modality].pop(0) if planned[modality] else None
+        trialType = stairType if slot is None else schedule.staircaseType[slot]
+
+        # The spans of this iteration are saved with the trial number
+        tracer.trial = nTrial
 
         # Initialize variable
         estimatedThreshold, estimatedSlope = None, None
+        entropy, interval, retired = None, None, False
 
         # Wait for key press if this is the first trial
         if nTrial == 0:
 
             # Ask the participant to press default button to start
-            messageStart = visual.TextStim(
-                parameters["win"],
-                height=parameters["textSize"],
-                text=parameters["texts"]["textTaskStart"],
-            )
-            press = visual.TextStim(
-                parameters["win"],
-                height=parameters["textSize"],
-                pos=(0.0, -0.4),
-                text=parameters["texts"]["textNext"],
-            )
-            press.draw()
-            messageStart.draw()  # Show instructions
+            parameters["stimuli"].get("next").draw()
+            parameters["stimuli"].get("taskStart").draw()  # Show instructions
             parameters["win"].flip()
 
             waitInput(parameters)
 
-        # Next intensity value
-        if trialType == "updown":
-            print("... load UpDown staircase.")
-            thisTrial = parameters["stairCase"][modality].next()
-            stairCond = thisTrial[1]["label"]
-            alpha = thisTrial[0]
-        elif trialType == "psi":
-            print("... load psi staircase.")
-            alpha = parameters["stairCase"][modality].next()
-            stairCond = "psi"
-        elif trialType == "CatchTrial":
-            print("... load catch trial.")
-            # Select pseudo-random extrem value based on number
-            # of previous catch trial.
-            catchIdx = sum(
-                parameters["staircaseType"][:nTrial][
-                    parameters["Modality"][:nTrial] == modality
-                ]
-                == "CatchTrial"
-            )
-            alpha = np.array([-30, 10, -20, 20, -10, 30])[catchIdx % 6]
-            stairCond = "CatchTrial"
-
-        # Before trial triggers
-        parameters["oxiTask"].readInWaiting()
-        parameters["oxiTask"].channels["Channel_0"][-1] = 1  # Trigger
-
-        # Start trial
-        (
-            condition,
-            listenBPM,
-            responseBPM,
-            decision,
-            decisionRT,
-            confidence,
-            confidenceRT,
-            alpha,
-            isCorrect,
-            respProvided,
-            ratingProvided,
-            startTrigger,
-            soundTrigger,
-            responseMadeTrigger,
-            ratingStartTrigger,
-            ratingEndTrigger,
-            endTrigger,
-        ) = trial(
-            parameters,
-            alpha,
-            modality,
-            confidenceRating=confidenceRating,
-            nTrial=nTrial,
-        )
+            # The time budget starts with the first trial
+            if scheduler is not None:
+                scheduler.start()
 
-        # Check if response is 'More' or 'Less'
-        isMore = 1 if decision == "More" else 0
-        # Update the UpDown staircase if initialization trial
-        if trialType == "updown":
-            print("... update UpDown staircase.")
-            # Update the UpDown staircase
-            parameters["stairCase"][modality].addResponse(isMore)
-        elif trialType == "psi":
-            print("... update psi staircase.")
+        trialStart = sessionClock.getTime()
 
-            # Update the Psi staircase with forced intensity value
-            # if impossible BPM was generated
-            if listenBPM + alpha < 15:
-                parameters["stairCase"][modality].addResponse(isMore, intensity=15)
-            elif listenBPM + alpha > 199:
-                parameters["stairCase"][modality].addResponse(isMore, intensity=199)
-            else:
-                parameters["stairCase"][modality].addResponse(isMore)
+        # Next intensity value
+        with tracer.span("nextIntensity"):
+            if trialType == "updown":
+                print("... load UpDown staircase.")
+                thisTrial = parameters["stairCase"][modality].next()
+                stairCond = thisTrial[1]["label"]
+                alpha = thisTrial[0]
+            elif trialType == "psi":
+                print("... load psi staircase.")
+                alpha = parameters["stairCase"][modality].next()
+                stairCond = "psi"
+            elif trialType == "CatchTrial":
+                print("... load catch trial.")
+                # Pseudo-random extrem value, precomputed in the schedule
+                alpha = schedule.alpha[slot]
+                stairCond = "CatchTrial"
+
+        # Make sure the sounds known in advance are loaded
+        with tracer.span("soundPrefetch"):
+            if slot is not None:
+                parameters["soundCache"].prefetch(schedule.bpms(slot, slot + 1))
 
-            # Store posteriors in list for each trials
-            parameters["staircaisePosteriors"][modality].append(
-                parameters["stairCase"][modality]._psi._probLambda[0, :, :, 0]
+        # Before trial triggers
+        parameters["oxiTask"].trigger(1)  # Trigger
+
+        # Start trial, the staircase is updated in the background as soon as the
+        # decision is known
+        backend.visual.countCreated()
+        if parameters["frameMonitor"] is not None:
+            parameters["frameMonitor"].reset()
+        with tracer.span("trial", modality=modality, trialType=trialType):
+            record = trial(
+                parameters,
+                alpha,
+                modality,
+                confidenceRating=confidenceRating,
+                nTrial=nTrial,
+                isi=schedule.isi[nTrial],
+                listenBPM=(
+                    schedule.exteroBPM[slot]
+                    if (slot is not None) and (modality == "Extero")
+                    else None
+                ),
+                onDecision=partial(
+                    worker.submit, updateStaircase, parameters, modality, trialType
+                ),
             )
-
-            # Save estimated threshold and slope for each trials
-            estimatedThreshold, estimatedSlope = parameters["stairCase"][
-                modality
-            ].estimateLambda()
+        listenBPM, alpha = record.listenBPM, record.alpha
+
+        # Collect the staircase update (usually ready after the confidence rating)
+        with tracer.span("staircaseResult"):
+            if worker.pending:
+                estimatedThreshold, estimatedSlope = worker.result()
+
+        # Precision of the posterior, and stopping rule
+        with tracer.span("posterior"):
+            if trialType == "psi":
+                psiTrials[modality] += 1
+                entropy = posteriorEntropy(parameters["stairCase"][modality])
+                interval = thresholdInterval(parameters["stairCase"][modality])
+                if (parameters["stoppingRule"] is not None) and parameters[
+                    "stoppingRule"
+                ].isDone(parameters["stairCase"][modality], psiTrials[modality]):
+                    print(
+                        f"... {modality} staircase retired after {psiTrials[modality]} trials."
+                    )
+                    parameters["retired"][modality] = nTrial
+                    retired = True
 
         print(
             f"... Initial BPM: {listenBPM} - Staircase value: {alpha} "
-            f"- Response: {decision} ({isCorrect})"
+            f"- Response: {record.decision} ({record.isCorrect})"
         )
 
-        # Store results
-        parameters["results_df"] = pd.concat(
-            [
-                parameters["results_df"],
-                pd.DataFrame(
-                    {
-                        "TrialType": [trialType],
-                        "Condition": [condition],
-                        "Modality": [modality],
-                        "StairCond": [stairCond],
-                        "Decision": [decision],
-                        "DecisionRT": [decisionRT],
-                        "Confidence": [confidence],
-                        "ConfidenceRT": [confidenceRT],
-                        "Alpha": [alpha],
-                        "listenBPM": [listenBPM],
-                        "responseBPM": [responseBPM],
-                        "ResponseCorrect": [isCorrect],
-                        "DecisionProvided": [respProvided],
-                        "RatingProvided": [ratingProvided],
-                        "nTrials": [nTrial],
-                        "EstimatedThreshold": [estimatedThreshold],
-                        "EstimatedSlope": [estimatedSlope],
-                        "StartListening": [startTrigger],
-                        "StartDecision": [soundTrigger],
-                        "ResponseMade": [responseMadeTrigger],
-                        "RatingStart": [ratingStartTrigger],
-                        "RatingEnds": [ratingEndTrigger],
-                        "endTrigger": [endTrigger],
-                    }
-                ),
-            ],
-            ignore_index=True,
+        # Dropped frames during the decision and the rating
+        frameStats = (
+            parameters["frameMonitor"].trialStats(nTrial)
+            if parameters["frameMonitor"] is not None
+            else {}
         )
 
-        # Save the results at each iteration
-        parameters["results_df"].to_csv(
-            parameters["resultPath"]
-            + "/"
-            + parameters["participant"]
-            + parameters["session"]
-            + ".txt",
-            index=False,
-        )
+        # Store results
+        with tracer.span("results"):
+            idx = parameters["trialBuffer"].add(
+                record,
+                TrialType=trialType,
+                Modality=modality,
+                StairCond=stairCond,
+                nTrials=nTrial,
+                EstimatedThreshold=estimatedThreshold,
+                EstimatedSlope=estimatedSlope,
+                PosteriorEntropy=entropy,
+                ThresholdInterval=interval,
+                Retired=retired,
+                StimuliCreated=backend.visual.countCreated(),
+                **frameStats,
+            )
+            parameters["resultsWriter"].append(parameters["trialBuffer"].row(idx))
+        if scheduler is not None:
+            scheduler.record(modality, sessionClock.getTime() - trialStart)
+
+        # Write the spans of the trial, outside the time-critical phases
+        tracer.flush()
 
         # Breaks
-        if (nTrial % parameters["nBreaking"] == 0) & (nTrial != 0):
-            message = visual.TextStim(
-                parameters["win"],
-                height=parameters["textSize"],
-                text=parameters["texts"]["textBreaks"],
-            )
+        if schedule.isBreak[nTrial]:
             percRemain = round((nTrial / parameters["nTrials"]) * 100, 2)
-            remain = visual.TextStim(
-                parameters["win"],
-                height=parameters["textSize"],
-                pos=(0.0, 0.2),
-                text=f" ---- {percRemain} % ---- ",
-            )
-            remain.draw()
-            message.draw()
+            if scheduler is not None:
+                percRemain = round(
+                    min(scheduler.elapsed / scheduler.budget, 1) * 100, 2
+                )
+            parameters["stimuli"].get(
+                "progress", text=f" ---- {percRemain} % ---- "
+            ).draw()
+            parameters["stimuli"].get("breaks").draw()
             parameters["win"].flip()
-            parameters["oxiTask"].save(
-                f"{parameters['resultPath']}/{parameters['participant']}_ppg_{nTrial}.txt"
-            )
+            with tracer.span("breakSave"):
+                parameters["resultsWriter"].flush()
+                parameters["oxiTask"].save(
+                    f"{parameters['resultPath']}/{parameters['participant']}_ppg_{nTrial}.txt"
+                )
 
             # Wait for participant input before continue
             waitInput(parameters)
 
             # Fixation cross
-            fixation = visual.GratingStim(
-                win=parameters["win"], mask="cross", size=0.1, pos=[0, 0], sf=0
-            )
-            fixation.draw()
+            parameters["stimuli"].get("fixation").draw()
             parameters["win"].flip()
 
             # Reset recording when ready
-            parameters["oxiTask"].setup()
-            parameters["oxiTask"].read(duration=1)
-
-    # Save the final results
-    print("Saving final results in .txt file...")
-    parameters["results_df"].to_csv(
-        parameters["resultPath"]
-        + "/"
-        + parameters["participant"]
-        + parameters["session"]
-        + "_final.txt",
-        index=False,
-    )
+            with tracer.span("breakResume"):
+                parameters["oxiTask"].setup()
+                parameters["oxiTask"].read(duration=1)
 
-    # Save the final signals file
-    print("Saving PPG signal data frame...")
-    parameters["signal_df"].to_csv(
-        parameters["resultPath"] + "/" + parameters["participant"] + "_signal.txt",
-        index=False,
-    )
-
-    # Save last pulse oximeter recording, if relevant
-    parameters["oxiTask"].save(
-        f"{parameters['resultPath']}/{parameters['participant']}_ppg_{nTrial}_end.txt"
-    )
+    tracer.trial = None
 
-    # Save posterios (if relevant)
-    print("Saving posterior distributions...")
-    for k in set(parameters["Modality"]):
-        np.save(
-            parameters["resultPath"]
+    # Save the final results
+    with tracer.span("saveResults"):
+        print("Saving final results in .txt file...")
+        parameters["resultsWriter"].close(
+            finalName=parameters["resultPath"]
             + "/"
             + parameters["participant"]
-            + k
-            + "_posterior.npy",
-            np.array(parameters["staircaisePosteriors"][k]),
+            + parameters["session"]
+            + "_final.txt"
         )
+        parameters["results_df"] = parameters["trialBuffer"].toDataFrame()
+
+        # Close the signal file (already written trial by trial)
+        parameters["signalStore"].close()
+
+        # Save last pulse oximeter recording, if relevant
+        parameters["oxiTask"].save(
+            f"{parameters['resultPath']}/{parameters['participant']}_ppg_{nTrial}_end.txt"
+        )
+
+        # Close the posterior files (already written trial by trial)
+        for store in parameters["staircaisePosteriors"].values():
+            store.close()
+
+    if scheduler is not None:
+        print(f"Session scheduler: {scheduler.summary()}")
+
+    # Time spent updating the staircases, and part of it hidden behind the ratings
+    worker.close()
+    parameters["staircaseTiming"] = worker.timing
+    print(f"Staircase updates: {worker.summary()}")
+
+    # Stop the acquisition thread
+    parameters["oxiTask"].close()
+    parameters["acquisitionStats"] = parameters["oxiTask"].stats()
+    print(f"Acquisition: {parameters['acquisitionStats']}")
+
+    # Sound cache usage
+    parameters["soundCacheStats"] = parameters["soundCache"].stats
+    print(f"Sound cache: {parameters['soundCacheStats']}")
+
+    # Frames dropped during the decision and rating phases
+    if parameters["frameMonitor"] is not None:
+        parameters["frameStats"] = parameters["frameMonitor"].stats()
+        print(f"Frame timing: {parameters['frameStats']}")
+
+    # Duration of the phases of the task
+    parameters["traceSummary"] = tracer.close().summary()
+    print(f"Phase durations (ms):\n{tracer.report()}")
 
     # Save parameters
     print("Saving Parameters in pickle...")
     save_parameter = parameters.copy()
-    for k in ["win", "heartLogo", "listenLogo", "stairCase", "oxiTask"]:
+    for k in [
+        "win",
+        "heartLogo",
+        "listenLogo",
+        "stairCase",
+        "oxiTask",
+        "resultsWriter",
+        "trialBuffer",
+        "signalStore",
+        "staircaisePosteriors",
+        "soundCache",
+        "stimulusBank",
+        "stimuli",
+        "peakDetector",
+        "backend",
+        "tracer",
+        "frameMonitor",
+    ]:
         del save_parameter[k]
     if parameters["device"] == "mouse":
         del save_parameter["myMouse"]
+    save_parameter.pop("psiGrid", None)
     del save_parameter["handSchema"]
     del save_parameter["pulseSchema"]
     with open(
@@ -289,17 +392,75 @@ def run(
         pickle.dump(save_parameter, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
     # End of the task
-    end = visual.TextStim(
-        parameters["win"],
-        height=parameters["textSize"],
-        pos=(0.0, 0.0),
-        text=parameters["texts"]["done"],
-    )
-    end.draw()
+    parameters["stimuli"].get("done").draw()
     parameters["win"].flip()
     core.wait(3)
 
 
+def updateStaircase(
+    parameters: dict,
+    modality: str,
+    trialType: str,
+    decision: Optional[str],
+    listenBPM: float,
+    alpha: float,
+) -> Tuple[Optional[float], Optional[float]]:
+    """Update the staircase with the decision of the participant.
+
+    Parameters
+    ----------
+    parameters : dict
+        Task parameters.
+    modality : str
+        The modality of the trial (`'Intero'` or `'Extero'`).
+    trialType : str
+        The staircase used in this trial (`'updown'`, `'psi'` or `'CatchTrial'`).
+        Catch trials do not update the staircases.
+    decision : str | None
+        The participant decision (`'More'`, `'Less'` or `None`).
+    listenBPM, alpha : float
+        The listening frequency and the intensity of the trial.
+
+    Returns
+    -------
+    estimatedThreshold, estimatedSlope : float | None
+        The threshold and slope estimated by the Psi staircase after the update.
+    """
+    estimatedThreshold, estimatedSlope = None, None
+
+    with getTracer(parameters).span("staircaseUpdate", modality=modality):
+        # Check if response is 'More' or 'Less'
+        isMore = 1 if decision == "More" else 0
+        # Update the UpDown staircase if initialization trial
+        if trialType == "updown":
+            print("... update UpDown staircase.")
+            # Update the UpDown staircase
+            parameters["stairCase"][modality].addResponse(isMore)
+        elif trialType == "psi":
+            print("... update psi staircase.")
+
+            # Update the Psi staircase with forced intensity value
+            # if impossible BPM was generated
+            if listenBPM + alpha < 15:
+                parameters["stairCase"][modality].addResponse(isMore, intensity=15)
+            elif listenBPM + alpha > 199:
+                parameters["stairCase"][modality].addResponse(isMore, intensity=199)
+            else:
+                parameters["stairCase"][modality].addResponse(isMore)
+
+            # Write the posterior in the file for each trials
+            parameters["staircaisePosteriors"][modality].append(
+                posterior(parameters["stairCase"][modality])
+            )
+
+            # Save estimated threshold and slope for each trials
+            estimatedThreshold, estimatedSlope = parameters["stairCase"][
+                modality
+            ].estimateLambda()
+
+    return estimatedThreshold, estimatedSlope
+
+
 def trial(
     parameters: dict,
     alpha: float,
@@ -307,25 +468,10 @@ def trial(
     confidenceRating: bool = True,
     feedback: bool = False,
     nTrial: Optional[int] = None,
-) -> Tuple[
-    str,
-    float,
-    float,
-    Optional[str],
-    Optional[float],
-    Optional[float],
-    Optional[float],
-    float,
-    Optional[bool],
-    bool,
-    bool,
-    float,
-    float,
-    float,
-    Optional[float],
-    Optional[float],
-    float,
-]:
+    isi: Optional[float] = None,
+    listenBPM: Optional[float] = None,
+    onDecision: Optional[Callable[[Optional[str], float, float], Any]] = None,
+) -> TrialRecord:
     """Run one trial of the Heart Rate Discrimination task.
 
     Parameters
@@ -343,9 +489,22 @@ def trial(
         If `True`, will provide feedback.
     nTrial : int
         Trial number (optional).
+    isi : float | None
+        The interval between the fixation cross and the listening phase (seconds).
+        If `None`, it is drawn between the bounds in `parameters["isi"]`.
+    listenBPM : float | None
+        The frequency of the tones presented during the listening phase of an
+        exteroceptive trial (BPM). If `None`, it is drawn between 40 and 100 BPM.
+        Ignored for interoceptive trials.
+    onDecision : callable | None
+        Function called with the decision, the listening frequency and the
+        intensity as soon as the decision phase ends, before the confidence rating
+        (e.g. to update the staircase in the background).
 
     Returns
     -------
+    record : :py:class:`cardioception.HRD.results.TrialRecord`
+        The trial outputs, with the following attributes.
     condition : str
         The trial condition, can be `'Higher'` or `'Lower'` depending on the
         alpha value.
@@ -383,7 +542,9 @@ def trial(
         ratingEndTrigger, endTrigger : float
         Time stamp of key timepoints inside the trial.
     """
-    from psychopy import core, event, sound, visual
+    backend = getBackend(parameters)
+    core, event, sessionClock = backend.core, backend.event, backend.clock
+    tracer = getTracer(parameters)
 
     # Print infos at each trial start
     print(f"Starting trial - Intensity: {alpha} - Modality: {modality}")
@@ -394,12 +555,12 @@ def trial(
     confidence, confidenceRT, isCorrect, ratingProvided = None, None, None, False
 
     # Fixation cross
-    fixation = visual.GratingStim(
-        win=parameters["win"], mask="cross", size=0.1, pos=[0, 0], sf=0
-    )
-    fixation.draw()
-    parameters["win"].flip()
-    core.wait(np.random.uniform(parameters["isi"][0], parameters["isi"][1]))
+    with tracer.span("fixation"):
+        parameters["stimuli"].get("fixation").draw()
+        parameters["win"].flip()
+        if isi is None:
+            isi = np.random.uniform(parameters["isi"][0], parameters["isi"][1])
+        core.wait(isi)
 
     keys = event.getKeys()
     if "escape" in keys:
@@ -407,132 +568,114 @@ def trial(
         parameters["win"].close()
         core.quit()
 
-    if modality == "Intero":
-
-        ###########
-        # Recording
-        ###########
-        messageRecord = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            pos=(0.0, 0.2),
-            text=parameters["texts"]["textHeartListening"],
-        )
-        messageRecord.draw()
+    with tracer.span("listening"):
+        if modality == "Intero":
 
-        # Start recording trigger
-        parameters["oxiTask"].readInWaiting()
-        parameters["oxiTask"].channels["Channel_0"][-1] = 2  # Trigger
+            ###########
+            # Recording
+            ###########
+            parameters["stimuli"].get("listenIntero").draw()
 
-        parameters["heartLogo"].draw()
-        parameters["win"].flip()
+            # Start recording trigger
+            parameters["oxiTask"].trigger(2)  # Trigger
 
-        startTrigger = time.time()
+            parameters["heartLogo"].draw()
+            parameters["win"].flip()
 
-        # Recording
-        while True:
+            startTrigger = sessionClock.getTime()
+
+            # Recording
+            while True:
+
+                # Read the raw PPG signal from the pulse oximeter
+                # You can adapt these line to work with a different setup provided that
+                # it can measure and create the new variable `bpm` (the average beats per
+                # minute over the 5 seconds of recording).
+                with tracer.span("recording"):
+                    rawSignal = parameters["oxiTask"].read(duration=5.0).window(6.0)
+                with tracer.span("peakDetection"):
+                    if parameters["peakDetection"] == "streaming":
+                        # The peaks are detected as the samples arrive (75 Hz)
+                        # Only use the last 5 seconds of the recording
+                        recording, offset = parameters["oxiTask"].samples()
+                        bpm = (
+                            parameters["peakDetector"]
+                            .consume(recording, offset=offset)
+                            .bpm(window=5.0)
+                        )
+                    elif parameters["peakDetection"] == "systole":
+                        signal, peaks = ppg_peaks(
+                            rawSignal, sfreq=75, new_sfreq=1000, clipping=True
+                        )
+
+                        # Get actual heart Rate
+                        # Only use the last 5 seconds of the recording
+                        bpm = 60000 / np.diff(np.where(peaks[-5000:])[0])
+                    else:
+                        raise ValueError("Invalid peak detection method")
 
-            # Read the raw PPG signal from the pulse oximeter
-            # You can adapt these line to work with a different setup provided that
-            # it can measure and create the new variable `bpm` (the average beats per
-            # minute over the 5 seconds of recording).
-            signal = (
-                parameters["oxiTask"].read(duration=5.0).recording[-75 * 6 :]  # noqa
-            )
-            signal, peaks = ppg_peaks(signal, sfreq=75, new_sfreq=1000, clipping=True)
+            
+                # # for Nonin3231USB
+                # # Only use the last 5 seconds of the recording
+                # bpm =  pd.Series(parameters["oxiTask"].read(duration=5.0).bpm)[-5:]
+                # # use bpm as signal, Nonin3231USB gives no raw signal
+                # signal = bpm
 
-            # Get actual heart Rate
-            # Only use the last 5 seconds of the recording
-            bpm = 60000 / np.diff(np.where(peaks[-5000:])[0])
 
-            
-            # # for Nonin3231USB
-            # # Only use the last 5 seconds of the recording
-            # bpm =  pd.Series(parameters["oxiTask"].read(duration=5.0).bpm)[-5:]
-            # # use bpm as signal, Nonin3231USB gives no raw signal
-            # signal = bpm
-
-
-            print(f"... bpm: {[round(i) for i in bpm]}")
-
-            # Prevent crash if NaN value
-            if np.isnan(bpm).any() or (bpm is None) or (bpm.size == 0):
-                message = visual.TextStim(
-                    parameters["win"],
-                    height=parameters["textSize"],
-                    text=parameters["texts"]["checkOximeter"],
-                    color="red",
-                )
-                message.draw()
-                parameters["win"].flip()
-                core.wait(2)
+                print(f"... bpm: {[round(i) for i in bpm]}")
 
-            else:
-                # Check for extreme heart rate values, if crosses theshold,
-                # hold the task until resolved. Cutoff values determined in
-                # parameters to correspond to biologically unlikely values.
-                if not (
-                    (np.any(bpm < parameters["HRcutOff"][0]))
-                    or (np.any(bpm > parameters["HRcutOff"][1]))
-                ):
-                    listenBPM = round(bpm.mean() * 2) / 2  # Round nearest .5
-                    break
-                else:
-                    message = visual.TextStim(
-                        parameters["win"],
-                        height=parameters["textSize"],
-                        text=parameters["texts"]["stayStill"],
-                        color="red",
-                    )
-                    message.draw()
+                # Prevent crash if NaN value
+                if np.isnan(bpm).any() or (bpm is None) or (bpm.size == 0):
+                    parameters["stimuli"].get("checkOximeter").draw()
                     parameters["win"].flip()
                     core.wait(2)
 
-    elif modality == "Extero":
-
-        ###########
-        # Recording
-        ###########
-        messageRecord = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            pos=(0.0, 0.2),
-            text=parameters["texts"]["textToneListening"],
-        )
-        messageRecord.draw()
-
-        # Start recording trigger
-        parameters["oxiTask"].readInWaiting()
-        parameters["oxiTask"].channels["Channel_0"][-1] = 2  # Trigger
-
-        parameters["listenLogo"].draw()
-        parameters["win"].flip()
+                else:
+                    # Check for extreme heart rate values, if crosses theshold,
+                    # hold the task until resolved. Cutoff values determined in
+                    # parameters to correspond to biologically unlikely values.
+                    if not (
+                        (np.any(bpm < parameters["HRcutOff"][0]))
+                        or (np.any(bpm > parameters["HRcutOff"][1]))
+                    ):
+                        listenBPM = round(bpm.mean() * 2) / 2  # Round nearest .5
+                        break
+                    else:
+                        parameters["stimuli"].get("stayStill").draw()
+                        parameters["win"].flip()
+                        core.wait(2)
+
+        elif modality == "Extero":
+
+            ###########
+            # Recording
+            ###########
+            parameters["stimuli"].get("listenExtero").draw()
+
+            # Start recording trigger
+            parameters["oxiTask"].trigger(2)  # Trigger
+
+            parameters["listenLogo"].draw()
+            parameters["win"].flip()
 
-        startTrigger = time.time()
+            startTrigger = sessionClock.getTime()
 
-        # Random selection of HR frequency
-        listenBPM = np.random.choice(np.arange(40, 100, 0.5))
+            # Random selection of HR frequency, if not provided by the schedule
+            if listenBPM is None:
+                listenBPM = np.random.choice(np.arange(40, 100, 0.5))
 
-        # Play the corresponding beat file
-        listenFile = pkg_resources.resource_filename(
-            "cardioception.HRD", f"Sounds/{listenBPM}.wav"
-        )
-        print(f"...loading file (Listen): {listenFile}")
+            # Play selected BPM frequency (preloaded in the sound cache)
+            print(f"...playing sound (Listen): {listenBPM} BPM")
+            listenSound = parameters["soundCache"].get(listenBPM)
+            listenSound.play()
+            core.wait(5)
+            listenSound.stop()
 
-        # Play selected BPM frequency
-        listenSound = sound.Sound(listenFile)
-        listenSound.play()
-        core.wait(5)
-        listenSound.stop()
-
-    else:
-        raise ValueError("Invalid modality")
+        else:
+            raise ValueError("Invalid modality")
 
     # Fixation cross
-    fixation = visual.GratingStim(
-        win=parameters["win"], mask="cross", size=0.1, pos=[0, 0], sf=0
-    )
-    fixation.draw()
+    parameters["stimuli"].get("fixation").draw()
     parameters["win"].flip()
     core.wait(0.5)
 
@@ -551,13 +694,11 @@ def trial(
         responseBPM = 199.0
     else:
         responseBPM = listenBPM + alpha
-    responseFile = pkg_resources.resource_filename(
-        "cardioception.HRD", f"Sounds/{responseBPM}.wav"
-    )
-    print(f"...loading file (Response): {responseFile}")
+    print(f"...playing sound (Response): {responseBPM} BPM")
 
-    # Play selected BPM frequency
-    responseSound = sound.Sound(responseFile)
+    # Play selected BPM frequency (preloaded in the sound cache)
+    with tracer.span("soundLoad"):
+        responseSound = parameters["soundCache"].get(responseBPM)
     if modality == "Intero":
         parameters["heartLogo"].autoDraw = True
     elif modality == "Extero":
@@ -565,39 +706,36 @@ def trial(
     else:
         raise ValueError("Invalid modality provided")
     # Record participant response (+/-)
-    message = visual.TextStim(
-        parameters["win"],
-        height=parameters["textSize"],
-        pos=(0, 0.4),
-        text=parameters["texts"]["Decision"][modality],
-    )
+    message = parameters["stimuli"].get(f"decision{modality}")
     message.autoDraw = True
 
-    press = visual.TextStim(
-        parameters["win"],
-        height=parameters["textSize"],
-        text=parameters["texts"]["responseText"],
-        pos=(0.0, -0.4),
-    )
+    press = parameters["stimuli"].get("responseText")
     press.autoDraw = True
 
     # Sound trigger
-    parameters["oxiTask"].readInWaiting()
-    parameters["oxiTask"].channels["Channel_0"][-1] = 3
-    soundTrigger = time.time()
+    parameters["oxiTask"].trigger(3)
+    soundTrigger = sessionClock.getTime()
     parameters["win"].flip()
 
     #####################
     # Esimation Responses
     #####################
-    (
-        responseMadeTrigger,
-        responseTrigger,
-        respProvided,
-        decision,
-        decisionRT,
-        isCorrect,
-    ) = responseDecision(responseSound, parameters, feedback, condition)
+    backend.prompt(
+        "decision",
+        parameters,
+        modality=modality,
+        listenBPM=listenBPM,
+        responseBPM=responseBPM,
+    )
+    with tracer.span("decision"):
+        (
+            responseMadeTrigger,
+            responseTrigger,
+            respProvided,
+            decision,
+            decisionRT,
+            isCorrect,
+        ) = responseDecision(responseSound, parameters, feedback, condition)
     press.autoDraw = False
     message.autoDraw = False
     if modality == "Intero":
@@ -606,6 +744,12 @@ def trial(
         parameters["listenLogo"].autoDraw = False
     else:
         raise ValueError("Invalid modality provided")
+
+    # The decision is known, start the staircase update
+    if onDecision is not None:
+        with tracer.span("staircaseSubmit"):
+            onDecision(decision, listenBPM, alpha)
+
     ###################
     # Confidence Rating
     ###################
@@ -614,66 +758,57 @@ def trial(
     if (confidenceRating is True) & (respProvided is True):
 
         # Confidence rating start trigger
-        parameters["oxiTask"].readInWaiting()
-        parameters["oxiTask"].channels["Channel_0"][-1] = 4  # Trigger
+        parameters["oxiTask"].trigger(4)  # Trigger
 
         # Confidence rating scale
-        ratingStartTrigger: Optional[float] = time.time()
-        (
-            confidence,
-            confidenceRT,
-            ratingProvided,
-            ratingEndTrigger,
-        ) = confidenceRatingTask(parameters)
+        ratingStartTrigger: Optional[float] = sessionClock.getTime()
+        with tracer.span("confidence"):
+            (
+                confidence,
+                confidenceRT,
+                ratingProvided,
+                ratingEndTrigger,
+            ) = confidenceRatingTask(parameters)
     else:
         ratingStartTrigger, ratingEndTrigger = None, None
 
     # Confidence rating end trigger
-    parameters["oxiTask"].readInWaiting()
-    parameters["oxiTask"].channels["Channel_0"][-1] = 5
-    endTrigger = time.time()
+    parameters["oxiTask"].trigger(5)
+    endTrigger = sessionClock.getTime()
 
-    # Save PPG signal
+    # Save the raw PPG signal
     if nTrial is not None:  # Not during the tutorial
         if modality == "Intero":
-            this_df = None
-            # Save physio signal
-            this_df = pd.DataFrame(
-                {
-                    "signal": signal,
-                    "nTrial": pd.Series([nTrial] * len(signal), dtype="category"),
-                }
-            )
-
-            parameters["signal_df"] = pd.concat(
-                [parameters["signal_df"], this_df], ignore_index=True
-            )
-
-    return (
-        condition,
-        listenBPM,
-        responseBPM,
-        decision,
-        decisionRT,
-        confidence,
-        confidenceRT,
-        alpha,
-        isCorrect,
-        respProvided,
-        ratingProvided,
-        startTrigger,
-        soundTrigger,
-        responseMadeTrigger,
-        ratingStartTrigger,
-        ratingEndTrigger,
-        endTrigger,
+            with tracer.span("signalStore"):
+                parameters["signalStore"].append(nTrial, rawSignal)
+
+    return TrialRecord(
+        condition=condition,
+        listenBPM=listenBPM,
+        responseBPM=responseBPM,
+        decision=decision,
+        decisionRT=decisionRT,
+        confidence=confidence,
+        confidenceRT=confidenceRT,
+        alpha=alpha,
+        isCorrect=isCorrect,
+        respProvided=respProvided,
+        ratingProvided=ratingProvided,
+        startTrigger=startTrigger,
+        soundTrigger=soundTrigger,
+        responseMadeTrigger=responseMadeTrigger,
+        ratingStartTrigger=ratingStartTrigger,
+        ratingEndTrigger=ratingEndTrigger,
+        endTrigger=endTrigger,
     )
 
 
 def waitInput(parameters: dict):
     """Wait for participant input before continue"""
 
-    from psychopy import core, event
+    backend = getBackend(parameters)
+    core, event = backend.core, backend.event
+    backend.prompt("start", parameters)
 
     if parameters["device"] == "keyboard":
         while True:
@@ -707,7 +842,18 @@ def tutorial(parameters: dict):
 
     """
 
-    from psychopy import core, event, visual
+    backend = getBackend(parameters)
+    core, event, visual = backend.core, backend.event, backend.visual
+
+    # Plan the tutorial trials from the session seed
+    schedule = parameters["tutorialSchedule"] = compileTutorial(
+        nFeedback=parameters["nFeedback"],
+        nConfidence=parameters["nConfidence"],
+        exteroception=parameters["ExteroCondition"],
+        isi=parameters["isi"],
+        seed=parameters["seed"],
+    )
+    parameters["soundCache"].prefetch(schedule.bpms())
 
     # Introduction
     intro = visual.TextStim(
@@ -784,6 +930,7 @@ def tutorial(parameters: dict):
 
     # Record number
     nFinger = ""
+    backend.prompt("finger", parameters)
     while True:
         # Record new key
         key = event.waitKeys(
@@ -855,18 +1002,16 @@ def tutorial(parameters: dict):
 
     # Run training trials with feedback
     parameters["oxiTask"].setup().read(duration=2)
-    for i in range(parameters["nFeedback"]):
-
-        # Ramdom selection of condition
-        condition = np.random.choice(["More", "Less"])
-        alpha = -20.0 if condition == "Less" else 20.0
+    for i in schedule.trials("Intero", "Feedback"):
 
+        # Ramdom selection of condition (precomputed in the schedule)
         _ = trial(
             parameters,
-            alpha,
+            schedule.alpha[i],
             "Intero",
             feedback=True,
             confidenceRating=False,
+            isi=schedule.isi[i],
         )
 
     # If extero conditions required, show tutorial.
@@ -900,18 +1045,17 @@ def tutorial(parameters: dict):
 
         # Run 10 training trials with feedback
         parameters["oxiTask"].setup().read(duration=2)
-        for i in range(parameters["nFeedback"]):
-
-            # Ramdom selection of condition
-            condition = np.random.choice(["More", "Less"])
-            alpha = -20.0 if condition == "Less" else 20.0
+        for i in schedule.trials("Extero", "Feedback"):
 
+            # Ramdom selection of condition (precomputed in the schedule)
             _ = trial(
                 parameters,
-                alpha,
+                schedule.alpha[i],
                 "Extero",
                 feedback=True,
                 confidenceRating=False,
+                isi=schedule.isi[i],
+                listenBPM=schedule.exteroBPM[i],
             )
 
     ###################
@@ -932,26 +1076,26 @@ def tutorial(parameters: dict):
     parameters["oxiTask"].setup().read(duration=2)
 
     # Run n training trials with confidence rating
-    for i in range(parameters["nConfidence"]):
-        modality = "Intero"
-        condition = np.random.choice(["More", "Less"])
-        stim_intense = np.random.choice(np.array([1, 10, 30]))
-        alpha = -stim_intense if condition == "Less" else stim_intense
-        _ = trial(parameters, alpha, modality, confidenceRating=True)
+    for i in schedule.trials("Intero", "Confidence"):
+        _ = trial(
+            parameters,
+            schedule.alpha[i],
+            "Intero",
+            confidenceRating=True,
+            isi=schedule.isi[i],
+        )
 
     # If extero conditions required, show tutorial.
     if parameters["ExteroCondition"] is True:
         # Run n training trials with confidence rating
-        for i in range(parameters["nConfidence"]):
-            modality = "Extero"
-            condition = np.random.choice(["More", "Less"])
-            stim_intense = np.random.choice(np.array([1, 10, 30]))
-            alpha = -stim_intense if condition == "Less" else stim_intense
+        for i in schedule.trials("Extero", "Confidence"):
             _ = trial(
                 parameters,
-                alpha,
-                modality,
+                schedule.alpha[i],
+                "Extero",
                 confidenceRating=True,
+                isi=schedule.isi[i],
+                listenBPM=schedule.exteroBPM[i],
             )
 
     #################
@@ -1020,34 +1164,34 @@ def responseDecision(
 
     """
 
-    from psychopy import core, event, visual
+    backend = getBackend(parameters)
+    core, event, sessionClock = backend.core, backend.event, backend.clock
+    tracer = getTracer(parameters)
 
     print("...starting decision phase.")
 
     decision, decisionRT, isCorrect = None, None, None
-    responseTrigger = time.time()
+    responseTrigger = sessionClock.getTime()
 
     if parameters["device"] == "keyboard":
-        this_hr.play()
-        clock = core.Clock()
-        responseKey = event.waitKeys(
-            keyList=parameters["allowedKeys"],
-            maxWait=parameters["respMax"],
-            timeStamped=clock,
-        )
-        this_hr.stop()
+        with tracer.span("response"):
+            this_hr.play()
+            clock = core.Clock()
+            responseKey = event.waitKeys(
+                keyList=parameters["allowedKeys"],
+                maxWait=parameters["respMax"],
+                timeStamped=clock,
+            )
+            this_hr.stop()
 
-        responseMadeTrigger = time.time()
+        responseMadeTrigger = sessionClock.getTime()
 
         # Check for response provided by the participant
         if not responseKey:
             respProvided = False
             decision, decisionRT = None, None
             # Record participant response (+/-)
-            message = visual.TextStim(
-                parameters["win"], height=parameters["textSize"], text=parameters["texts"]["tooLate"]
-            )
-            message.draw()
+            parameters["stimuli"].get("tooLate").draw()
             parameters["win"].flip()
             core.wait(1)
         else:
@@ -1065,130 +1209,89 @@ def responseDecision(
             else:
                 isCorrect = True if (decision == condition) else False
 
-            # Read oximeter
-            parameters["oxiTask"].readInWaiting()
-
             # Feedback
-            if feedback is True:
-                if isCorrect is False:
-                    acc = visual.TextStim(
-                        parameters["win"],
-                        height=parameters["textSize"],
-                        color="red",
-                        text="False",
-                    )
-                    acc.draw()
-                    parameters["win"].flip()
-                    core.wait(2)
-                elif isCorrect is True:
-                    acc = visual.TextStim(
-                        parameters["win"],
-                        height=parameters["textSize"],
-                        color="green",
-                        text="Correct",
-                    )
-                    acc.draw()
-                    parameters["win"].flip()
-                    core.wait(2)
+            with tracer.span("feedback"):
+                if feedback is True:
+                    if isCorrect is False:
+                        parameters["stimuli"].get("incorrect").draw()
+                        parameters["win"].flip()
+                        core.wait(2)
+                    elif isCorrect is True:
+                        parameters["stimuli"].get("correct").draw()
+                        parameters["win"].flip()
+                        core.wait(2)
 
     if parameters["device"] == "mouse":
 
         # Initialise response feedback
-        slower = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            color="white",
-            text=parameters["texts"]["slower"],
-            pos=(-0.2, 0.2),
-        )
-        faster = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            color="white",
-            text=parameters["texts"]["faster"],
-            pos=(0.2, 0.2),
-        )
+        slower = parameters["stimuli"].get("slower", color="white")
+        faster = parameters["stimuli"].get("faster", color="white")
         slower.draw()
         faster.draw()
         parameters["win"].flip()
 
-        this_hr.play()
-        clock = core.Clock()
-        clock.reset()
-        parameters["myMouse"].clickReset()
-        buttons, decisionRT = parameters["myMouse"].getPressed(getTime=True)
-        while True:
+        with tracer.span("response"), recordFrames(parameters, "decision"):
+            this_hr.play()
+            clock = core.Clock()
+            clock.reset()
+            parameters["myMouse"].clickReset()
             buttons, decisionRT = parameters["myMouse"].getPressed(getTime=True)
-            trialdur = clock.getTime()
-            parameters["oxiTask"].readInWaiting()
-            if buttons == [1, 0, 0]:
-                decisionRT = decisionRT[0]
-                decision, respProvided = "Less", True
-                slower.color = "blue"
-                slower.draw()
-                parameters["win"].flip()
+            while True:
+                buttons, decisionRT = parameters["myMouse"].getPressed(getTime=True)
+                trialdur = clock.getTime()
+                if buttons == [1, 0, 0]:
+                    decisionRT = decisionRT[0]
+                    decision, respProvided = "Less", True
+                    parameters["stimuli"].get("slower", color="blue")
+                    slower.draw()
+                    parameters["win"].flip()
 
-                # Show feedback for .5 seconds if enough time
-                remain = parameters["respMax"] - trialdur
-                pauseFeedback = 0.5 if (remain > 0.5) else remain
-                core.wait(pauseFeedback)
-                break
-            elif buttons == [0, 0, 1]:
-                decisionRT = decisionRT[-1]
-                decision, respProvided = "More", True
-                faster.color = "blue"
-                faster.draw()
-                parameters["win"].flip()
+                    # Show feedback for .5 seconds if enough time
+                    remain = parameters["respMax"] - trialdur
+                    pauseFeedback = 0.5 if (remain > 0.5) else remain
+                    core.wait(pauseFeedback)
+                    break
+                elif buttons == [0, 0, 1]:
+                    decisionRT = decisionRT[-1]
+                    decision, respProvided = "More", True
+                    parameters["stimuli"].get("faster", color="blue")
+                    faster.draw()
+                    parameters["win"].flip()
 
-                # Show feedback for .5 seconds if enough time
-                remain = parameters["respMax"] - trialdur
-                pauseFeedback = 0.5 if (remain > 0.5) else remain
-                core.wait(pauseFeedback)
-                break
-            elif trialdur > parameters["respMax"]:  # if too long
-                respProvided = False
-                decisionRT = None
-                break
-            else:
-                slower.draw()
-                faster.draw()
-                parameters["win"].flip()
-        responseMadeTrigger = time.time()
+                    # Show feedback for .5 seconds if enough time
+                    remain = parameters["respMax"] - trialdur
+                    pauseFeedback = 0.5 if (remain > 0.5) else remain
+                    core.wait(pauseFeedback)
+                    break
+                elif trialdur > parameters["respMax"]:  # if too long
+                    respProvided = False
+                    decisionRT = None
+                    break
+                else:
+                    slower.draw()
+                    faster.draw()
+                    parameters["win"].flip()
+        responseMadeTrigger = sessionClock.getTime()
         this_hr.stop()
 
         # Check for response provided by the participant
         if respProvided is False:
             # Record participant response (+/-)
-            message = visual.TextStim(
-                parameters["win"],
-                height=parameters["textSize"],
-                text=parameters["texts"]["tooLate"],
-                color="red",
-                pos=(0.0, -0.2),
-            )
-            message.draw()
+            parameters["stimuli"].get("tooLate").draw()
             parameters["win"].flip()
             core.wait(0.5)
         else:
             # Is the answer Correct?
             isCorrect = True if (decision == condition) else False
             # Feedback
-            if feedback is True:
-                if isCorrect == 0:
-                    textFeedback = parameters["texts"]["incorrectResponse"]
-                else:
-                    textFeedback = parameters["texts"]["correctResponse"]
-                colorFeedback = "red" if isCorrect == 0 else "green"
-                acc = visual.TextStim(
-                    parameters["win"],
-                    height=parameters["textSize"],
-                    pos=(0.0, -0.2),
-                    color=colorFeedback,
-                    text=textFeedback,
-                )
-                acc.draw()
-                parameters["win"].flip()
-                core.wait(1)
+            with tracer.span("feedback"):
+                if feedback is True:
+                    acc = parameters["stimuli"].get(
+                        "incorrect" if isCorrect == 0 else "correct"
+                    )
+                    acc.draw()
+                    parameters["win"].flip()
+                    core.wait(1)
 
     return (
         responseMadeTrigger,
@@ -1212,7 +1315,9 @@ def confidenceRatingTask(
 
     """
 
-    from psychopy import core, visual
+    backend = getBackend(parameters)
+    core, sessionClock = backend.core, backend.clock
+    tracer = getTracer(parameters)
 
     print("...starting confidence rating.")
 
@@ -1221,37 +1326,29 @@ def confidenceRatingTask(
 
     if parameters["device"] == "keyboard":
 
-        markerStart = np.random.choice(
-            np.arange(parameters["confScale"][0], parameters["confScale"][1])
-        )
-        ratingScale = visual.RatingScale(
-            parameters["win"],
-            low=parameters["confScale"][0],
-            high=parameters["confScale"][1],
-            noMouse=True,
-            labels=parameters["labelsRating"],
-            acceptKeys="down",
-            markerStart=markerStart,
-        )
-
-        message = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            text=parameters["texts"]["Confidence"],
-        )
-
-        # Wait for response
-        ratingProvided = False
-        clock = core.Clock()
-        while clock.getTime() < parameters["maxRatingTime"]:
-            if not ratingScale.noResponse:
-                ratingScale.markerColor = (0, 0, 1)
-                if clock.getTime() > parameters["minRatingTime"]:
-                    ratingProvided = True
-                    break
-            ratingScale.draw()
-            message.draw()
-            parameters["win"].flip()
+        with tracer.span("ratingSetup"):
+            markerStart = np.random.choice(
+                np.arange(parameters["confScale"][0], parameters["confScale"][1])
+            )
+            ratingScale = parameters["stimuli"].reset(
+                "ratingScale", markerStart=markerStart
+            )
+        backend.prompt("confidence", parameters, scale=ratingScale)
+        message = parameters["stimuli"].get("confidence")
+
+        with tracer.span("rating"), recordFrames(parameters, "rating"):
+            # Wait for response
+            ratingProvided = False
+            clock = core.Clock()
+            while clock.getTime() < parameters["maxRatingTime"]:
+                if not ratingScale.noResponse:
+                    ratingScale.markerColor = (0, 0, 1)
+                    if clock.getTime() > parameters["minRatingTime"]:
+                        ratingProvided = True
+                        break
+                ratingScale.draw()
+                message.draw()
+                parameters["win"].flip()
 
         confidence = ratingScale.getRating()
         confidenceRT = ratingScale.getRT()
@@ -1262,96 +1359,75 @@ def confidenceRatingTask(
         # The mouse movement is limited to a rectangle above the Slider
         # To avoid being dragged out of the screen (in case of multi screens)
         # and to avoid interferences with the Slider when clicking.
-        parameters["win"].mouseVisible = False
-        parameters["myMouse"].setPos((np.random.uniform(-0.25, 0.25), 0.2))
-        parameters["myMouse"].clickReset()
-        message = visual.TextStim(
-            parameters["win"],
-            height=parameters["textSize"],
-            pos=(0, 0.2),
-            text=parameters["texts"]["Confidence"],
-        )
-        slider = visual.Slider(
-            win=parameters["win"],
-            name="slider",
-            pos=(0, -0.2),
-            size=(0.7, 0.1),
-            labels=parameters["texts"]["VASlabels"],
-            granularity=1,
-            ticks=(0, 100),
-            style=("rating"),
-            color="LightGray",
-            flip=False,
-            labelHeight=0.1 * 0.6,
-        )
-        slider.marker.size = (0.03, 0.03)
-        clock = core.Clock()
-        parameters["myMouse"].clickReset()
-        buttons, confidenceRT = parameters["myMouse"].getPressed(getTime=True)
-
-        while True:
+        with tracer.span("ratingSetup"):
             parameters["win"].mouseVisible = False
-            trialdur = clock.getTime()
+            parameters["myMouse"].setPos((np.random.uniform(-0.25, 0.25), 0.2))
+            parameters["myMouse"].clickReset()
+            message = parameters["stimuli"].get("confidence")
+            slider = parameters["stimuli"].reset("slider")
+            slider.marker.color = "red"  # Default marker color of the 'rating' style
+        backend.prompt("confidence", parameters, scale=slider)
+        with tracer.span("rating"), recordFrames(parameters, "rating"):
+            clock = core.Clock()
+            parameters["myMouse"].clickReset()
             buttons, confidenceRT = parameters["myMouse"].getPressed(getTime=True)
 
-            # Mouse position (keep in in the rectangle)
-            newPos = parameters["myMouse"].getPos()
-            if newPos[0] < -0.5:
-                newX = -0.5
-            elif newPos[0] > 0.5:
-                newX = 0.5
-            else:
-                newX = newPos[0]
-            if newPos[1] < 0.1:
-                newY = 0.1
-            elif newPos[1] > 0.3:
-                newY = 0.3
-            else:
-                newY = newPos[1]
-            parameters["myMouse"].setPos((newX, newY))
-
-            # Update marker position in Slider
-            p = newX / 0.5
-            slider.markerPos = 50 + (p * 50)
-
-            # Check if response provided
-            if (buttons == [1, 0, 0]) & (trialdur > parameters["minRatingTime"]):
-                confidence, confidenceRT, ratingProvided = (
-                    slider.markerPos,
-                    clock.getTime(),
-                    True,
-                )
-                print(
-                    f"... Confidence level: {confidence}"
-                    + f" with response time {round(confidenceRT, 2)} seconds"
-                )
-                # Change marker color after response provided
-                slider.marker.color = "green"
+            while True:
+                parameters["win"].mouseVisible = False
+                trialdur = clock.getTime()
+                buttons, confidenceRT = parameters["myMouse"].getPressed(getTime=True)
+
+                # Mouse position (keep in in the rectangle)
+                newPos = parameters["myMouse"].getPos()
+                if newPos[0] < -0.5:
+                    newX = -0.5
+                elif newPos[0] > 0.5:
+                    newX = 0.5
+                else:
+                    newX = newPos[0]
+                if newPos[1] < 0.1:
+                    newY = 0.1
+                elif newPos[1] > 0.3:
+                    newY = 0.3
+                else:
+                    newY = newPos[1]
+                parameters["myMouse"].setPos((newX, newY))
+
+                # Update marker position in Slider
+                p = newX / 0.5
+                slider.markerPos = 50 + (p * 50)
+
+                # Check if response provided
+                if (buttons == [1, 0, 0]) & (trialdur > parameters["minRatingTime"]):
+                    confidence, confidenceRT, ratingProvided = (
+                        slider.markerPos,
+                        clock.getTime(),
+                        True,
+                    )
+                    print(
+                        f"... Confidence level: {confidence}"
+                        + f" with response time {round(confidenceRT, 2)} seconds"
+                    )
+                    # Change marker color after response provided
+                    slider.marker.color = "green"
+                    slider.draw()
+                    message.draw()
+                    parameters["win"].flip()
+                    core.wait(0.2)
+                    break
+                elif trialdur > parameters["maxRatingTime"]:  # if too long
+                    ratingProvided = False
+                    confidenceRT = parameters["myMouse"].clickReset()
+
+                    # Text feedback if no rating provided
+                    parameters["stimuli"].get("tooLate").draw()
+                    parameters["win"].flip()
+                    core.wait(0.5)
+                    break
                 slider.draw()
                 message.draw()
                 parameters["win"].flip()
-                core.wait(0.2)
-                break
-            elif trialdur > parameters["maxRatingTime"]:  # if too long
-                ratingProvided = False
-                confidenceRT = parameters["myMouse"].clickReset()
-
-                # Text feedback if no rating provided
-                message = visual.TextStim(
-                    parameters["win"],
-                    height=parameters["textSize"],
-                    text=parameters["texts"]["tooLate"],
-                    color="red",
-                    pos=(0.0, -0.2),
-                )
-                message.draw()
-                parameters["win"].flip()
-                core.wait(0.5)
-                break
-            slider.draw()
-            message.draw()
-            parameters["win"].flip()
-    ratingEndTrigger = time.time()
+    ratingEndTrigger = sessionClock.getTime()
     parameters["win"].flip()
 
     return confidence, confidenceRT, ratingProvided, ratingEndTrigger
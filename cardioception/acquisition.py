@@ -0,0 +1,398 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from cardioception.clock import SessionClock, VirtualClock
+from cardioception.storage import RecordingStore
+
+
+class AcquisitionService:
+    """Record the pulse oximeter continuously in a background thread.
+
+    The service owns a :py:class:`systole.recording.Oximeter` instance and drains the
+    serial port in a dedicated thread, so the samples keep being read while the task
+    is waiting for a response, showing a break screen or rendering. The most recent
+    samples are also copied to a fixed-size ring buffer from which trailing windows
+    can be read at any time. The task code only needs to post event markers with
+    :py:meth:`trigger` and to read the signal with :py:meth:`window`.
+
+    If `spillFile` is provided, the recording is kept in memory only for the last
+    `keepLength` seconds. The older samples (signal, peaks, instantaneous RR and stim
+    channels) are moved from the oximeter lists to a
+    :py:class:`cardioception.storage.RecordingStore` in chunks of `chunkLength`
+    seconds, so the memory usage stays the same however long the recording is.
+    :py:meth:`save` then writes the full recording, reading the stored samples chunk
+    by chunk.
+
+    The methods of the oximeter used by the tasks (`setup()`, `read()`,
+    `readInWaiting()`, `save()` and `waitBeat()`) are available with the same
+    behavior, and the other attributes (e.g. `recording` or `channels`) are read
+    from the oximeter.
+
+    The waits of :py:meth:`read` and :py:meth:`waitBeat` and the statistics use
+    the session `clock`. With an accelerated or simulated clock, the oximeter
+    should read a port following the same clock (e.g.
+    :py:class:`cardioception.sources.SignalSerial`).
+
+    Parameters
+    ----------
+    oximeter : :py:class:`systole.recording.Oximeter`
+        The oximeter instance. It should not be used directly once the service has
+        started.
+    bufferLength : float
+        The length of the ring buffer (seconds). Defaults to `60`.
+    pollInterval : float
+        The time between two reads of the serial port (seconds). Defaults to
+        `0.005`.
+    start : bool
+        If `True` (default), start the acquisition thread immediately.
+    spillFile : str | None
+        Path to the binary file where the samples older than `keepLength` are
+        written. If `None` (default), the full recording is kept in memory.
+    keepLength : float
+        The length of the recording kept in memory when `spillFile` is provided
+        (seconds). Defaults to `30`.
+    chunkLength : float
+        The length of the chunks written to `spillFile` (seconds). Defaults to `10`.
+    clock : :py:class:`cardioception.clock.SessionClock` | \
+        :py:class:`cardioception.clock.VirtualClock` | None
+        The session clock. Defaults to a real time clock.
+
+    Attributes
+    ----------
+    spilled : int
+        The number of samples moved to `spillFile` since the last call to
+        :py:meth:`setup`. The index of a sample in the full recording is its index in
+        `recording` plus `spilled`.
+
+    Examples
+    --------
+    >>> oxiTask = AcquisitionService(Oximeter(serial=serialSim(), add_channels=1))
+    >>> oxiTask.setup().read(duration=5.0)
+    >>> oxiTask.trigger(2)  # Event marker on the last sample
+    >>> signal = oxiTask.window(6.0)  # Last 6 seconds of signal
+    >>> oxiTask.stats()["dropped"]
+    0
+
+    """
+
+    def __init__(
+        self,
+        oximeter,
+        bufferLength: float = 60.0,
+        pollInterval: float = 0.005,
+        start: bool = True,
+        spillFile: Optional[str] = None,
+        keepLength: float = 30.0,
+        chunkLength: float = 10.0,
+        clock: Optional[Union[SessionClock, VirtualClock]] = None,
+    ):
+        self.oximeter = oximeter
+        self.clock = SessionClock() if clock is None else clock
+        self.sfreq = oximeter.sfreq
+        self.pollInterval = pollInterval
+        self.keepLength = keepLength
+        self.chunkLength = chunkLength
+        self.spilled = 0
+        self.store: Optional[RecordingStore] = None
+        if spillFile is not None:
+            self.store = RecordingStore(
+                spillFile,
+                sfreq=self.sfreq,
+                nChannels=len(oximeter.channels) if oximeter.channels else 0,
+            )
+        self._lock = threading.RLock()
+        self._buffer = np.zeros(max(int(bufferLength * self.sfreq), 1))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._resetBuffer()
+        if start is True:
+            self.start()
+
+    def __getattr__(self, name):
+        # Only called for the attributes not defined by the service
+        return getattr(self.__dict__["oximeter"], name)
+
+    def _resetBuffer(self) -> None:
+        """Clear the ring buffer and the counters (after `Oximeter.setup()`)."""
+        self.nSamples = 0  # Total number of samples written to the ring buffer
+        self._copied = len(self.oximeter.recording)
+        self._startTime = self.clock.getTime()
+        self._startSamples = self._copied
+        self._lastRead = self._startTime
+        self._stopTime: Optional[float] = None
+        self._latencies: Dict[str, float] = {"n": 0, "sum": 0.0, "max": 0.0}
+        self._highWater = 0
+
+    def start(self):
+        """Start the acquisition thread."""
+        if (self._thread is None) or (not self._thread.is_alive()):
+            self._stop.clear()
+            self._stopTime = None
+            self._thread = threading.Thread(
+                target=self._run, name="AcquisitionService", daemon=True
+            )
+            self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Stop the acquisition thread and read the remaining samples."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._drain()
+        self._stopTime = self.clock.getTime()
+
+        return self
+
+    def close(self):
+        """Stop the acquisition thread and delete `spillFile`.
+
+        The recording should be saved before, using :py:meth:`save`.
+        """
+        self.stop()
+        if self.store is not None:
+            self.store.close()
+            os.remove(self.store.fileName)
+            self.store = None
+
+        return self
+
+    def _run(self):
+        # The port is polled in real time, whatever the speed of the session clock
+        while not self._stop.is_set():
+            self._drain()
+            time.sleep(self.pollInterval)
+
+    def _drain(self):
+        """Read the samples waiting in the serial port and update the ring buffer."""
+        with self._lock:
+            now = self.clock.getTime()
+            latency = now - self._lastRead
+            self._lastRead = now
+            self._latencies["n"] += 1
+            self._latencies["sum"] += latency
+            self._latencies["max"] = max(self._latencies["max"], latency)
+            self._highWater = max(self._highWater, self.oximeter.serial.inWaiting())
+
+            self.oximeter.readInWaiting()
+
+            # Copy the new samples to the ring buffer
+            recording = self.oximeter.recording
+            if len(recording) < self._copied:  # The oximeter was reset
+                self._resetBuffer()
+            new = np.asarray(recording[self._copied :], dtype=float)  # noqa
+            self._copied = len(recording)
+            new = new[-len(self._buffer) :]  # noqa
+            idx = (self.nSamples + np.arange(len(new))) % len(self._buffer)
+            self._buffer[idx] = new
+            self.nSamples += len(new)
+
+            if self.store is not None:
+                self._spill()
+
+    def _spill(self):
+        """Move the samples older than `keepLength` to the recording store."""
+        chunk = max(int(self.chunkLength * self.sfreq), 1)
+        keep = int(self.keepLength * self.sfreq)
+        while len(self.oximeter.recording) >= keep + chunk:
+            self.store.append(self._columns(chunk))
+            for values in self._lists():
+                del values[:chunk]
+            self._copied -= chunk
+            self.spilled += chunk
+
+    def _lists(self) -> List[list]:
+        """The oximeter lists that grow with the recording."""
+        oxi = self.oximeter
+        lists = [oxi.recording, oxi.peaks, oxi.instant_rr, oxi.times]
+        lists += [oxi.threshold, oxi.diff]
+
+        return lists + list(oxi.channels.values()) if oxi.channels else lists
+
+    def _columns(self, n: Optional[int] = None) -> np.ndarray:
+        """The first `n` samples in memory, in the :py:class:`RecordingStore` layout.
+
+        The time is computed from the index of the samples in the full recording.
+        """
+        oxi = self.oximeter
+        n = len(oxi.recording) if n is None else n
+        columns = [
+            oxi.recording[:n],
+            oxi.peaks[:n],
+            oxi.instant_rr[:n],
+            (self.spilled + np.arange(n)) / self.sfreq,
+        ]
+        if oxi.channels:
+            columns += [values[:n] for values in oxi.channels.values()]
+
+        return np.array(columns, dtype=float).T
+
+    def setup(self, *args, **kwargs):
+        """Reset the recording (see `Oximeter.setup()`).
+
+        If the clock is not real time, the signal recorded after the setup is read
+        on the session clock.
+        """
+        readDuration = 0.0
+        if not self.clock.realTime:
+            readDuration = kwargs.pop("read_duration", args[0] if args else 1.0)
+            args, kwargs["read_duration"] = args[1:], 0.0
+        with self._lock:
+            self.oximeter.setup(*args, **kwargs)
+            if self.store is not None:
+                self.store.reset()
+            self.spilled = 0
+            self._resetBuffer()
+        if readDuration > 0:
+            self.read(duration=readDuration)
+            if kwargs.get("clear_peaks", True) is True:
+                with self._lock:
+                    self.oximeter.peaks[:] = [0] * len(self.oximeter.peaks)
+
+        return self
+
+    def read(self, duration: float):
+        """Wait while recording for some amount of time.
+
+        Parameters
+        ----------
+        duration : float
+            Length of the desired recording time (seconds).
+        """
+        if (self._thread is not None) and self._thread.is_alive():
+            self.clock.wait(duration)
+        elif self.clock.realTime:
+            with self._lock:
+                self.oximeter.read(duration=duration)
+        else:
+            end = self.clock.getTime() + duration
+            while self.clock.getTime() < end:
+                self._drain()
+                self.clock.wait(min(self.pollInterval, end - self.clock.getTime()))
+        self._drain()
+
+        return self
+
+    def readInWaiting(self, *args, **kwargs):
+        """Read the samples waiting in the serial port."""
+        self._drain()
+
+        return self
+
+    def trigger(self, code: int, channel: str = "Channel_0"):
+        """Add an event marker on the last sample of the recording.
+
+        Parameters
+        ----------
+        code : int
+            The trigger value.
+        channel : str
+            The trigger channel. Defaults to `"Channel_0"`.
+        """
+        with self._lock:
+            self._drain()
+            if self.oximeter.channels[channel]:
+                self.oximeter.channels[channel][-1] = code
+
+        return self
+
+    def window(self, duration: float) -> np.ndarray:
+        """The last samples of the signal.
+
+        Parameters
+        ----------
+        duration : float
+            The length of the window (seconds). It cannot be longer than the ring
+            buffer.
+
+        Returns
+        -------
+        signal : np.ndarray
+            The most recent samples.
+        """
+        with self._lock:
+            n = min(int(duration * self.sfreq), self.nSamples, len(self._buffer))
+            idx: np.ndarray = (self.nSamples - n + np.arange(n)) % len(self._buffer)
+            return self._buffer[idx].copy()
+
+    def samples(self) -> Tuple[np.ndarray, int]:
+        """The signal kept in memory and its position in the full recording.
+
+        Returns
+        -------
+        recording : np.ndarray
+            A copy of `Oximeter.recording`.
+        offset : int
+            The index of the first sample in the full recording (:py:attr:`spilled`).
+        """
+        with self._lock:
+            self._drain()
+            return np.array(self.oximeter.recording, dtype=float), self.spilled
+
+    def save(self, fname: str):
+        """Save the recording (see `Oximeter.save()`).
+
+        When the older samples are written to `spillFile`, they are saved with the
+        samples kept in memory and the time is counted from the start of the
+        recording.
+        """
+        with self._lock:
+            self._drain()
+            if self.store is None:
+                self.oximeter.save(fname)
+            else:
+                self.store.export(fname, tail=self._columns())
+
+        return self
+
+    def waitBeat(self):
+        """Wait until a new heartbeat is detected."""
+        with self._lock:
+            self._drain()
+            start = self.spilled + len(self.oximeter.peaks)
+        while True:
+            with self._lock:
+                self._drain()
+                if any(self.oximeter.peaks[max(start - self.spilled, 0) :]):  # noqa
+                    break  # Peak found
+            self.clock.wait(self.pollInterval)
+
+        return self
+
+    def stats(self) -> Dict[str, float]:
+        """Acquisition statistics since the last call to :py:meth:`setup`.
+
+        Returns
+        -------
+        stats : dict
+            * `"samples"`: the number of samples received.
+            * `"dropped"`: the number of samples missing, from the elapsed time and
+              the sampling frequency.
+            * `"meanLatency"`, `"maxLatency"`: the mean and maximum time between two
+              reads of the serial port (seconds).
+            * `"highWater"`: the largest number of bytes waiting in the serial port
+              before a read.
+            * `"spilled"`: the number of samples moved to `spillFile`.
+        """
+        with self._lock:
+            received = self.spilled + len(self.oximeter.recording) - self._startSamples
+            end = self.clock.getTime() if self._stopTime is None else self._stopTime
+            expected = (end - self._startTime) * self.sfreq
+            n = self._latencies["n"]
+            return {
+                "samples": received,
+                "dropped": max(int(expected - received - self.sfreq * 0.1), 0),
+                "meanLatency": self._latencies["sum"] / n if n else 0.0,
+                "maxLatency": self._latencies["max"],
+                "highWater": self._highWater,
+                "spilled": self.spilled,
+            }
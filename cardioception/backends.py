@@ -0,0 +1,599 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import functools
+import importlib
+from collections import deque
+from typing import Any, Deque, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from cardioception.clock import SessionClock, VirtualClock
+
+AnyClock = Union[SessionClock, VirtualClock]
+
+# Index of the mouse buttons in `Mouse.getPressed()`
+MOUSE_BUTTONS = {"left": 0, "middle": 1, "right": 2}
+
+
+class CountingVisual:
+    """Proxy of a `visual` module counting the stimuli constructed through it.
+
+    The constructors (the attributes starting with an uppercase letter, e.g.
+    `TextStim`) are wrapped so that each call is counted, whether the stimulus is
+    created by :py:class:`cardioception.stimuli.StimulusRegistry` or directly by
+    the task code. The other attributes are returned unchanged.
+
+    Parameters
+    ----------
+    module : module | object
+        The visual module (:py:mod:`psychopy.visual` or :py:class:`HeadlessVisual`).
+
+    Attributes
+    ----------
+    created : int
+        The total number of stimuli constructed.
+    """
+
+    def __init__(self, module):
+        self._module = module
+        self.created = 0
+        self._counted = 0
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._module, name)
+        if not (name[:1].isupper() and callable(attr)):
+            return attr
+
+        @functools.wraps(attr)
+        def construct(*args, **kwargs):
+            self.created += 1
+            return attr(*args, **kwargs)
+
+        setattr(self, name, construct)
+        return construct
+
+    def countCreated(self) -> int:
+        """Number of stimuli constructed since the last call to this method."""
+        count = self.created - self._counted
+        self._counted = self.created
+
+        return count
+
+
+class PsychopyBackend:
+    """Display, audio, input and timing through PsychoPy (default backend).
+
+    The `core`, `event`, `visual` and `sound` attributes are the PsychoPy modules.
+    They are imported when first used, so PsychoPy is only required when the task
+    actually runs with this backend. The `visual` module is wrapped in
+    :py:class:`CountingVisual`. The session runs in real time
+    (:py:class:`cardioception.clock.SessionClock`).
+    """
+
+    name = "psychopy"
+
+    def __init__(self):
+        self.clock = SessionClock()
+
+    def prompt(self, phase: str, parameters: dict, **info):
+        """Announce a response phase of the task (ignored, the participant answers)."""
+
+    def __getattr__(self, name: str):
+        if name in ["core", "event", "visual", "sound"]:
+            module: Any = importlib.import_module(f"psychopy.{name}")
+            if name == "visual":
+                module = CountingVisual(module)
+            setattr(self, name, module)
+            return module
+        raise AttributeError(name)
+
+
+class ScriptedInput:
+    """Key presses and mouse clicks delivered on the simulated time line.
+
+    Each event is a tuple `(name, delay)` or `(name, delay, pos)`, where `name` is
+    a key name (e.g. `"space"`, `"right"` for the keyboard) or a mouse button
+    (`"mouse_left"`, `"mouse_middle"` or `"mouse_right"`), and `delay` is the
+    response time (seconds), counted from the moment the task starts checking
+    continuously for this type of input. A check following a pause longer than
+    `resetGap` (e.g. the single check for the escape key at the beginning of a
+    trial) starts the count again. `pos` optionally moves the mouse when the button
+    is pressed.
+
+    If the events have a `respond(phase, parameters, **info)` method (e.g.
+    :py:class:`cardioception.participant.VirtualParticipant`), it is called each time
+    the task announces a response phase with :py:meth:`prompt`, and the events it
+    returns replace the ones that were not delivered yet.
+
+    Parameters
+    ----------
+    clock : :py:class:`cardioception.clock.VirtualClock` | \
+        :py:class:`cardioception.clock.SessionClock`
+        The clock of the session.
+    events : iterable
+        The events, in order. Can be a generator (e.g. a simulated participant).
+    pollInterval : float
+        The time spent by each check of the keyboard or of the mouse (seconds).
+    idleTimeout : float
+        Raise a `RuntimeError` if the events are exhausted and the task has been
+        waiting for an input for this long (simulated seconds), instead of waiting
+        forever.
+    resetGap : float
+        The pause between two checks (simulated seconds) after which the response
+        time is counted again. Defaults to `0.1`.
+
+    """
+
+    def __init__(
+        self,
+        clock: AnyClock,
+        events: Iterable = (),
+        pollInterval: float = 0.001,
+        idleTimeout: float = 600.0,
+        resetGap: float = 0.1,
+    ):
+        self.clock = clock
+        self.pollInterval = pollInterval
+        self.idleTimeout = idleTimeout
+        self.resetGap = resetGap
+        self.source = events
+        self._events: Iterator = iter(events)
+        self._pending: Deque[Tuple[str, float, Optional[Tuple[float, float]]]] = deque()
+        self._due: Optional[float] = None
+        self._lastInput = clock.getTime()
+        self._lastCheck = clock.getTime()
+        self.delivered: List[Tuple[str, float]] = []
+
+    def push(self, name: str, delay: float = 0.0, pos=None):
+        """Add an event after the scripted ones already queued."""
+        self._pending.append((name, delay, pos))
+
+        return self
+
+    def prompt(self, phase: str, parameters: dict, **info):
+        """Ask the event source for the response to this phase of the task."""
+        respond = getattr(self.source, "respond", None)
+        if respond is None:
+            return self
+        self._pending.clear()
+        self._due = None
+        for event in respond(phase, parameters, **info):
+            self.push(*event)
+
+        return self
+
+    def _head(self):
+        if not self._pending:
+            try:
+                event = next(self._events)
+            except StopIteration:
+                return None
+            self._pending.append(
+                (event[0], float(event[1]), event[2] if len(event) > 2 else None)
+            )
+        return self._pending[0]
+
+    def due(self, kind: str) -> Optional[float]:
+        """The time of the next event if it is of this kind (`"key"` or `"mouse"`)."""
+        head = self._head()
+        if head is None:
+            if self.clock.getTime() - self._lastInput > self.idleTimeout:
+                raise RuntimeError("The scripted input is exhausted.")
+            return None
+        if _kind(head[0]) != kind:
+            return None
+        if (self._due is None) or (
+            self.clock.getTime() - self._lastCheck > self.resetGap
+        ):
+            self._due = self.clock.getTime() + head[1]
+        self._lastCheck = self.clock.getTime()
+
+        return self._due
+
+    def waitUntil(self, time: float):
+        """Advance the clock while checking continuously for input."""
+        self.clock.wait(time - self.clock.getTime())
+        self._lastCheck = self.clock.getTime()
+
+        return self
+
+    def poll(self, kind: str, advance: bool = True):
+        """Return the next event of this kind if it happened, else `None`."""
+        if advance:
+            self.clock.wait(self.pollInterval)
+        due = self.due(kind)
+        if (due is None) or (self.clock.getTime() < due):
+            return None
+        name, _, pos = self._pending.popleft()
+        self._due = None
+        self._lastInput = self.clock.getTime()
+        self.delivered.append((name, self.clock.getTime()))
+
+        return name, due, pos
+
+
+def _kind(name: str) -> str:
+    return "mouse" if name.startswith("mouse_") else "key"
+
+
+class HeadlessCore:
+    """Replacement for :py:mod:`psychopy.core` on the simulated clock."""
+
+    def __init__(self, clock: AnyClock):
+        self._clock = clock
+
+    def wait(self, secs: float, hogCPUperiod: float = 0.2):
+        """Advance the simulated time, without waiting."""
+        self._clock.wait(secs)
+
+    def getTime(self) -> float:
+        return self._clock.getTime()
+
+    def Clock(self) -> "Stopwatch":
+        return Stopwatch(self._clock)
+
+    def quit(self):
+        raise SystemExit("User abort")
+
+
+class Stopwatch:
+    """Replacement for :py:class:`psychopy.core.Clock` on the simulated clock."""
+
+    def __init__(self, clock: AnyClock):
+        self._clock = clock
+        self._start = clock.getTime()
+
+    def getTime(self) -> float:
+        return self._clock.getTime() - self._start
+
+    def reset(self, newT: float = 0.0):
+        self._start = self._clock.getTime() + newT
+
+
+class HeadlessEvent:
+    """Replacement for :py:mod:`psychopy.event` reading the scripted input."""
+
+    def __init__(self, scriptedInput: ScriptedInput):
+        self._input = scriptedInput
+
+    def _stamp(self, name: str, time: float, timeStamped):
+        if timeStamped is False:
+            return name
+        if timeStamped is True:
+            return (name, time)
+        return (name, time - self._input.clock.getTime() + timeStamped.getTime())
+
+    def getKeys(self, keyList=None, timeStamped=False) -> list:
+        event = self._input.poll("key")
+        if (event is None) or ((keyList is not None) and (event[0] not in keyList)):
+            return []
+        return [self._stamp(event[0], event[1], timeStamped)]
+
+    def waitKeys(self, maxWait: float = float("inf"), keyList=None, timeStamped=False):
+        start = self._input.clock.getTime()
+        deadline = start + maxWait
+        while True:
+            due = self._input.due("key")
+            target = deadline if due is None else min(due, deadline)
+            if target == float("inf"):  # The next input is a mouse click
+                if self._input.clock.getTime() - start > self._input.idleTimeout:
+                    raise RuntimeError("Waiting for a key but a click is scripted.")
+                target = self._input.clock.getTime() + self._input.pollInterval
+            self._input.waitUntil(target)
+            event = self._input.poll("key", advance=False)
+            if (event is not None) and ((keyList is None) or (event[0] in keyList)):
+                return [self._stamp(event[0], event[1], timeStamped)]
+            if self._input.clock.getTime() >= deadline:
+                return None
+
+    def clearEvents(self, eventType=None):
+        pass
+
+    def Mouse(self, *args, **kwargs) -> "HeadlessMouse":
+        return HeadlessMouse(self._input)
+
+
+class HeadlessMouse:
+    """Replacement for :py:class:`psychopy.event.Mouse` reading the scripted input.
+
+    A scripted click keeps the button pressed until :py:meth:`clickReset`.
+    """
+
+    def __init__(self, scriptedInput: ScriptedInput):
+        self._input = scriptedInput
+        self._pos = np.zeros(2)
+        self.clickReset()
+
+    def clickReset(self, buttons=(0, 1, 2)):
+        self._pressed = [0, 0, 0]
+        self._times = [0.0, 0.0, 0.0]
+        self._reset = self._input.clock.getTime()
+
+    def getPressed(self, getTime: bool = False):
+        event = self._input.poll("mouse")
+        if event is not None:
+            button = MOUSE_BUTTONS[event[0][len("mouse_") :]]  # noqa
+            self._pressed[button] = 1
+            self._times[button] = event[1] - self._reset
+            if event[2] is not None:
+                self.setPos(event[2])
+        if getTime is True:
+            return list(self._pressed), list(self._times)
+        return list(self._pressed)
+
+    def getPos(self) -> np.ndarray:
+        return self._pos.copy()
+
+    def setPos(self, newPos=(0, 0)):
+        self._pos = np.asarray(newPos, dtype=float)
+
+
+class NullWindow:
+    """Window that does not render. Each flip advances the clock by one frame.
+
+    As with :py:class:`psychopy.visual.Window`, the intervals between the flips
+    are appended to `frameIntervals` while `recordFrameIntervals` is `True`
+    (measured on the session clock, so the time spent between two flips, e.g.
+    polling the inputs, delays the next frame).
+    """
+
+    def __init__(self, clock: AnyClock, frameRate: float = 60.0, **kwargs):
+        self._clock = clock
+        self.frameRate = frameRate
+        self.frames = 0
+        self.mouseVisible = True
+        self.size = np.array(kwargs.get("size", (1920, 1080)))
+        self.closed = False
+        self.frameIntervals: List[float] = []
+        self._recordFrameIntervals = False
+        self._lastFrameTime: Optional[float] = None
+
+    @property
+    def recordFrameIntervals(self) -> bool:
+        return self._recordFrameIntervals
+
+    @recordFrameIntervals.setter
+    def recordFrameIntervals(self, value: bool):
+        # The first interval is counted from the next flip
+        if value and not self._recordFrameIntervals:
+            self._lastFrameTime = None
+        self._recordFrameIntervals = value
+
+    def flip(self, clearBuffer: bool = True) -> float:
+        self._clock.wait(1 / self.frameRate)
+        self.frames += 1
+        now = self._clock.getTime()
+        if self._recordFrameIntervals:
+            if self._lastFrameTime is not None:
+                self.frameIntervals.append(now - self._lastFrameTime)
+            self._lastFrameTime = now
+        return now
+
+    def getActualFrameRate(self, *args, **kwargs) -> float:
+        return self.frameRate
+
+    def close(self):
+        self.closed = True
+
+
+class NullStim:
+    """Visual stimulus that stores its attributes and does not render."""
+
+    def __init__(self, win=None, **kwargs):
+        self.win = win
+        self.autoDraw = False
+        self.size = np.array([1.0, 1.0])
+        self.marker = _Attributes()
+        self.markerPos = None
+        self.draws = 0
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def draw(self, win=None):
+        self.draws += 1
+
+    def reset(self):
+        pass
+
+
+class NullRatingScale(NullStim):
+    """Rating scale controlled by the scripted key presses.
+
+    As with :py:class:`psychopy.visual.RatingScale`, the `"left"` and `"right"`
+    keys move the marker by one step and the `acceptKeys` validate the rating.
+    """
+
+    def __init__(
+        self, win=None, scriptedInput: Optional[ScriptedInput] = None, **kwargs
+    ):
+        self._input = scriptedInput
+        self.low, self.high = 1, 7
+        self.acceptKeys: Union[str, List[str]] = "return"
+        self.markerStart = kwargs.get("low", 1)
+        super().__init__(win, **kwargs)
+        self.reset()
+
+    def reset(self):
+        self.noResponse = True
+        self._marker = self.markerStart
+        self._rating: Optional[float] = None
+        self._rt: Optional[float] = None
+        self._start = self._input.clock.getTime() if self._input is not None else 0.0
+
+    def draw(self, win=None):
+        super().draw(win)
+        if self.noResponse and (self._input is not None):
+            event = self._input.poll("key")
+            if event is None:
+                return
+            if event[0] == "left":
+                self._marker = max(self._marker - 1, self.low)
+            elif event[0] == "right":
+                self._marker = min(self._marker + 1, self.high)
+            elif event[0] in _keyList(self.acceptKeys):
+                self.noResponse = False
+                self._rating = self._marker
+                self._rt = event[1] - self._start
+
+    def getRating(self) -> Optional[float]:
+        return self._rating
+
+    def getRT(self) -> Optional[float]:
+        return self._rt
+
+
+def _keyList(keys: Union[str, List[str]]) -> List[str]:
+    return [keys] if isinstance(keys, str) else list(keys)
+
+
+class _Attributes:
+    """Placeholder for the sub-components of a stimulus (e.g. `Slider.marker`)."""
+
+
+class HeadlessVisual:
+    """Replacement for :py:mod:`psychopy.visual`, without rendering."""
+
+    TextStim = NullStim
+    ImageStim = NullStim
+    GratingStim = NullStim
+    Slider = NullStim
+
+    def __init__(self, backend: "HeadlessBackend"):
+        self._backend = backend
+
+    def Window(self, *args, **kwargs) -> NullWindow:
+        return NullWindow(self._backend.clock, self._backend.frameRate, **kwargs)
+
+    def RatingScale(self, win=None, **kwargs) -> NullRatingScale:
+        return NullRatingScale(win, self._backend.input, **kwargs)
+
+
+class VirtualSound:
+    """Sound that is not played. The calls to `play()` are counted."""
+
+    def __init__(
+        self, value=None, secs: float = 0.5, sampleRate: int = 44100, **kwargs
+    ):
+        self.value = value
+        self.sampleRate = sampleRate
+        self.plays = 0
+        self.isPlaying = False
+
+    def play(self, *args, **kwargs):
+        self.plays += 1
+        self.isPlaying = True
+
+    def stop(self, *args, **kwargs):
+        self.isPlaying = False
+
+
+class HeadlessSound:
+    """Replacement for :py:mod:`psychopy.sound`."""
+
+    Sound = VirtualSound
+
+
+class HeadlessBackend:
+    """Run the tasks without display, audio device or real waits.
+
+    The rendering is a no-op, the sounds are virtual and the time is simulated: the
+    waits (`core.wait()`) and the frames (`win.flip()`) advance a
+    :py:class:`cardioception.clock.VirtualClock` instead of blocking, so a session
+    runs at CPU speed. With `speed`, the session runs on an accelerated
+    :py:class:`cardioception.clock.SessionClock` instead.
+    The participant responses are read from scripted input events (see
+    :py:class:`ScriptedInput`), or generated by a simulated participant (see
+    :py:class:`cardioception.participant.VirtualParticipant`).
+
+    Parameters
+    ----------
+    events : iterable
+        The scripted key presses and mouse clicks, as `(name, delay)` or
+        `(name, delay, pos)` tuples. Use `"mouse_left"`, `"mouse_middle"` and
+        `"mouse_right"` for the mouse buttons. Can also be a
+        :py:class:`cardioception.participant.VirtualParticipant`.
+    frameRate : float
+        The simulated refresh rate of the screen (Hz). Defaults to `60`.
+    pollInterval : float
+        The simulated time spent by each check of the keyboard or of the mouse
+        (seconds). Defaults to `0.001`.
+    idleTimeout : float
+        The simulated time after which waiting for an input that was not scripted
+        raises a `RuntimeError`. Defaults to `600`.
+    speed : float | None
+        The acceleration factor of the session time (see
+        :py:class:`cardioception.clock.SessionClock`). If `None` (default), the time
+        is simulated and the waits return immediately.
+
+    Examples
+    --------
+    >>> from itertools import cycle
+    >>> backend = HeadlessBackend(events=cycle([("mouse_right", 0.6)]))
+    >>> parameters = getParameters(setup="test", backend=backend)
+    >>> run(parameters)
+    >>> backend.clock.getTime()  # Simulated duration of the session (seconds)
+
+    """
+
+    name = "headless"
+
+    def __init__(
+        self,
+        events: Iterable = (),
+        frameRate: float = 60.0,
+        pollInterval: float = 0.001,
+        idleTimeout: float = 600.0,
+        speed: Optional[float] = None,
+    ):
+        self.frameRate = frameRate
+        self.clock: AnyClock = VirtualClock() if speed is None else SessionClock(speed)
+        self.input = ScriptedInput(self.clock, events, pollInterval, idleTimeout)
+        self.core = HeadlessCore(self.clock)
+        self.event = HeadlessEvent(self.input)
+        self.visual = CountingVisual(HeadlessVisual(self))
+        self.sound = HeadlessSound()
+
+    def prompt(self, phase: str, parameters: dict, **info):
+        """Announce a response phase of the task to the scripted input.
+
+        Parameters
+        ----------
+        phase : str
+            The response phase: `"start"`, `"decision"`, `"confidence"`, `"count"`
+            or `"finger"`.
+        parameters : dict
+            Task parameters.
+        info : dict
+            What the participant perceives in this phase (e.g. the listening and
+            response frequencies of a decision).
+        """
+        self.input.prompt(phase, parameters, **info)
+
+
+def createBackend(backend: Union[str, Any, None] = "psychopy"):
+    """Create the display, audio and input backend of a task.
+
+    Parameters
+    ----------
+    backend : str | object | None
+        `"psychopy"` (or `None`) for :py:class:`PsychopyBackend`, `"headless"` for a
+        :py:class:`HeadlessBackend` without scripted input, or a backend instance,
+        returned as is.
+    """
+    if (backend is None) or (backend == "psychopy"):
+        return PsychopyBackend()
+    elif backend == "headless":
+        return HeadlessBackend()
+    elif isinstance(backend, str):
+        raise ValueError("backend should be 'psychopy', 'headless' or an instance")
+
+    return backend
+
+
+def getBackend(parameters: dict):
+    """The backend used by a task (PsychoPy if none is defined)."""
+    if parameters.get("backend") is None:
+        parameters["backend"] = PsychopyBackend()
+
+    return parameters["backend"]
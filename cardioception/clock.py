@@ -0,0 +1,83 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import time
+
+
+class SessionClock:
+    """Time of a session, running in real time or accelerated.
+
+    All the times of a session (waits, event markers, response times and the
+    samples streamed by the simulated pulse oximeters) are read from the same
+    clock, so the timestamps stay consistent when the session is accelerated.
+    The acceleration is limited by the time needed to process the samples of the
+    pulse oximeter (a few thousand samples per second with
+    :py:class:`systole.recording.Oximeter`, i.e. about 50 times the real time at
+    75 Hz). Use :py:class:`VirtualClock` to run a session at CPU speed.
+
+    Parameters
+    ----------
+    speed : float
+        The acceleration factor. With `speed=10`, a 5 seconds wait takes 0.5
+        seconds. Defaults to `1` (real time).
+
+    Attributes
+    ----------
+    realTime : bool
+        `True` if the clock runs in real time.
+
+    Examples
+    --------
+    >>> clock = SessionClock(speed=60.0)
+    >>> start = clock.getTime()
+    >>> clock.wait(60)  # Returns after one second
+    >>> clock.getTime() - start
+    60.01
+
+    """
+
+    def __init__(self, speed: float = 1.0):
+        if speed <= 0:
+            raise ValueError("The speed of the clock should be positive")
+        self.speed = speed
+        self.realTime = speed == 1.0
+        self._origin = time.perf_counter()
+        self._start = time.time()
+
+    def getTime(self) -> float:
+        """The session time (seconds since the epoch, accelerated since creation)."""
+        return self._start + (time.perf_counter() - self._origin) * self.speed
+
+    def wait(self, secs: float):
+        """Wait for `secs` seconds of session time."""
+        if secs > 0:
+            time.sleep(secs / self.speed)
+
+        return self
+
+
+class VirtualClock:
+    """Simulated time (seconds), only advanced by the waits of the session.
+
+    The waits return immediately, so a session runs at CPU speed. The simulated
+    pulse oximeters deliver the samples of the elapsed time at once.
+    """
+
+    realTime = False
+
+    def __init__(self):
+        self.time = 0.0
+
+    def getTime(self) -> float:
+        return self.time
+
+    def advance(self, secs: float):
+        """Move the time forward by `secs` seconds."""
+        if secs > 0:
+            self.time += secs
+
+        return self
+
+    def wait(self, secs: float):
+        """Advance the time without waiting."""
+        return self.advance(secs)
@@ -0,0 +1,255 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from scipy.special import ndtr
+
+from cardioception.backends import _keyList
+
+Event = Tuple
+
+
+class VirtualParticipant:
+    """Simulated participant answering the tasks through the headless backend.
+
+    The decisions of the Heart Rate Discrimination task follow a cumulative normal
+    psychometric function with lapse rate, as assumed by the Psi staircase: the
+    participant perceives the intensity (the response frequency minus the listening
+    frequency) with a standard normal noise scaled by `slope`, and answers `"More"`
+    when the perceived value is above `threshold`. The confidence is the probability
+    that this decision is correct given the perceived value, read with a
+    metacognitive noise of standard deviation `metaNoise`, and rescaled to the range
+    of the rating scale (`0` for a guess, maximum for certainty).
+
+    In the Heartbeat Counting task, the participant counts a fraction
+    `countAccuracy` of the heartbeats detected in the recording (between the
+    start and stop event markers), with a normal noise of standard deviation
+    `countNoise`.
+
+    The participant is passed to :py:class:`cardioception.backends.HeadlessBackend`
+    as the input events. The task announces each response phase with
+    `backend.prompt()`, and the participant returns the matching key presses or
+    mouse clicks. Between phases (e.g. instructions screens), it presses the start
+    key or clicks the left button.
+
+    Parameters
+    ----------
+    threshold, slope : float | dict
+        The threshold (BPM) and slope of the psychometric function. Can be a
+        dictionary with a value for each modality (`"Intero"` and `"Extero"`).
+        Defaults to `0.0` and `5.0`.
+    lapse : float
+        The probability of a random decision. Defaults to `0.02`.
+    metaNoise : float
+        The standard deviation of the metacognitive noise, in units of the
+        sensory noise. Defaults to `1.0`.
+    countAccuracy : float
+        The fraction of the heartbeats counted. Defaults to `0.8`.
+    countNoise : float
+        The standard deviation of the reported count (beats). Defaults to `2.0`.
+    responseTime : tuple
+        The mean and standard deviation of the response times (seconds). Defaults
+        to `(0.8, 0.2)`.
+    seed : int | None
+        The seed of the random number generator.
+
+    Attributes
+    ----------
+    responses : list
+        The responses given, as dictionaries with the phase, the stimulus, the
+        response and the underlying values (e.g. the probability of answering
+        `"More"`).
+
+    Examples
+    --------
+    >>> participant = VirtualParticipant(threshold={"Intero": 10.0, "Extero": 2.0})
+    >>> parameters = getParameters(backend=HeadlessBackend(events=participant))
+    >>> run(parameters)
+    >>> pd.DataFrame(participant.responses)
+
+    """
+
+    def __init__(
+        self,
+        threshold: Union[float, Dict[str, float]] = 0.0,
+        slope: Union[float, Dict[str, float]] = 5.0,
+        lapse: float = 0.02,
+        metaNoise: float = 1.0,
+        countAccuracy: float = 0.8,
+        countNoise: float = 2.0,
+        responseTime: Tuple[float, float] = (0.8, 0.2),
+        seed: Optional[int] = None,
+    ):
+        self.threshold = threshold
+        self.slope = slope
+        self.lapse = lapse
+        self.metaNoise = metaNoise
+        self.countAccuracy = countAccuracy
+        self.countNoise = countNoise
+        self.responseTime = responseTime
+        self.rng = np.random.default_rng(seed)
+        self.device = "keyboard"
+        self.startKey = "space"
+        self.responses: List[dict] = []
+        self._confidence = 0.5  # Probability correct of the last response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Event:
+        """Continue to the next screen."""
+        if self.device == "mouse":
+            return ("mouse_left", self._rt())
+        return (self.startKey, self._rt())
+
+    def _rt(self, minimum: float = 0.0) -> float:
+        """Draw a response time (seconds)."""
+        rt = self.rng.normal(self.responseTime[0], self.responseTime[1])
+        return max(float(rt), minimum, 0.15)
+
+    def _value(self, value: Union[float, Dict[str, float]], modality: str) -> float:
+        return value[modality] if isinstance(value, dict) else value
+
+    def pMore(self, intensity: float, modality: str = "Intero") -> float:
+        """The probability of answering `"More"` for this intensity.
+
+        Parameters
+        ----------
+        intensity : float
+            The difference between the response and the listening frequencies
+            (BPM).
+        modality : str
+            The modality (`"Intero"` or `"Extero"`).
+        """
+        z = (intensity - self._value(self.threshold, modality)) / self._value(
+            self.slope, modality
+        )
+        return float(self.lapse / 2 + (1 - self.lapse) * ndtr(z))
+
+    def decide(self, intensity: float, modality: str = "Intero") -> Tuple[str, float]:
+        """Simulate a decision.
+
+        Returns
+        -------
+        decision : str
+            `"More"` or `"Less"`.
+        confidence : float
+            The subjective probability that the decision is correct (`0.5` to `1`).
+        """
+        z = (intensity - self._value(self.threshold, modality)) / self._value(
+            self.slope, modality
+        )
+        evidence = z + self.rng.standard_normal()
+        if self.rng.random() < self.lapse:
+            decision = "More" if self.rng.random() < 0.5 else "Less"
+        else:
+            decision = "More" if evidence > 0 else "Less"
+
+        # Probability correct, given the evidence read with metacognitive noise
+        evidence += self.metaNoise * self.rng.standard_normal()
+        pMore = float(ndtr(evidence))
+        confidence = pMore if decision == "More" else 1 - pMore
+
+        return decision, max(confidence, 0.5)
+
+    def count(self, nBeats: int) -> Tuple[int, float]:
+        """Simulate a heartbeat count.
+
+        Returns
+        -------
+        nCount : int
+            The reported number of heartbeats.
+        confidence : float
+            The subjective accuracy of the count (`0.5` to `1`).
+        """
+        error = self.countNoise * self.rng.standard_normal()
+        nCount = max(int(round(self.countAccuracy * nBeats + error)), 0)
+        noise = self.metaNoise * self.rng.standard_normal() * 0.1
+        confidence = float(np.clip(self.countAccuracy + noise, 0.5, 1.0))
+
+        return nCount, confidence
+
+    def respond(self, phase: str, parameters: dict, **info) -> List[Event]:
+        """The input events answering a response phase of the task.
+
+        Parameters
+        ----------
+        phase : str
+            `"start"`, `"decision"`, `"confidence"`, `"count"` or `"finger"`.
+        parameters : dict
+            Task parameters.
+        info : dict
+            The stimulus of the phase (see :py:meth:`HeadlessBackend.prompt`).
+        """
+        self.device = parameters.get("device", "keyboard")
+        self.startKey = parameters.get("startKey", "space")
+
+        if phase == "start":
+            return [next(self)]
+        elif phase == "decision":
+            return self._decision(parameters, **info)
+        elif phase == "confidence":
+            return self._rating(parameters, info["scale"])
+        elif phase == "count":
+            return self._count(parameters)
+        elif phase == "finger":
+            return [("1", self._rt())]
+        else:
+            raise ValueError(f"Invalid response phase: {phase}")
+
+    def _decision(
+        self, parameters: dict, modality: str, listenBPM: float, responseBPM: float
+    ) -> List[Event]:
+        intensity = responseBPM - listenBPM
+        decision, self._confidence = self.decide(intensity, modality)
+        self.responses.append(
+            {
+                "phase": "decision",
+                "modality": str(modality),
+                "intensity": float(intensity),
+                "pMore": self.pMore(intensity, modality),
+                "response": decision,
+            }
+        )
+        if self.device == "mouse":
+            button = "mouse_right" if decision == "More" else "mouse_left"
+            return [(button, self._rt())]
+        responseKeys = parameters.get("response_keys", {"More": "up", "Less": "down"})
+        return [(responseKeys[decision], self._rt())]
+
+    def _rating(self, parameters: dict, scale) -> List[Event]:
+        rating = 2 * self._confidence - 1  # From 0 (guess) to 1 (certain)
+        minTime = parameters.get("minRatingTime", 0.0)
+        if self.device == "mouse":
+            # The slider marker follows the horizontal position of the mouse
+            self.responses.append({"phase": "confidence", "response": rating * 100})
+            pos = ((rating * 100 - 50) / 100, 0.2)
+            return [("mouse_left", self._rt(minTime + 0.1), pos)]
+
+        # Move the marker of the rating scale with the arrow keys and validate
+        low, high = parameters["confScale"]
+        target = int(round(low + rating * (high - low)))
+        self.responses.append({"phase": "confidence", "response": target})
+        moves = target - int(scale.markerStart)
+        key = "right" if moves > 0 else "left"
+        events: List[Event] = [(key, 0.15)] * abs(moves)
+        acceptKey = _keyList(getattr(scale, "acceptKeys", "return"))[0]
+
+        return events + [(acceptKey, self._rt(minTime + 0.1))]
+
+    def _count(self, parameters: dict) -> List[Event]:
+        oxi = parameters["oxiTask"]
+        channel = np.asarray(oxi.channels["Channel_0"])
+        peaks = np.asarray(oxi.peaks)
+        starts, stops = np.flatnonzero(channel == 1), np.flatnonzero(channel == 2)
+        if (len(starts) > 0) and (len(stops) > 0):
+            nBeats = int(peaks[starts[-1] : stops[-1]].sum())  # noqa
+        else:  # No event markers, count the beats in the whole recording
+            nBeats = int(peaks.sum())
+        nCount, self._confidence = self.count(nBeats)
+        self.responses.append({"phase": "count", "beats": nBeats, "response": nCount})
+        events: List[Event] = [(digit, 0.3) for digit in str(nCount)]
+
+        return events + [("return", self._rt())]
@@ -0,0 +1,289 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+
+def _rolling(x: np.ndarray, length: int, std: bool = False) -> np.ndarray:
+    """Centered rolling mean (or standard deviation), `NaN` where incomplete.
+
+    The windows are aligned the same way as `pandas.Series.rolling(length,
+    center=True)`, so the output matches the processing done by
+    :py:func:`systole.detection.ppg_peaks`.
+    """
+    out = np.full(len(x), np.nan)
+    if len(x) < length:
+        return out
+    reference = x.mean()  # Centering limits the rounding errors of the sums
+    x = x - reference
+    cumsum = np.concatenate([[0.0], np.cumsum(x)])
+    mean = (cumsum[length:] - cumsum[:-length]) / length
+    if std is True:
+        cumsum2 = np.concatenate([[0.0], np.cumsum(x**2)])
+        meanSquare = (cumsum2[length:] - cumsum2[:-length]) / length
+        variance = np.maximum(meanSquare - mean**2, 0.0) * length / (length - 1)
+        mean = np.sqrt(variance)
+    else:
+        mean += reference
+    start = length - 1 - (length - 1) // 2
+    out[start : start + len(mean)] = mean  # noqa
+
+    return out
+
+
+class StreamingPeakDetector:
+    """Incremental systolic peak detection on the raw PPG signal.
+
+    The samples are processed at their native sampling frequency as soon as they are
+    received. The detection follows :py:func:`systole.detection.ppg_peaks` (moving
+    average, peak enhancement and threshold defined as the rolling mean + standard
+    deviation), without resampling the signal to 1000 Hz. Instead, the peak times
+    are refined using a parabolic interpolation around each local maximum. Peaks are
+    confirmed once the threshold window centered on them is complete, i.e. with a
+    lag of `win / 2` seconds.
+
+    Parameters
+    ----------
+    sfreq : float
+        The sampling frequency of the signal. Defaults to `75`.
+    win : float
+        The length of the window used to compute the detection threshold (seconds).
+        Defaults to `0.75`.
+    movingAverageLength : float
+        The length of the moving average used to remove high frequency noise
+        (seconds). Defaults to `0.05`.
+    distance : float
+        The minimum interval between two peaks (seconds). Defaults to `0.3`.
+    history : float
+        The length of signal and peaks kept in memory (seconds). Defaults to `60`.
+
+    Attributes
+    ----------
+    peaks : list
+        The time of the peaks detected in the last `history` seconds (seconds from
+        the first sample).
+
+    Examples
+    --------
+    >>> detector = StreamingPeakDetector(sfreq=75)
+    >>> oxiTask.read(duration=5.0)
+    >>> bpm = detector.consume(oxiTask.recording).bpm(window=5.0)
+
+    """
+
+    def __init__(
+        self,
+        sfreq: float = 75.0,
+        win: float = 0.75,
+        movingAverageLength: float = 0.05,
+        distance: float = 0.3,
+        history: float = 60.0,
+    ):
+        self.sfreq = sfreq
+        self.smoothLength = max(int(sfreq * movingAverageLength), 1)
+        self.winLength = int(sfreq * win)
+        self.distance = distance
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        """Discard the signal and the peaks detected so far."""
+        self._signal = np.zeros(0)
+        self._offset = 0  # Index of the first sample kept in memory
+        self._next = 0  # Index of the first sample not searched for peaks yet
+        self._read = 0  # Number of samples read from the recording
+        self._lastValue = -np.inf
+        self.peaks: List[float] = []
+
+        return self
+
+    @property
+    def nSamples(self) -> int:
+        """The number of samples received since the last reset."""
+        return self._offset + len(self._signal)
+
+    @property
+    def lag(self) -> float:
+        """The delay (seconds) between a sample and the detection of a peak."""
+        return (self.winLength // 2 + self.smoothLength // 2 + 1) / self.sfreq
+
+    def consume(self, recording: Sequence[float], offset: int = 0):
+        """Process the samples appended to a recording since the last call.
+
+        Parameters
+        ----------
+        recording : list | np.ndarray
+            The full recording (e.g. `Oximeter.recording`). If the recording is
+            shorter than during the previous call (e.g. after `Oximeter.setup()`), the
+            detector is reset.
+        offset : int
+            The number of samples already removed from the beginning of `recording`
+            (see `AcquisitionService.spilled`). Defaults to `0`.
+        """
+        if offset + len(recording) < self._read:
+            self.reset()
+        samples = recording[max(self._read - offset, 0) :]  # noqa
+        self._read = offset + len(recording)
+
+        return self.update(samples)
+
+    def update(self, samples: Union[Sequence[float], np.ndarray]):
+        """Add new samples and detect the peaks that can be confirmed.
+
+        Parameters
+        ----------
+        samples : list | np.ndarray
+            The new samples.
+        """
+        if len(samples) == 0:
+            return self
+        self._signal = np.concatenate([self._signal, np.asarray(samples, dtype=float)])
+
+        # Only process the part of the signal that can contain new peaks
+        margin = self.smoothLength + self.winLength + 2
+        start = max(self._next - margin - self._offset, 0)
+        x = self._signal[start:]
+
+        # Moving average, peak enhancement and threshold
+        x = _rolling(x, self.smoothLength)
+        x = (x**2) * np.sign(x)
+        d = np.full(len(x), np.nan)
+        smoothed = np.where(~np.isnan(x))[0]
+        if len(smoothed) > 0:
+            a, b = smoothed[0], smoothed[-1] + 1
+            d[a:b] = (
+                x[a:b]
+                - _rolling(x[a:b], self.winLength)
+                - _rolling(x[a:b], self.winLength, std=True)
+            )
+
+        # Search local maxima above threshold among the confirmed samples
+        valid = np.where(~np.isnan(d))[0]
+        if len(valid) < 3:
+            return self
+        first = max(self._next - self._offset - start, valid[0] + 1)
+        last = valid[-1]  # The next sample is needed to confirm a peak
+        for i in range(first, last):
+            if (d[i] > 0) and (d[i] > d[i - 1]) and (d[i] >= d[i + 1]):
+                self._addPeak(
+                    i + start + self._offset,
+                    float(d[i - 1]),
+                    float(d[i]),
+                    float(d[i + 1]),
+                )
+        self._next = max(self._next, last + start + self._offset)
+
+        # Drop the samples and peaks that are no longer needed
+        keep = max(int(self.history * self.sfreq), margin)
+        drop = min(len(self._signal) - keep, self._next - margin - self._offset)
+        if drop > 0:
+            self._signal = self._signal[drop:]
+            self._offset += drop
+            oldest = self._offset / self.sfreq - self.history
+            while self.peaks and self.peaks[0] < oldest:
+                self.peaks.pop(0)
+
+        return self
+
+    def _addPeak(self, idx: int, before: float, value: float, after: float):
+        """Refine the peak time and apply the minimum distance between peaks."""
+        denominator = before - 2 * value + after
+        delta = 0.5 * (before - after) / denominator if denominator != 0 else 0.0
+        peakTime = (idx + min(max(delta, -0.5), 0.5)) / self.sfreq
+
+        if self.peaks and (peakTime - self.peaks[-1] < self.distance):
+            # Keep the highest of two close peaks
+            if value > self._lastValue:
+                self.peaks[-1], self._lastValue = peakTime, value
+        else:
+            self.peaks.append(peakTime)
+            self._lastValue = value
+
+    @property
+    def rr(self) -> np.ndarray:
+        """The RR intervals (ms) between the peaks detected so far."""
+        return np.diff(np.asarray(self.peaks)) * 1000
+
+    def bpm(self, window: float = 5.0) -> np.ndarray:
+        """The instantaneous heart rate over the trailing window.
+
+        Parameters
+        ----------
+        window : float
+            The length of the trailing window (seconds). Defaults to `5.0`.
+
+        Returns
+        -------
+        bpm : np.ndarray
+            The heart rate (beats per minute) computed from each RR interval whose
+            peaks were found in the last `window` seconds of signal.
+        """
+        peaks = np.asarray(self.peaks)
+        peaks = peaks[peaks >= self.nSamples / self.sfreq - window]
+
+        return 60 / np.diff(peaks)
+
+
+def matchPeaks(
+    peaks: Union[Sequence[float], np.ndarray],
+    beats: Union[Sequence[float], np.ndarray],
+    tolerance: float = 0.1,
+) -> Dict[str, float]:
+    """Compare the detected peaks with the ground-truth heartbeats.
+
+    Each heartbeat is matched with the closest detected peak that is not already
+    matched, if it is closer than `tolerance`.
+
+    Parameters
+    ----------
+    peaks, beats : list | np.ndarray
+        The time (seconds) of the detected peaks and of the true heartbeats (e.g.
+        :py:attr:`cardioception.sources.SyntheticPPG.beats`).
+    tolerance : float
+        The maximum distance (seconds) between a peak and the matching heartbeat.
+        Defaults to `0.1`.
+
+    Returns
+    -------
+    scores : dict
+        * `"truePositives"`, `"falsePositives"`, `"falseNegatives"`: the number of
+          heartbeats matched, of peaks not matched and of heartbeats missed.
+        * `"sensitivity"`, `"precision"`: the fraction of the heartbeats found and
+          of the peaks that are true heartbeats.
+        * `"meanError"`, `"maxError"`: the mean and maximum absolute time
+          difference (seconds) between the matched peaks and heartbeats.
+
+    Examples
+    --------
+    >>> ppg = SyntheticPPG(motionRate=2.0, seed=1)
+    >>> detector = StreamingPeakDetector().update(ppg.generate(75 * 300))
+    >>> matchPeaks(detector.peaks, ppg.beats)
+
+    """
+    peakTimes: np.ndarray = np.sort(np.asarray(peaks, float))
+    beatTimes: np.ndarray = np.sort(np.asarray(beats, float))
+    errors: List[float] = []
+    used: np.ndarray = np.zeros(len(peakTimes), dtype=bool)
+    for beat in beatTimes:
+        i = int(np.searchsorted(peakTimes, beat))
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(peakTimes) and not used[j]]
+        if not candidates:
+            continue
+        j = min(candidates, key=lambda j: abs(peakTimes[j] - beat))
+        if abs(peakTimes[j] - beat) <= tolerance:
+            used[j] = True
+            errors.append(float(abs(peakTimes[j] - beat)))
+
+    truePositives = len(errors)
+
+    return {
+        "truePositives": truePositives,
+        "falsePositives": len(peakTimes) - truePositives,
+        "falseNegatives": len(beatTimes) - truePositives,
+        "sensitivity": truePositives / len(beatTimes) if len(beatTimes) else np.nan,
+        "precision": truePositives / len(peakTimes) if len(peakTimes) else np.nan,
+        "meanError": float(np.mean(errors)) if errors else np.nan,
+        "maxError": float(np.max(errors)) if errors else np.nan,
+    }
@@ -0,0 +1,549 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import glob
+import os
+import re
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from cardioception.clock import SessionClock, VirtualClock
+from cardioception.storage import loadRecording, loadSignal
+
+
+class SignalSerial:
+    """Serial port stand-in streaming a PPG signal at the pace of the session clock.
+
+    The samples are delivered as the 5 bytes packets of the Nonin pulse oximeters
+    (data format 2), so the port can be read by :py:class:`systole.recording.Oximeter`
+    like :py:class:`systole.serialSim`. The number of samples waiting is computed
+    from the time elapsed on the session clock, so the signal is replayed at the
+    same speed as the task: in real time, accelerated or simulated (see
+    :py:mod:`cardioception.clock`).
+
+    Parameters
+    ----------
+    signal : np.ndarray | None
+        The PPG signal, with values between 0 and 255. If `None`, the 5 minutes
+        recording from :py:func:`systole.datasets.import_ppg` is used.
+    clock : :py:class:`cardioception.clock.SessionClock` | \
+        :py:class:`cardioception.clock.VirtualClock` | None
+        The session clock. Defaults to a real time clock.
+    sfreq : int
+        The sampling frequency (Hz). Defaults to `75`.
+    loop : bool
+        If `True` (default), the signal starts again from the beginning when its
+        end is reached. Otherwise, no more samples are delivered.
+
+    Examples
+    --------
+    >>> backend = HeadlessBackend()
+    >>> oxi = Oximeter(serial=SignalSerial(clock=backend.clock), add_channels=1)
+    >>> oxiTask = AcquisitionService(oxi, clock=backend.clock)
+    >>> oxiTask.setup().read(duration=60.0)  # Returns immediately
+
+    """
+
+    def __init__(
+        self,
+        signal: Optional[np.ndarray] = None,
+        clock: Optional[Union[SessionClock, VirtualClock]] = None,
+        sfreq: int = 75,
+        loop: bool = True,
+    ):
+        if signal is None:
+            from systole.datasets import import_ppg
+
+            signal = import_ppg().ppg.to_numpy()
+        self.signal = np.clip(np.asarray(signal, dtype=float), 0, 255)
+        self.clock = SessionClock() if clock is None else clock
+        self.sfreq = sfreq
+        self.loop = loop
+        self.start = self.clock.getTime()
+        self.position = 0  # Number of samples read
+
+    def due(self) -> int:
+        """The number of samples delivered since the port was opened."""
+        due = int((self.clock.getTime() - self.start) * self.sfreq)
+        return due if self.loop else min(due, len(self.signal))
+
+    def inWaiting(self) -> int:
+        """The number of bytes waiting in the port."""
+        return 5 * max(self.due() - self.position, 0)
+
+    def sample(self, index: int) -> float:
+        """The value of a sample."""
+        return float(self.signal[index % len(self.signal)])
+
+    def read(self, size: int = 5) -> Tuple[int, int, float, int, float]:
+        """Read the next packet."""
+        value = self.sample(self.position)
+        self.position += 1
+
+        return (1, 255, value, 127, (1 + 255 + value + 127) % 256)
+
+    def reset_input_buffer(self):
+        """Discard the samples waiting in the port."""
+        self.position = max(self.position, self.due())
+
+
+def _naturalKey(fileName: str) -> List[Union[int, str]]:
+    """Sort key ordering the numbers in the file names by value (`_ppg_9` first)."""
+    return [int(s) if s.isdigit() else s for s in re.split(r"(\d+)", fileName)]
+
+
+def loadSession(
+    fileNames: Union[str, os.PathLike, Sequence[Union[str, os.PathLike]]],
+    sfreq: float = 75.0,
+) -> np.ndarray:
+    """Load the PPG signal from the files saved by the tasks.
+
+    The following files are supported:
+
+    * `.txt`: the recordings saved by the pulse oximeter (e.g. the `_ppg_{n}.txt`
+      files saved at each break of the Heart Rate Discrimination task), and the
+      `_signal.txt` files saved by previous versions of this task (interpolated at
+      1000 Hz, resampled to `sfreq`).
+    * `.npy`: the recordings saved by the pulse oximeter without extension (e.g.
+      the files saved after each trial of the Heartbeat Counting task).
+    * `.bin`: the signal of the trials saved by
+      :py:class:`cardioception.storage.SignalStore`.
+    * `.rec`: the recordings saved by
+      :py:class:`cardioception.storage.RecordingStore`.
+
+    Parameters
+    ----------
+    fileNames : str | PathLike | list
+        The file, or list of files, to load. A string can contain wildcards (e.g.
+        `"Subject_ppg_*.txt"`). The files are sorted by name, with the numbers in
+        the names compared by value.
+    sfreq : float
+        The sampling frequency of the pulse oximeter. Defaults to `75`.
+
+    Returns
+    -------
+    signal : np.ndarray
+        The signals of all the files, concatenated.
+
+    Raises
+    ------
+    ValueError
+        If no file is found or a file format is not supported.
+
+    """
+    if isinstance(fileNames, (str, os.PathLike)):
+        pattern = os.fspath(fileNames)
+        paths = sorted(glob.glob(pattern), key=_naturalKey)
+        if not paths:
+            raise ValueError(f"No recording found matching {pattern}.")
+    else:
+        paths = [os.fspath(f) for f in fileNames]
+        if not paths:
+            raise ValueError("No recording provided.")
+
+    signals = []
+    for path in paths:
+        extension = os.path.splitext(path)[1]
+        if extension == ".txt":
+            df = pd.read_csv(path)
+            if ("nTrial" in df) and ("peaks" not in df):
+                # Trials interpolated at 1000 Hz, resample to the oximeter frequency
+                for _, trial in df.groupby("nTrial", sort=False, observed=True):
+                    x = trial["signal"].to_numpy(dtype=float)
+                    time = np.arange(len(x)) / 1000
+                    signals.append(
+                        np.interp(np.arange(0, time[-1], 1 / sfreq), time, x)
+                    )
+            else:
+                signals.append(df["signal"].to_numpy(dtype=float))
+        elif extension == ".npy":
+            recording = np.load(path)
+            signals.append(recording if recording.ndim == 1 else recording[0])
+        elif extension == ".bin":
+            signals.extend(
+                np.asarray(x, dtype=float) for x in loadSignal(path).values()
+            )
+        elif extension == ".rec":
+            signals.append(loadRecording(path)["signal"].to_numpy(dtype=float))
+        else:
+            raise ValueError(f"Invalid recording format: {path}.")
+
+    return np.concatenate(signals) if signals else np.array([])
+
+
+class ReplaySerial(SignalSerial):
+    """Serial port stand-in replaying the PPG signal of previous sessions.
+
+    The recordings saved by the tasks (see :py:func:`loadSession`) are streamed at
+    the pace of the session clock, in real time or accelerated, so the acquisition
+    and the peak detection can be tested against real recordings without a pulse
+    oximeter. The irregularities of a USB connection can be added: the samples can
+    be delivered late and in bursts (`jitter`), and some of them can be lost
+    (`dropout`).
+
+    Parameters
+    ----------
+    fileNames : str | PathLike | list
+        The recordings to replay (see :py:func:`loadSession`).
+    clock : :py:class:`cardioception.clock.SessionClock` | \
+        :py:class:`cardioception.clock.VirtualClock` | None
+        The session clock. Defaults to a real time clock.
+    sfreq : int
+        The sampling frequency (Hz). Defaults to `75`.
+    loop : bool
+        If `True` (default), the recordings are replayed again when their end is
+        reached. Otherwise, no more samples are delivered.
+    jitter : float
+        The maximum delay of the samples (seconds). Each time the port is polled,
+        the samples are delivered up to a delay drawn uniformly between `0` and
+        `jitter`. Defaults to `0.0`.
+    dropout : float
+        The fraction of samples lost. Defaults to `0.0`.
+    dropoutLength : float
+        The mean duration of the gaps in the signal (seconds). Defaults to `0.1`.
+    seed : int | None
+        The seed of the random number generator.
+
+    Attributes
+    ----------
+    kept : np.ndarray
+        Boolean mask of the samples of the signal that are delivered.
+
+    Examples
+    --------
+    >>> backend = HeadlessBackend(speed=10.0)
+    >>> port = ReplaySerial(
+    ...     "data/Subject_ppg_*.txt", clock=backend.clock, jitter=0.05, dropout=0.01
+    ... )
+    >>> parameters = getParameters(setup="test", serialPort=port, backend=backend)
+
+    """
+
+    def __init__(
+        self,
+        fileNames: Union[str, os.PathLike, Sequence[Union[str, os.PathLike]]],
+        clock: Optional[Union[SessionClock, VirtualClock]] = None,
+        sfreq: int = 75,
+        loop: bool = True,
+        jitter: float = 0.0,
+        dropout: float = 0.0,
+        dropoutLength: float = 0.1,
+        seed: Optional[int] = None,
+    ):
+        if not 0 <= dropout < 1:
+            raise ValueError("The dropout rate should be between 0 and 1")
+        super().__init__(
+            signal=loadSession(fileNames, sfreq=sfreq),
+            clock=clock,
+            sfreq=sfreq,
+            loop=loop,
+        )
+        self.jitter = jitter
+        self.dropout = dropout
+        self.dropoutLength = dropoutLength
+        self.rng = np.random.default_rng(seed)
+        self._due = 0
+
+        # Gaps starting at random samples, with a geometric length
+        n = len(self.signal)
+        self.kept: np.ndarray = np.ones(n, dtype=bool)
+        if dropout > 0:
+            gapLength = max(dropoutLength * sfreq, 1.0)
+            starts = np.flatnonzero(self.rng.random(n) < dropout / gapLength)
+            for start, length in zip(
+                starts, self.rng.geometric(1 / gapLength, len(starts))
+            ):
+                self.kept[start : start + length] = False  # noqa
+        self._cumKept = np.concatenate([[0], np.cumsum(self.kept)])
+
+    def due(self) -> int:
+        """The number of samples delivered since the port was opened."""
+        lag = self.rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+        due = int((self.clock.getTime() - self.start - lag) * self.sfreq)
+        self._due = max(self._due, due)  # Delivered samples stay in the port
+        return self._due if self.loop else min(self._due, len(self.signal))
+
+    def _nKept(self, index: int) -> int:
+        """The number of samples delivered before this position."""
+        n = len(self.signal)
+        return (index // n) * int(self._cumKept[n]) + int(self._cumKept[index % n])
+
+    def inWaiting(self) -> int:
+        """The number of bytes waiting in the port."""
+        return 5 * max(self._nKept(self.due()) - self._nKept(self.position), 0)
+
+    def read(self, size: int = 5) -> Tuple[int, int, float, int, float]:
+        """Read the next packet, skipping the samples lost."""
+        while not self.kept[self.position % len(self.signal)]:
+            self.position += 1
+
+        return super().read(size)
+
+
+class SyntheticPPG:
+    """Synthetic PPG signal with known heartbeats.
+
+    The signal is generated on demand, block by block, so sessions of any length can
+    be simulated with a constant memory usage. Each heartbeat is a systolic wave
+    followed by a smaller diastolic wave, and the interval to the next beat follows
+    the heart rate trajectory, modulated by the respiration (respiratory sinus
+    arrhythmia) and by a random beat-to-beat variability. Baseline wander, noise,
+    motion artifacts and periods of signal loss (e.g. finger removed from the
+    oximeter) can be added. The signal is clipped to the range of the pulse
+    oximeter (`0` to `255`): increase `amplitude` or `baseline` to simulate a
+    saturated signal.
+
+    Parameters
+    ----------
+    heartRate : float | callable | array-like
+        The heart rate trajectory (BPM). Can be a constant, a function of the time
+        (seconds), or a list of `(time, bpm)` points linearly interpolated.
+        Defaults to `70.0`.
+    hrv : float
+        The standard deviation of the random variability of the RR intervals, as a
+        fraction of the interval. Defaults to `0.03`.
+    rsa : float
+        The amplitude of the respiratory sinus arrhythmia, as a fraction of the RR
+        interval. Defaults to `0.03`.
+    respirationRate : float
+        The frequency of the respiration (Hz). Defaults to `0.25`.
+    amplitude : float
+        The amplitude of the systolic wave. Defaults to `40.0`.
+    baseline : float
+        The mean value of the signal. Defaults to `100.0`.
+    wander : float
+        The amplitude of the respiratory baseline wander. Defaults to `5.0`.
+    noise : float
+        The standard deviation of the measurement noise. Defaults to `0.5`.
+    motionRate : float
+        The mean number of motion artifacts per minute. Defaults to `0.0`.
+    motionAmplitude : float
+        The amplitude of the motion artifacts. Defaults to `80.0`.
+    motionDuration : float
+        The mean duration of the motion artifacts (seconds). Defaults to `2.0`.
+    lossRate : float
+        The mean number of signal losses per minute. Defaults to `0.0`.
+    lossDuration : float
+        The mean duration of the signal losses (seconds). Defaults to `3.0`.
+    sfreq : float
+        The sampling frequency (Hz). Defaults to `75`.
+    seed : int | None
+        The seed of the random number generator.
+
+    Attributes
+    ----------
+    position : int
+        The number of samples generated.
+    artifacts, losses : list
+        The `(start, stop)` times (seconds) of the motion artifacts and of the
+        signal losses generated so far.
+
+    Examples
+    --------
+    >>> ppg = SyntheticPPG(heartRate=[(0, 60), (300, 90)], motionRate=1.0, seed=1)
+    >>> signal = ppg.generate(75 * 60)  # The first minute
+    >>> ppg.beats  # Ground-truth heartbeats (seconds)
+
+    """
+
+    def __init__(
+        self,
+        heartRate: Union[float, Callable[[float], float], Sequence] = 70.0,
+        hrv: float = 0.03,
+        rsa: float = 0.03,
+        respirationRate: float = 0.25,
+        amplitude: float = 40.0,
+        baseline: float = 100.0,
+        wander: float = 5.0,
+        noise: float = 0.5,
+        motionRate: float = 0.0,
+        motionAmplitude: float = 80.0,
+        motionDuration: float = 2.0,
+        lossRate: float = 0.0,
+        lossDuration: float = 3.0,
+        sfreq: float = 75.0,
+        seed: Optional[int] = None,
+    ):
+        self.heartRate = heartRate
+        self.hrv = hrv
+        self.rsa = rsa
+        self.respirationRate = respirationRate
+        self.amplitude = amplitude
+        self.baseline = baseline
+        self.wander = wander
+        self.noise = noise
+        self.motionRate = motionRate
+        self.motionAmplitude = motionAmplitude
+        self.motionDuration = motionDuration
+        self.lossRate = lossRate
+        self.lossDuration = lossDuration
+        self.sfreq = sfreq
+        # Independent random streams, so the signal does not depend on the block sizes
+        self.rng, self._noiseRng, self._motionRng, self._lossRng = [
+            np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(4)
+        ]
+        self.position = 0
+        self.artifacts: List[Tuple[float, float]] = []
+        self.losses: List[Tuple[float, float]] = []
+
+        self._beats: List[float] = []
+        self._rr: List[float] = []
+        self._nextBeat = self.rng.uniform(0, 60 / self.bpm(0.0))
+        self._motion: List[Tuple[float, float, np.ndarray]] = []  # Start, stop, waves
+        self._nextMotion = self._interval(motionRate, self._motionRng)
+        self._nextLoss = self._interval(lossRate, self._lossRng)
+        self._phase = self.rng.uniform(0, 2 * np.pi)  # Phase of the respiration
+
+    def _interval(self, rate: float, rng: np.random.Generator) -> float:
+        """Draw the time to the next event of a Poisson process (rate per minute)."""
+        return float(rng.exponential(60 / rate)) if rate > 0 else np.inf
+
+    def bpm(self, time: float) -> float:
+        """The heart rate (BPM) of the trajectory at this time (seconds)."""
+        if callable(self.heartRate):
+            return float(self.heartRate(time))
+        if np.ndim(self.heartRate) == 0:
+            return float(self.heartRate)  # type: ignore
+        points = np.asarray(self.heartRate, dtype=float)
+        return float(np.interp(time, points[:, 0], points[:, 1]))
+
+    @property
+    def beats(self) -> np.ndarray:
+        """The time (seconds) of the systolic peaks in the signal generated."""
+        beats = np.asarray(self._beats)
+        return beats[beats < self.position / self.sfreq]
+
+    def _respiration(self, time: Union[float, np.ndarray]):
+        return np.sin(2 * np.pi * self.respirationRate * time + self._phase)
+
+    def generate(self, nSamples: int) -> np.ndarray:
+        """Generate the next samples of the signal.
+
+        Parameters
+        ----------
+        nSamples : int
+            The number of samples.
+
+        Returns
+        -------
+        signal : np.ndarray
+            The signal, with values between `0` and `255`.
+        """
+        time = (self.position + np.arange(nSamples)) / self.sfreq
+        if nSamples == 0:
+            return time
+        start, stop = time[0], time[-1]
+
+        # Heartbeats (the waves of the beats around the block overlap the samples)
+        while self._nextBeat < stop + 1.0:
+            beat = self._nextBeat
+            rr = 60 / self.bpm(beat)
+            rr *= 1 + self.rsa * self._respiration(beat) + self.hrv * self.rng.normal()
+            rr = max(rr, 0.25)
+            self._beats.append(beat)
+            self._rr.append(rr)
+            self._nextBeat = beat + rr
+        signal = np.zeros(nSamples)
+        for beat, rr in zip(reversed(self._beats), reversed(self._rr)):
+            if beat < start - 2.0:
+                break
+            width = 0.07 * np.sqrt(rr)
+            signal += np.exp(-(((time - beat) / width) ** 2))
+            signal += 0.4 * np.exp(
+                -(((time - beat - 2.5 * width) / (1.5 * width)) ** 2)
+            )
+        signal = self.baseline + self.amplitude * signal
+        signal += self.wander * self._respiration(time)
+        signal += self.noise * self._noiseRng.standard_normal(nSamples)
+
+        # Motion artifacts, as a sum of low frequency oscillations
+        while self._nextMotion < stop:
+            duration = self.motionDuration * self._motionRng.uniform(0.5, 1.5)
+            waves = self._motionRng.uniform(
+                [0.5, 0, 0], [3.0, 2 * np.pi, 1], size=(4, 3)
+            )
+            self._motion.append((self._nextMotion, self._nextMotion + duration, waves))
+            self.artifacts.append((self._nextMotion, self._nextMotion + duration))
+            self._nextMotion += duration + self._interval(
+                self.motionRate, self._motionRng
+            )
+        self._motion = [m for m in self._motion if m[1] >= start]
+        for motionStart, motionStop, waves in self._motion:
+            inside = (time >= motionStart) & (time < motionStop)
+            t = time[inside] - motionStart
+            window = np.sin(np.pi * t / (motionStop - motionStart)) ** 2
+            for frequency, phase, weight in waves:
+                signal[inside] += (
+                    self.motionAmplitude
+                    * (weight - 0.5)
+                    * window
+                    * np.sin(2 * np.pi * frequency * t + phase)
+                )
+
+        # Signal losses
+        while self._nextLoss < stop:
+            duration = self.lossDuration * self._lossRng.uniform(0.5, 1.5)
+            self.losses.append((self._nextLoss, self._nextLoss + duration))
+            self._nextLoss += duration + self._interval(self.lossRate, self._lossRng)
+        for lossStart, lossStop in reversed(self.losses):
+            if lossStop < start:
+                break
+            signal[(time >= lossStart) & (time < lossStop)] = 0.0
+
+        self.position += nSamples
+
+        return np.clip(signal, 0, 255)
+
+
+class SyntheticSerial(SignalSerial):
+    """Serial port stand-in streaming a synthetic PPG signal.
+
+    The signal is generated by :py:class:`SyntheticPPG` as the session time
+    advances, so the ground-truth heartbeats (`ppg.beats`) can be compared with the
+    peaks detected during the task. Each port has its own generator, and several
+    ports can stream in parallel (e.g. one acquisition thread per simulated
+    participant).
+
+    Parameters
+    ----------
+    ppg : :py:class:`SyntheticPPG` | None
+        The signal generator. If `None`, a generator is created with the keyword
+        arguments.
+    clock : :py:class:`cardioception.clock.SessionClock` | \
+        :py:class:`cardioception.clock.VirtualClock` | None
+        The session clock. Defaults to a real time clock.
+    kwargs : dict
+        Keyword arguments for :py:class:`SyntheticPPG`.
+
+    Examples
+    --------
+    >>> backend = HeadlessBackend()
+    >>> port = SyntheticSerial(clock=backend.clock, heartRate=[(0, 70), (600, 140)])
+    >>> parameters = getParameters(setup="test", serialPort=port, backend=backend)
+    >>> run(parameters)
+    >>> port.ppg.beats  # Seconds from the first sample delivered by the port
+
+    """
+
+    def __init__(
+        self,
+        ppg: Optional[SyntheticPPG] = None,
+        clock: Optional[Union[SessionClock, VirtualClock]] = None,
+        **kwargs,
+    ):
+        self.ppg = SyntheticPPG(**kwargs) if ppg is None else ppg
+        # The samples are generated on demand instead of being read from a signal
+        super().__init__(
+            signal=np.zeros(0), clock=clock, sfreq=int(self.ppg.sfreq), loop=True
+        )
+        self._block = np.zeros(0)
+        self._blockStart = 0
+
+    def sample(self, index: int) -> float:
+        """The value of a sample."""
+        while index >= self._blockStart + len(self._block):
+            self._blockStart += len(self._block)
+            self._block = self.ppg.generate(self.sfreq)  # One second at a time
+        return float(self._block[index - self._blockStart])
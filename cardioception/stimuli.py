@@ -0,0 +1,155 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+
+class StimulusRegistry:
+    """Visual stimuli created once and reused across trials.
+
+    Each stimulus is declared with a role (e.g. `"fixation"` or `"tooLate"`) when the
+    task parameters are created, and all the stimuli are built before the first
+    trial. The trials then retrieve the existing instances instead of creating new
+    ones, so the text is rasterized and the textures uploaded only once. Attributes
+    (text, color, position...) passed to :py:meth:`get` are only updated when they
+    differ from the current values.
+
+    Parameters
+    ----------
+    win : `psychopy.visual.window`
+        The window in which to draw the stimuli.
+
+    Attributes
+    ----------
+    created : int
+        The total number of stimuli created by the registry.
+
+    Examples
+    --------
+    >>> from psychopy import visual
+    >>> stimuli = StimulusRegistry(win)
+    >>> stimuli.add("fixation", visual.GratingStim, mask="cross", size=0.1, sf=0)
+    >>> stimuli.add("progress", visual.TextStim, height=0.04, text="")
+    >>> stimuli.build()
+    >>> stimuli.get("fixation").draw()
+    >>> stimuli.get("progress", text=" ---- 50 % ---- ").draw()
+    >>> stimuli.countCreated()  # Number of stimuli created since the last call
+    2
+
+    """
+
+    def __init__(self, win):
+        self.win = win
+        self.created = 0
+        self._counted = 0
+        self._recipes: Dict[str, Tuple[Callable, Dict[str, Any]]] = {}
+        self._stimuli: Dict[str, Any] = {}
+        self._state: Dict[str, Dict[str, Any]] = {}
+
+    def __contains__(self, role: str) -> bool:
+        return role in self._recipes
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    def add(self, role: str, stimType: Callable, **kwargs):
+        """Declare a new stimulus.
+
+        Parameters
+        ----------
+        role : str
+            The name used to retrieve the stimulus.
+        stimType : callable
+            The stimulus class (e.g. :py:class:`psychopy.visual.TextStim`). It is
+            called with the window as first argument and `kwargs`.
+        kwargs : dict
+            Parameters passed to `stimType`.
+        """
+        self._recipes[role] = (stimType, kwargs)
+        self._stimuli.pop(role, None)
+
+        return self
+
+    def build(self):
+        """Create all the declared stimuli that do not exist yet."""
+        for role in self._recipes:
+            if role not in self._stimuli:
+                self._create(role)
+
+        return self
+
+    def _create(self, role: str):
+        stimType, kwargs = self._recipes[role]
+        self._stimuli[role] = stimType(self.win, **kwargs)
+        self._state[role] = dict(kwargs)
+        self.created += 1
+
+    def get(self, role: str, **attributes):
+        """Return the stimulus, updating the attributes that changed.
+
+        Parameters
+        ----------
+        role : str
+            The role of the stimulus.
+        attributes : dict
+            Attributes to set before returning the stimulus (e.g. `text` or
+            `color`). An attribute is only set if the new value is different from
+            the one previously set through the registry.
+
+        Returns
+        -------
+        stim : psychopy visual stimulus
+            The stimulus. It is created if it was not built before (and counted in
+            :py:meth:`countCreated`).
+        """
+        if role not in self._stimuli:
+            self._create(role)
+        stim, state = self._stimuli[role], self._state[role]
+        for name, value in attributes.items():
+            if (name not in state) or not _equal(state[name], value):
+                setattr(stim, name, value)
+                state[name] = value
+
+        return stim
+
+    def reset(self, role: str, **attributes):
+        """Reset a response stimulus (slider or rating scale) for a new trial.
+
+        Parameters
+        ----------
+        role : str
+            The role of the stimulus.
+        attributes : dict
+            Attributes to set before calling the `reset()` method of the stimulus
+            (e.g. `markerStart` for :py:class:`psychopy.visual.RatingScale`).
+
+        Returns
+        -------
+        stim : psychopy visual stimulus
+            The stimulus, in its starting state.
+        """
+        stim = self.get(role)
+        for name, value in attributes.items():
+            setattr(stim, name, value)
+        stim.reset()
+
+        return stim
+
+    def countCreated(self) -> int:
+        """Number of stimuli created since the last call to this method."""
+        count = self.created - self._counted
+        self._counted = self.created
+
+        return count
+
+
+def _equal(a: Any, b: Any) -> bool:
+    """Compare two attribute values (strings, colors, positions...)."""
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    try:
+        return bool(np.array_equal(a, b))
+    except Exception:
+        return a is b
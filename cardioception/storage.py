@@ -0,0 +1,574 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import csv
+import itertools
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Header of the binary signal files: magic string and sampling frequency
+SIGNAL_MAGIC = b"CARDSIG1"
+SIGNAL_HEADER = np.dtype([("magic", "S8"), ("sfreq", "<f8")])
+
+# Header of the binary recording files: magic string, sampling frequency and number
+# of columns
+RECORDING_MAGIC = b"CARDREC1"
+RECORDING_HEADER = np.dtype([("magic", "S8"), ("sfreq", "<f8"), ("nColumns", "<i8")])
+
+
+def cacheDir() -> str:
+    """The directory where cardioception stores the files it can rebuild.
+
+    Defaults to `~/.cardioception`. Set the `CARDIOCEPTION_CACHE` environment
+    variable to use another location (e.g. a local disk on networked lab machines).
+    The directory is created if it does not exist.
+
+    Returns
+    -------
+    path : str
+        The cache directory.
+    """
+    path = os.environ.get(
+        "CARDIOCEPTION_CACHE", os.path.join(os.path.expanduser("~"), ".cardioception")
+    )
+    os.makedirs(path, exist_ok=True)
+
+    return path
+
+
+class ResultsWriter:
+    """Append-only writer for trial-level results.
+
+    Each call to :py:meth:`append` adds one row to an open CSV file instead of
+    rewriting the whole data frame, so the cost of saving a trial does not grow with
+    the number of trials already recorded. Rows can be buffered and flushed in
+    batches with a bounded latency: a background timer writes the buffered rows
+    `maxLatency` seconds after the first of them was appended, even if no other row
+    comes (e.g. during a break).
+
+    Parameters
+    ----------
+    fileName : str
+        Path to the running result file. The file is created (or overwritten) when
+        the instance is created and the rows are appended as they come.
+    columns : list of str | None
+        The column names. If `None`, the keys of the first row are used.
+    flushEvery : int
+        Number of buffered rows that triggers a write to the disk. Defaults to `1`
+        (flush after each row).
+    maxLatency : float
+        Maximum time (seconds) a row can stay in the buffer before being written to
+        the disk. Defaults to `10.0`.
+    keepRows : bool
+        If `True` (default), the rows are also kept in memory so the results can be
+        returned as a data frame with :py:meth:`toDataFrame`. Set to `False` when
+        the results are already stored elsewhere (e.g.
+        :py:class:`cardioception.HRD.results.TrialBuffer`).
+
+    Examples
+    --------
+    >>> writer = ResultsWriter("./data/Subject001.txt")
+    >>> writer.append({"nTrials": 0, "Decision": "More"})
+    >>> writer.close(finalName="./data/Subject001_final.txt")
+    >>> results_df = writer.toDataFrame()
+
+    """
+
+    def __init__(
+        self,
+        fileName: str,
+        columns: Optional[List[str]] = None,
+        flushEvery: int = 1,
+        maxLatency: float = 10.0,
+        keepRows: bool = True,
+    ):
+        self.fileName = fileName
+        self.columns = columns
+        self.flushEvery = flushEvery
+        self.maxLatency = maxLatency
+        self.keepRows = keepRows
+        self.n = 0
+        self.rows: List[Dict[str, Any]] = []
+        self._pending: List[Dict[str, Any]] = []
+        self._lastFlush = time.time()
+        self._file = open(fileName, "w", newline="")
+        self._writer: Optional[csv.DictWriter] = None
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+
+    def __len__(self) -> int:
+        return self.n
+
+    def append(self, row: Dict[str, Any]):
+        """Add a new row to the results.
+
+        Parameters
+        ----------
+        row : dict
+            Dictionary mapping column names to values for this trial.
+        """
+        with self._lock:
+            self.n += 1
+            if self.keepRows is True:
+                self.rows.append(row)
+            self._pending.append(row)
+            if (len(self._pending) >= self.flushEvery) or (
+                time.time() - self._lastFlush >= self.maxLatency
+            ):
+                self.flush()
+            elif self._timer is None:
+                # Write the buffered rows if no other row comes in time
+                self._timer = threading.Timer(self.maxLatency, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        return self
+
+    def flush(self):
+        """Write the buffered rows to the disk."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file.closed:
+                return self
+            if self._writer is None:
+                if self.columns is None:
+                    if not self._pending:
+                        return self
+                    self.columns = list(self._pending[0].keys())
+                self._writer = csv.DictWriter(
+                    self._file, fieldnames=self.columns, extrasaction="ignore"
+                )
+                self._writer.writeheader()
+            self._writer.writerows(self._pending)
+            self._file.flush()
+            self._pending = []
+            self._lastFlush = time.time()
+
+        return self
+
+    def close(self, finalName: Optional[str] = None):
+        """Flush the remaining rows and close the running file.
+
+        Parameters
+        ----------
+        finalName : str | None
+            If provided, a copy of the results is written under this name. The copy
+            is first written to a temporary file and then moved to its final
+            location with an atomic rename, so the final file is never left
+            incomplete.
+        """
+        with self._lock:
+            self.flush()
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+        if finalName is not None:
+            tmpName = finalName + ".tmp"
+            shutil.copyfile(self.fileName, tmpName)
+            os.replace(tmpName, finalName)
+
+        return self
+
+    def toDataFrame(self) -> pd.DataFrame:
+        """The results recorded so far as a :py:class:`pandas.DataFrame`."""
+        return pd.DataFrame(self.rows, columns=self.columns)
+
+
+class SignalStore:
+    """Chunked binary storage for the PPG signal recorded during the trials.
+
+    The raw signal of each trial is appended as `float32` samples to a binary file
+    as soon as the trial ends, and the trial number, offset and length of each chunk
+    are appended to an index file. Nothing is kept in memory, and closing the store
+    at the end of the session does not require any additional write.
+
+    Parameters
+    ----------
+    fileName : str
+        Path to the binary signal file (e.g. `"Subject_signal.bin"`). The index is
+        written next to it with the `.idx` extension.
+    sfreq : float
+        The sampling frequency of the signal. Defaults to `75`.
+
+    See Also
+    --------
+    loadSignal, signalDataFrame
+
+    """
+
+    def __init__(self, fileName: str, sfreq: float = 75.0):
+        self.fileName = fileName
+        self.indexName = os.path.splitext(fileName)[0] + ".idx"
+        self.sfreq = sfreq
+        self.offset = 0
+        self._data = open(fileName, "wb")
+        self._index = open(self.indexName, "wb")
+        self._data.write(np.array([(SIGNAL_MAGIC, sfreq)], SIGNAL_HEADER).tobytes())
+
+    def append(self, nTrial: int, signal: Union[list, np.ndarray]):
+        """Write the signal recorded during one trial.
+
+        Parameters
+        ----------
+        nTrial : int
+            The trial number.
+        signal : list | np.ndarray
+            The raw signal.
+        """
+        chunk = np.asarray(signal, dtype="<f4")
+        self._data.write(chunk.tobytes())
+        self._data.flush()
+        self._index.write(
+            np.array([nTrial, self.offset, len(chunk)], dtype="<i8").tobytes()
+        )
+        self._index.flush()
+        self.offset += len(chunk)
+
+        return self
+
+    def close(self):
+        """Close the signal and index files."""
+        self._data.close()
+        self._index.close()
+
+        return self
+
+
+def loadSignal(fileName: Union[str, os.PathLike]) -> Dict[int, np.ndarray]:
+    """Load the PPG signal saved by :py:class:`SignalStore`.
+
+    Parameters
+    ----------
+    fileName : str | PathLike
+        Path to the binary signal file.
+
+    Returns
+    -------
+    signals : dict
+        Dictionary mapping trial numbers to the signal recorded during this trial.
+        The arrays are read-only views of a memory-mapped file, no data is read
+        before it is accessed.
+
+    """
+    header = np.fromfile(fileName, dtype=SIGNAL_HEADER, count=1)[0]
+    if header["magic"] != SIGNAL_MAGIC:
+        raise ValueError(f"{fileName} is not a valid signal file.")
+    indexName = os.path.splitext(fileName)[0] + ".idx"
+    index = np.fromfile(indexName, dtype="<i8").reshape(-1, 3)
+    if len(index) == 0:
+        return {}
+    data: np.ndarray = np.memmap(
+        fileName, dtype="<f4", mode="r", offset=SIGNAL_HEADER.itemsize
+    )
+
+    starts, stops = index[:, 1], index[:, 1] + index[:, 2]
+
+    return {
+        int(n): data[start:stop] for n, start, stop in zip(index[:, 0], starts, stops)
+    }
+
+
+def signalDataFrame(
+    fileName: Union[str, os.PathLike], newSfreq: Optional[float] = None
+) -> pd.DataFrame:
+    """Load the PPG signal saved by :py:class:`SignalStore` as a data frame.
+
+    Parameters
+    ----------
+    fileName : str | PathLike
+        Path to the binary signal file.
+    newSfreq : float | None
+        If provided, each trial is linearly interpolated to this sampling frequency,
+        the same way as :py:func:`systole.detection.ppg_peaks` does. Using
+        `newSfreq=1000` gives the same data frame as the `_signal.txt` files saved
+        by previous versions of the task.
+
+    Returns
+    -------
+    signal_df : pd.DataFrame
+        Data frame with the columns `"signal"` and `"nTrial"`.
+
+    """
+    sfreq = np.fromfile(fileName, dtype=SIGNAL_HEADER, count=1)[0]["sfreq"]
+    signals, trials = [], []
+    for nTrial, signal in loadSignal(fileName).items():
+        x = np.asarray(signal, dtype=float)
+        if newSfreq is not None:
+            time = np.arange(0, len(x) / sfreq, 1 / sfreq)
+            newTime = np.arange(0, len(x) / sfreq, 1 / newSfreq)
+            x = np.interp(newTime, time, x)
+        signals.append(x)
+        trials.append(np.full(len(x), nTrial))
+
+    return pd.DataFrame(
+        {
+            "signal": np.concatenate(signals) if signals else np.array([]),
+            "nTrial": pd.Series(
+                np.concatenate(trials) if trials else np.array([], dtype=int),
+                dtype="category",
+            ),
+        }
+    )
+
+
+class PosteriorStore:
+    """Memory-mapped storage for the history of the Psi posterior distributions.
+
+    The `.npy` file is preallocated with shape `(nTrials, alpha, beta)` when the
+    first posterior is added, and each posterior is written to the disk as soon as
+    the trial is completed. The memory usage does not depend on the number of trials
+    and the history is preserved if the session crashes (the rows that were not
+    reached are then filled with zeros).
+
+    Parameters
+    ----------
+    fileName : str
+        Path to the `.npy` file.
+    nTrials : int
+        The maximum number of posteriors that will be stored.
+    dtype : str
+        The data type used to store the posteriors. Use `"float32"` to halve the file
+        size. Defaults to `"float64"`.
+
+    Notes
+    -----
+    The file can be read without loading it fully in memory using
+    `np.load(fileName, mmap_mode="r")`.
+
+    """
+
+    def __init__(self, fileName: str, nTrials: int, dtype: str = "float64"):
+        self.fileName = fileName
+        self.nTrials = nTrials
+        self.dtype = dtype
+        self.n = 0
+        self._array: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        return self.n
+
+    def append(self, posterior: np.ndarray):
+        """Write the posterior distribution after a new trial.
+
+        Parameters
+        ----------
+        posterior : np.ndarray
+            The (2d) posterior distribution over the alpha and beta parameters.
+        """
+        if self._array is None:
+            self._array = np.lib.format.open_memmap(
+                self.fileName,
+                mode="w+",
+                dtype=self.dtype,
+                shape=(self.nTrials,) + np.shape(posterior),
+            )
+        if self.n >= self.nTrials:
+            raise ValueError(f"Cannot store more than {self.nTrials} posteriors.")
+        self._array[self.n] = posterior
+        self._array.flush()
+        self.n += 1
+
+        return self
+
+    def close(self):
+        """Close the file and drop the rows that were not used."""
+        if self._array is None:
+            # No posterior was recorded (e.g. when using the UpDown staircase)
+            np.save(self.fileName, np.array([]))
+            return self
+
+        offset, itemShape = self._array.offset, self._array.shape[1:]
+        rowSize = int(np.prod(itemShape)) * self._array.dtype.itemsize
+        self._array.flush()
+        self._array = None
+
+        if self.n < self.nTrials:
+            # Rewrite the header with the new shape, padded to the same length so
+            # that the data offset is unchanged, and truncate the file.
+            header = repr(
+                {
+                    "descr": np.lib.format.dtype_to_descr(np.dtype(self.dtype)),
+                    "fortran_order": False,
+                    "shape": (self.n,) + itemShape,
+                }
+            )
+            with open(self.fileName, "r+b") as f:
+                major = np.lib.format.read_magic(f)[0]
+                sizeType = "<u2" if major == 1 else "<u4"
+                sizeBytes = np.dtype(sizeType).itemsize
+                headerLength = int(np.frombuffer(f.read(sizeBytes), sizeType)[0])
+                f.write(header.ljust(headerLength - 1).encode("latin1") + b"\n")
+                f.truncate(offset + self.n * rowSize)
+
+        return self
+
+
+class RecordingStore:
+    """Append-only binary file for long pulse oximeter recordings.
+
+    The samples are written in fixed-size chunks as they are recorded, so only a
+    trailing window of the recording needs to be kept in memory. Each sample is
+    stored as one row of `float64` values with the same columns as the text files
+    written by `Oximeter.save()`: `signal`, `peaks`, `instant_rr`, `time` and one
+    column per stim channel. The time is counted from the first sample of the
+    recording.
+
+    Parameters
+    ----------
+    fileName : str
+        Path to the binary recording file (e.g. `"Subject_ppg.rec"`).
+    sfreq : float
+        The sampling frequency of the signal. Defaults to `75`.
+    nChannels : int
+        The number of stim channels. Defaults to `0`.
+
+    See Also
+    --------
+    loadRecording
+
+    """
+
+    def __init__(self, fileName: str, sfreq: float = 75.0, nChannels: int = 0):
+        self.fileName = fileName
+        self.sfreq = sfreq
+        self.columns = ["signal", "peaks", "instant_rr", "time"] + [
+            f"Channel_{i}" for i in range(nChannels)
+        ]
+        self._file = open(fileName, "w+b")
+        self.reset()
+
+    def __len__(self) -> int:
+        return self.n
+
+    def reset(self):
+        """Discard the samples written so far (e.g. when a new recording starts)."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(
+            np.array(
+                [(RECORDING_MAGIC, self.sfreq, len(self.columns))], RECORDING_HEADER
+            ).tobytes()
+        )
+        self._file.flush()
+        self.n = 0
+
+        return self
+
+    def append(self, data: np.ndarray):
+        """Write new samples.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            The samples, with shape `(nSamples, nColumns)`.
+        """
+        chunk = np.asarray(data, dtype="<f8").reshape(-1, len(self.columns))
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(chunk.tobytes())
+        self._file.flush()
+        self.n += len(chunk)
+
+        return self
+
+    def chunks(self, chunkSize: int = 75000):
+        """Iterate over the samples recorded so far without loading them all.
+
+        Parameters
+        ----------
+        chunkSize : int
+            The number of samples in each chunk. Defaults to `75000`.
+
+        Yields
+        ------
+        chunk : np.ndarray
+            The samples, with shape `(nSamples, nColumns)`.
+        """
+        rowSize = len(self.columns) * 8
+        for start in range(0, self.n, chunkSize):
+            n = min(chunkSize, self.n - start)
+            self._file.seek(RECORDING_HEADER.itemsize + start * rowSize)
+            yield np.frombuffer(self._file.read(n * rowSize), "<f8").reshape(n, -1)
+
+    def export(self, fname: str, tail: Optional[np.ndarray] = None):
+        """Save the recording in the format used by `Oximeter.save()`.
+
+        The file is written chunk by chunk, so the memory usage does not depend on
+        the length of the recording.
+
+        Parameters
+        ----------
+        fname : str
+            The file name. If the extension is `.txt`, the recording is saved as a
+            comma-separated data frame with one column per variable. Otherwise, it is
+            saved as a `.npy` array with one row per variable.
+        tail : np.ndarray | None
+            Samples that have not been written to the store yet (e.g. the trailing
+            window kept in memory), appended after the stored samples.
+        """
+        chunks = itertools.chain(
+            self.chunks(), [] if tail is None else [np.asarray(tail, dtype=float)]
+        )
+        if fname.endswith(".txt"):
+            with open(fname, "w", newline="") as f:
+                f.write(",".join(self.columns) + "\n")
+                for chunk in chunks:
+                    pd.DataFrame(chunk).to_csv(f, header=False, index=False)
+        else:
+            n = self.n + (0 if tail is None else len(tail))
+            array = np.lib.format.open_memmap(
+                fname if fname.endswith(".npy") else fname + ".npy",
+                mode="w+",
+                dtype="float64",
+                shape=(len(self.columns), n),
+            )
+            start = 0
+            for chunk in chunks:
+                array[:, start : start + len(chunk)] = chunk.T  # noqa
+                start += len(chunk)
+            array.flush()
+            del array
+
+        return self
+
+    def close(self):
+        """Close the recording file."""
+        self._file.close()
+
+        return self
+
+
+def loadRecording(fileName: Union[str, os.PathLike]) -> pd.DataFrame:
+    """Load a recording saved by :py:class:`RecordingStore`.
+
+    Parameters
+    ----------
+    fileName : str | PathLike
+        Path to the binary recording file.
+
+    Returns
+    -------
+    recording_df : pd.DataFrame
+        Data frame with the columns `"signal"`, `"peaks"`, `"instant_rr"`, `"time"`
+        and `"Channel_i"` for each stim channel.
+
+    """
+    header = np.fromfile(fileName, dtype=RECORDING_HEADER, count=1)[0]
+    if header["magic"] != RECORDING_MAGIC:
+        raise ValueError(f"{fileName} is not a valid recording file.")
+    nColumns = int(header["nColumns"])
+    data = np.fromfile(fileName, dtype="<f8", offset=RECORDING_HEADER.itemsize)
+
+    return pd.DataFrame(
+        data.reshape(-1, nColumns),
+        columns=["signal", "peaks", "instant_rr", "time"]
+        + [f"Channel_{i}" for i in range(nColumns - 4)],
+    )
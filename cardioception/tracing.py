@@ -0,0 +1,416 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import json
+import os
+import threading
+import time
+import warnings
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Default trial of Tracer.record(): the trial running when the span is recorded
+_CURRENT_TRIAL: Any = object()
+
+
+class Span:
+    """A timed phase of the task, used as a context manager (see
+    :py:meth:`Tracer.span`)."""
+
+    __slots__ = ("tracer", "name", "attrs", "start", "parent", "trial")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.parent: Optional[str] = None
+        self.trial: Optional[int] = None
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1] if stack else None
+        # The trial can change before the span ends (e.g. staircase updates)
+        self.trial = self.tracer.trial
+        stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        duration = time.perf_counter() - self.start
+        self.tracer._stack().pop()
+        if excType is not None:
+            self.attrs["error"] = excType.__name__
+        self.tracer.record(
+            self.name, self.start, duration, self.parent, self.attrs, trial=self.trial
+        )
+        return False
+
+
+class Tracer:
+    """Span-based timing of the phases of a task.
+
+    Each phase of the task is wrapped in a span (`with tracer.span("name"):`), and
+    its start and duration are recorded. The spans are nested: the name of the
+    enclosing span is saved as `parent`, separately for each thread (e.g. the
+    staircase updates run in a background thread). The durations are measured with
+    :py:func:`time.perf_counter`, independently of the session clock, so the time
+    spent by the code is also measured in accelerated or simulated sessions.
+
+    The spans are written to a JSON lines file (one object per span) when
+    :py:meth:`flush` is called (e.g. after each trial) or when the buffer is full,
+    so the trace is not written during the time-critical phases.
+
+    Parameters
+    ----------
+    fileName : str | None
+        Path to the trace file (e.g. `"Subject001_trace.jsonl"`). If `None`, the
+        spans are not saved and only the summary is available.
+    bufferSize : int
+        The maximum number of spans kept in memory before they are written to the
+        file. Defaults to `1000`.
+
+    Attributes
+    ----------
+    trial : int | None
+        The current trial number, saved with the spans starting during this trial
+        (`None` outside the trials).
+    durations : dict
+        The durations (seconds) of all the spans, by name.
+
+    See Also
+    --------
+    loadTrace
+
+    Examples
+    --------
+    >>> tracer = Tracer("Subject001_trace.jsonl")
+    >>> with tracer.span("trial", modality="Intero"):
+    ...     with tracer.span("fixation"):
+    ...         core.wait(0.5)
+    >>> print(tracer.close().report())
+
+    """
+
+    def __init__(self, fileName: Optional[str] = None, bufferSize: int = 1000):
+        self.fileName = fileName
+        self.bufferSize = bufferSize
+        self.trial: Optional[int] = None
+        self.durations: Dict[str, List[float]] = {}
+        self._origin = time.perf_counter()
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = open(fileName, "w") if fileName is not None else None
+
+    def _stack(self) -> List[str]:
+        """The names of the open spans of the current thread."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def span(self, name: str, **attrs) -> Span:
+        """Time a phase of the task.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        attrs : dict
+            Additional values saved with the span (e.g. the modality).
+        """
+        return Span(self, name, attrs)
+
+    def record(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        parent: Optional[str] = None,
+        attrs: Optional[Dict[str, Any]] = None,
+        trial: Optional[int] = _CURRENT_TRIAL,
+    ):
+        """Record a span.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        start : float
+            The start time (:py:func:`time.perf_counter`).
+        duration : float
+            The duration (seconds).
+        parent : str | None
+            The name of the enclosing span.
+        attrs : dict | None
+            Additional values saved with the span.
+        trial : int | None
+            The trial number saved with the span. Defaults to the current trial
+            (`trial` attribute).
+        """
+        span = {
+            "name": name,
+            "parent": parent,
+            "trial": self.trial if trial is _CURRENT_TRIAL else trial,
+            "start": round(start - self._origin, 6),
+            "duration": round(duration, 6),
+        }
+        if threading.current_thread() is not threading.main_thread():
+            span["thread"] = threading.current_thread().name
+        if attrs:
+            span.update(attrs)
+        with self._lock:
+            self.durations.setdefault(name, []).append(duration)
+            if self._file is not None:
+                self._buffer.append(span)
+                full = len(self._buffer) >= self.bufferSize
+            else:
+                full = False
+        if full:
+            self.flush()
+
+        return self
+
+    def flush(self):
+        """Write the spans recorded since the last call to the trace file."""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+            if (self._file is not None) and spans:
+                self._file.write(
+                    "".join(
+                        json.dumps(span, separators=(",", ":"), default=_toJSON) + "\n"
+                        for span in spans
+                    )
+                )
+                self._file.flush()
+
+        return self
+
+    def close(self):
+        """Write the remaining spans and close the trace file."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        return self
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """The number of spans and the median, 95th percentile and maximum
+        durations (seconds) of each phase."""
+        with self._lock:
+            durations = {name: np.array(d) for name, d in self.durations.items()}
+
+        return {
+            name: {
+                "count": len(d),
+                "p50": float(np.percentile(d, 50)),
+                "p95": float(np.percentile(d, 95)),
+                "max": float(d.max()),
+            }
+            for name, d in durations.items()
+        }
+
+    def report(self) -> str:
+        """The summary as a table, with the durations in milliseconds."""
+        lines = [f"{'phase':<20} {'count':>6} {'p50':>10} {'p95':>10} {'max':>10}"]
+        for name, stats in self.summary().items():
+            lines.append(
+                f"{name:<20} {stats['count']:>6} "
+                + " ".join(f"{stats[k] * 1000:>10.2f}" for k in ["p50", "p95", "max"])
+            )
+
+        return "\n".join(lines)
+
+
+def _toJSON(value: Any) -> Any:
+    """Convert the numpy values of the span attributes."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def getTracer(parameters: dict) -> Tracer:
+    """The tracer of a task (a tracer without trace file if none is defined)."""
+    if parameters.get("tracer") is None:
+        parameters["tracer"] = Tracer()
+
+    return parameters["tracer"]
+
+
+class FrameMonitor:
+    """Frame intervals of the window during the response phases of the trials.
+
+    The intervals between the flips of the window are recorded with the PsychoPy
+    frame timing (`win.recordFrameIntervals`) while a phase is monitored (see
+    :py:meth:`record`), e.g. the mouse loops of the decision and of the confidence
+    rating, which redraw the screen at each frame while polling the inputs. An
+    interval longer than `threshold` refresh periods is counted as dropped frames
+    (the number of refreshes missed). The statistics of each trial are returned by
+    :py:meth:`trialStats`, and a warning is raised when the number of dropped
+    frames of a trial exceeds `budget`.
+
+    Parameters
+    ----------
+    win : :py:class:`psychopy.visual.Window`
+        The window of the task.
+    budget : int
+        The number of dropped frames tolerated during a trial. Defaults to `2`.
+    refreshRate : float | None
+        The refresh rate of the screen (Hz). If `None`, it is measured with
+        `win.getActualFrameRate()` (`60` if the measure fails).
+    threshold : float
+        The interval, in refresh periods, above which frames are considered
+        dropped. Defaults to `1.5`.
+
+    Attributes
+    ----------
+    intervals : dict
+        The frame intervals (seconds) recorded during the current trial, by phase.
+    frames, dropped : int
+        The number of frame intervals recorded and of frames dropped during the
+        session.
+    overBudget : list
+        The trials where the number of dropped frames exceeded `budget`.
+
+    Examples
+    --------
+    >>> monitor = FrameMonitor(parameters["win"], budget=2)
+    >>> with monitor.record("rating"):
+    ...     while ratingScale.noResponse:
+    ...         ratingScale.draw()
+    ...         parameters["win"].flip()
+    >>> monitor.trialStats(nTrial=0)
+    {'DecisionDroppedFrames': nan, 'RatingDroppedFrames': 0.0, ...}
+
+    """
+
+    def __init__(
+        self,
+        win,
+        budget: int = 2,
+        refreshRate: Optional[float] = None,
+        threshold: float = 1.5,
+    ):
+        self.win = win
+        self.budget = budget
+        if refreshRate is None:
+            refreshRate = win.getActualFrameRate() or 60.0
+        self.refreshRate = float(refreshRate)
+        self.threshold = threshold
+        self.intervals: Dict[str, List[float]] = {}
+        self.frames, self.dropped = 0, 0
+        self.overBudget: List[Optional[int]] = []
+
+    @contextmanager
+    def record(self, phase: str) -> Iterator["FrameMonitor"]:
+        """Record the frame intervals of a phase (`"decision"` or `"rating"`)."""
+        self.win.frameIntervals = []
+        self.win.recordFrameIntervals = True
+        try:
+            yield self
+        finally:
+            self.win.recordFrameIntervals = False
+            self.intervals.setdefault(phase, []).extend(self.win.frameIntervals)
+            self.win.frameIntervals = []
+
+    def droppedFrames(self, intervals: Union[List[float], np.ndarray]) -> int:
+        """The number of refreshes missed during these frame intervals."""
+        periods = np.asarray(intervals) * self.refreshRate
+        return int(np.sum(np.round(periods[periods > self.threshold]) - 1))
+
+    def reset(self):
+        """Discard the frame intervals recorded since the end of the last trial."""
+        self.intervals = {}
+
+        return self
+
+    def trialStats(self, nTrial: Optional[int] = None) -> Dict[str, float]:
+        """The frame statistics of the trial, and start a new trial.
+
+        Parameters
+        ----------
+        nTrial : int | None
+            The trial number, reported in the warning.
+
+        Returns
+        -------
+        stats : dict
+            The number of dropped frames during the decision and the rating
+            (`"DecisionDroppedFrames"` and `"RatingDroppedFrames"`), and the
+            standard deviation and the maximum of the frame intervals in
+            milliseconds (`"FrameJitter"` and `"MaxFrameInterval"`). `NaN` if no
+            frame was recorded.
+        """
+        stats = {}
+        for phase in ["decision", "rating"]:
+            intervals = self.intervals.get(phase, [])
+            stats[f"{phase.capitalize()}DroppedFrames"] = (
+                float(self.droppedFrames(intervals)) if intervals else np.nan
+            )
+        allIntervals = np.concatenate([[], *self.intervals.values()])
+        if allIntervals.size:
+            stats["FrameJitter"] = float(np.std(allIntervals) * 1000)
+            stats["MaxFrameInterval"] = float(allIntervals.max() * 1000)
+        else:
+            stats["FrameJitter"], stats["MaxFrameInterval"] = np.nan, np.nan
+
+        dropped = self.droppedFrames(allIntervals)
+        self.frames += allIntervals.size
+        self.dropped += dropped
+        if dropped > self.budget:
+            self.overBudget.append(nTrial)
+            warnings.warn(
+                f"{dropped} frames dropped during trial {nTrial} (budget:"
+                f" {self.budget}), the response times may be inaccurate.",
+                RuntimeWarning,
+            )
+        self.reset()
+
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """The number of frames recorded and dropped during the session, and the
+        trials over budget."""
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "overBudget": list(self.overBudget),
+        }
+
+
+def recordFrames(parameters: dict, phase: str):
+    """Record the frame intervals of a phase if frame timing is enabled (see
+    :py:class:`FrameMonitor`)."""
+    if parameters.get("frameMonitor") is None:
+        return nullcontext()
+
+    return parameters["frameMonitor"].record(phase)
+
+
+def loadTrace(fileName: Union[str, os.PathLike]) -> pd.DataFrame:
+    """Load the spans saved by :py:class:`Tracer`.
+
+    Parameters
+    ----------
+    fileName : str | PathLike
+        Path to the trace file.
+
+    Returns
+    -------
+    trace_df : pd.DataFrame
+        Data frame with one row per span and the columns `"name"`, `"parent"`,
+        `"trial"`, `"start"` and `"duration"` (seconds), followed by the additional
+        values saved with the spans.
+
+    """
+    with open(fileName) as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+
+    return pd.DataFrame(
+        spans,
+        columns=None if spans else ["name", "parent", "trial", "start", "duration"],
+    )
@@ -0,0 +1,158 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cardioception.acquisition import AcquisitionService
+from cardioception.clock import VirtualClock
+
+
+class Serial:
+    """Serial port receiving one 5 bytes packet per sample at `sfreq` Hz."""
+
+    def __init__(self, sfreq, clock=None):
+        self.sfreq = sfreq
+        self.getTime = time.perf_counter if clock is None else clock.getTime
+        self.start = self.getTime()
+        self.read = 0
+
+    def pending(self):
+        return int((self.getTime() - self.start) * self.sfreq) - self.read
+
+    def inWaiting(self):
+        return 5 * self.pending()
+
+
+class Oxi:
+    """Minimal oximeter reading a ramp signal with a peak every 10 samples."""
+
+    def __init__(self, sfreq=200, clock=None):
+        self.sfreq = sfreq
+        self.serial = Serial(sfreq, clock)
+        self.reset()
+
+    def reset(self):
+        self.recording, self.peaks, self.channels = [], [], {"Channel_0": []}
+        self.instant_rr, self.times, self.threshold, self.diff = [], [], [], []
+
+    def readInWaiting(self):
+        for _ in range(self.serial.pending()):
+            self.serial.read += 1
+            self.recording.append(float(self.serial.read))
+            self.peaks.append(int(self.serial.read % 10 == 0))
+            self.channels["Channel_0"].append(0)
+            for values in [self.instant_rr, self.times, self.threshold, self.diff]:
+                values.append(0.0)
+
+    def setup(self, read_duration=1.0, clear_peaks=True):
+        self.readInWaiting()
+        self.reset()
+
+
+class TestAcquisition(TestCase):
+    def test_AcquisitionService(self):
+        """Test the AcquisitionService class"""
+        oxiTask = AcquisitionService(Oxi(), bufferLength=1.0, pollInterval=0.002)
+        oxiTask.setup().read(duration=0.2)
+
+        # The samples are read in the background while the task is waiting
+        time.sleep(0.1)
+        assert oxiTask.window(0.1).size == 20
+        nSamples = len(oxiTask.recording)
+        assert nSamples >= 55
+
+        # Triggers are added on the last sample
+        oxiTask.trigger(2)
+        channel = oxiTask.channels["Channel_0"]
+        assert channel[len(channel) - 1 :] == [2]  # noqa
+
+        # The ring buffer contains the last second of signal in order
+        oxiTask.read(duration=1.1)
+        signal = oxiTask.window(2.0)
+        assert signal.size == 200
+        assert np.all(np.diff(signal) == 1)
+        assert signal[-1] <= oxiTask.recording[-1]
+
+        # Wait for a new peak
+        oxiTask.waitBeat()
+        assert 1 in oxiTask.peaks[-12:]
+
+        oxiTask.stop()
+        stats = oxiTask.stats()
+        assert stats["samples"] == len(oxiTask.recording)
+        assert stats["dropped"] == 0
+        assert 0 < stats["meanLatency"] <= stats["maxLatency"] < 0.1
+        assert stats["highWater"] >= 5
+
+    def test_spillFile(self):
+        """Test the bounded-memory recording mode"""
+        path = tempfile.mkdtemp()
+        oxiTask = AcquisitionService(
+            Oxi(),
+            pollInterval=0.002,
+            spillFile=os.path.join(path, "Subject_ppg.rec"),
+            keepLength=0.5,
+            chunkLength=0.25,
+        )
+        oxiTask.setup().read(duration=1.0)
+        oxiTask.trigger(3)
+
+        # Only the last samples are kept in memory
+        assert oxiTask.spilled >= 100
+        assert oxiTask.spilled % 50 == 0
+        assert 100 <= len(oxiTask.recording) < 150
+        assert len(oxiTask.times) == len(oxiTask.recording)
+        recording, offset = oxiTask.samples()
+        assert offset == oxiTask.spilled
+
+        # The full recording is saved with the time from the first sample
+        oxiTask.stop().save(os.path.join(path, "Subject_ppg.txt"))
+        ppg_df = pd.read_csv(os.path.join(path, "Subject_ppg.txt"))
+        assert len(ppg_df) == oxiTask.stats()["samples"]
+        assert np.all(np.diff(ppg_df.signal) == 1)
+        assert np.allclose(ppg_df.time, np.arange(len(ppg_df)) / 200)
+        assert (ppg_df.Channel_0 == 3).sum() == 1
+        assert abs(ppg_df.peaks.sum() - len(ppg_df) / 10) <= 1
+
+        # A new recording starts after setup
+        oxiTask.setup()
+        assert (oxiTask.spilled, len(oxiTask.store)) == (0, 0)
+        oxiTask.close()
+        assert os.listdir(path) == ["Subject_ppg.txt"]
+        shutil.rmtree(path)
+
+    def test_clock(self):
+        """Test the acquisition on a simulated clock"""
+        clock = VirtualClock()
+        oxiTask = AcquisitionService(Oxi(clock=clock), pollInterval=0.002, clock=clock)
+
+        # The setup and the waits advance the session time without waiting
+        start = time.perf_counter()
+        oxiTask.setup().read(duration=10.0)
+        assert time.perf_counter() - start < 1.0
+        assert clock.time == 11.0
+        assert len(oxiTask.recording) == 2200
+        assert not any(oxiTask.peaks[:200])  # Peaks cleared after the setup
+        assert oxiTask.window(10.0).size == 2000
+
+        oxiTask.waitBeat()
+        assert 1 in oxiTask.peaks[-2:]
+        stats = oxiTask.stop().stats()
+        assert stats["samples"] == len(oxiTask.recording)
+        assert stats["dropped"] == 0
+
+        # Without the acquisition thread
+        oxiTask.read(duration=1.0)
+        assert len(oxiTask.recording) == stats["samples"] + 200
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
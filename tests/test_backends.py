@@ -0,0 +1,120 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import unittest
+from unittest import TestCase
+
+from cardioception.backends import (
+    HeadlessBackend,
+    PsychopyBackend,
+    VirtualSound,
+    createBackend,
+    getBackend,
+)
+from cardioception.HRD.sounds import SoundCache
+
+
+class TestBackends(TestCase):
+    def test_HeadlessBackend(self):
+        """Test the HeadlessBackend class"""
+        backend = HeadlessBackend(
+            events=[("space", 1.0), ("up", 0.5), ("mouse_right", 0.6, (0.2, 0.0))]
+        )
+        core, event, visual = backend.core, backend.event, backend.visual
+
+        # The waits and the frames advance the simulated time
+        win = visual.Window(size=(800, 600))
+        core.wait(3)
+        win.flip()
+        assert abs(backend.clock.time - (3 + 1 / 60)) < 1e-9
+        assert win.frames == 1
+
+        # The stimuli constructed through the backend are counted
+        assert visual.countCreated() == 1
+        visual.TextStim(win, text="Too late")
+        visual.TextStim(win, text="Too late")
+        assert (visual.countCreated(), visual.countCreated()) == (2, 0)
+        assert visual.created == 3
+
+        clock = core.Clock()
+        core.wait(0.5)
+        assert abs(clock.getTime() - 0.5) < 1e-9
+
+        # Keys are delivered after their response time
+        start = backend.clock.time
+        assert event.waitKeys(keyList=["space"]) == ["space"]
+        assert abs(backend.clock.time - start - 1.0) < 1e-9
+        assert event.waitKeys(maxWait=0.2) is None
+
+        # The response time is counted from the first check without pause
+        clock = core.Clock()
+        key, rt = event.waitKeys(keyList=["up"], timeStamped=clock)[0]
+        assert key == "up"
+        assert abs(rt - 0.3) < 1e-9
+
+        # A click keeps the button pressed until clickReset()
+        mouse = event.Mouse()
+        buttons = mouse.getPressed()
+        while buttons == [0, 0, 0]:
+            buttons, times = mouse.getPressed(getTime=True)
+        assert buttons == [0, 0, 1]
+        assert abs(times[2] - 0.6) < 0.01
+        assert list(mouse.getPos()) == [0.2, 0.0]
+        assert mouse.getPressed() == [0, 0, 1]
+        mouse.clickReset()
+        assert mouse.getPressed() == [0, 0, 0]
+        assert [name for name, _ in backend.input.delivered] == [
+            "space",
+            "up",
+            "mouse_right",
+        ]
+
+        # Waiting for an input that was not scripted
+        with self.assertRaises(RuntimeError):
+            event.waitKeys()
+        with self.assertRaises(SystemExit):
+            core.quit()
+
+    def test_resetGap(self):
+        """Test that the response time is counted from the continuous checks"""
+        backend = HeadlessBackend(events=[("space", 0.5), ("down", 0.5)])
+
+        # A single check, then a pause, does not start the response time
+        assert backend.event.getKeys() == []
+        backend.core.wait(2)
+        start = backend.clock.time
+        while "space" not in backend.event.getKeys():
+            pass
+        assert abs(backend.clock.time - start - 0.5) < 0.01
+
+        # The rating scale is validated by the accept key
+        ratingScale = backend.visual.RatingScale(low=1, high=7, acceptKeys="down")
+        ratingScale.reset()
+        while ratingScale.noResponse:
+            ratingScale.draw()
+        assert ratingScale.getRating() == 1
+        assert abs(ratingScale.getRT() - 0.5) < 0.01
+
+    def test_createBackend(self):
+        """Test the createBackend function"""
+        assert isinstance(createBackend(), PsychopyBackend)
+        assert isinstance(createBackend("headless"), HeadlessBackend)
+        backend = HeadlessBackend()
+        assert createBackend(backend) is backend
+        with self.assertRaises(ValueError):
+            createBackend("pyglet")
+        parameters: dict = {}
+        assert isinstance(getBackend(parameters), PsychopyBackend)
+        assert isinstance(parameters["backend"], PsychopyBackend)
+
+        # Virtual sounds for the HRD task
+        soundCache = SoundCache([72.5], soundType=VirtualSound)
+        sound = soundCache.get(72.5)
+        sound.play()
+        assert (sound.plays, sound.isPlaying) == (1, True)
+        sound.stop()
+        assert sound.isPlaying is False
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
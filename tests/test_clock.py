@@ -0,0 +1,56 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from cardioception.backends import HeadlessBackend
+from cardioception.clock import SessionClock, VirtualClock
+from cardioception.sources import SignalSerial
+
+
+class TestClock(TestCase):
+    def test_SessionClock(self):
+        """Test the SessionClock class"""
+        clock = SessionClock(speed=50.0)
+        assert clock.realTime is False
+        start, wallStart = clock.getTime(), time.perf_counter()
+        clock.wait(1.0)
+        assert 1.0 <= clock.getTime() - start < 2.0
+        assert time.perf_counter() - wallStart < 0.5
+        assert SessionClock().realTime is True
+        with self.assertRaises(ValueError):
+            SessionClock(speed=0.0)
+
+        # Accelerated headless backend
+        backend = HeadlessBackend(speed=50.0)
+        start = backend.clock.getTime()
+        backend.core.wait(1.0)
+        assert 1.0 <= backend.clock.getTime() - start < 2.0
+
+    def test_SignalSerial(self):
+        """Test the SignalSerial class"""
+        clock = VirtualClock()
+        port = SignalSerial(np.arange(100.0), clock=clock, sfreq=75, loop=False)
+        assert port.inWaiting() == 0
+
+        # The samples are delivered as the session time advances
+        clock.wait(1.0)
+        assert port.inWaiting() == 75 * 5
+        packet = list(port.read(5))
+        assert packet == [1, 255, 0.0, 127, 127.0]
+        assert packet[4] == sum(packet[:4]) % 256
+        assert port.read(5)[2] == 1.0
+        port.reset_input_buffer()
+        assert port.inWaiting() == 0
+
+        # The end of the signal
+        clock.wait(1.0)
+        assert port.inWaiting() == 25 * 5
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
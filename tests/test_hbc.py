@@ -8,13 +8,20 @@ import shutil
 import unittest
 from unittest import TestCase
 
+import pytest
+
+from cardioception.backends import HeadlessBackend
 from cardioception.HBC.parameters import getParameters
 from cardioception.HBC.task import run
+from cardioception.participant import VirtualParticipant
+from cardioception.sources import SyntheticSerial
 
 
 class TestHBC(TestCase):
     def test_parameters(self):
         """Test get_parameters function"""
+        pytest.importorskip("psychopy")
+
         # Get parameters
         parameters = getParameters(setup="test")
         parameters["win"].close()
@@ -23,9 +30,16 @@ class TestHBC(TestCase):
     def test_run(self):
         """Test run function"""
         # Get parameters
-        parameters = getParameters(setup="test", taskVersion="test")
+        backend = HeadlessBackend(events=VirtualParticipant(seed=1))
+        parameters = getParameters(
+            setup="test",
+            taskVersion="test",
+            serialPort=SyntheticSerial(clock=backend.clock, seed=1),
+            backend=backend,
+        )
 
         run(parameters)
+        assert parameters["results_df"].Reported.notna().any()
 
         parameters["win"].close()
         shutil.rmtree(parameters["resultPath"])
@@ -6,20 +6,46 @@
 
 import shutil
 import unittest
+from itertools import cycle
 from unittest import TestCase
 
 import numpy as np
-from psychopy import prefs
+import pytest
+
+from cardioception.backends import HeadlessBackend
+from cardioception.HRD.parameters import (
+    compileSchedule,
+    compileTutorial,
+    getParameters,
+)
+from cardioception.HRD.task import run
+from cardioception.participant import VirtualParticipant
+from cardioception.sources import SyntheticSerial
 
-prefs.hardware["audioLib"] = ["pygame"]
 
-from cardioception.HRD.parameters import getParameters
-from cardioception.HRD.task import run
+def usePsychopy():
+    """Skip the test if PsychoPy is not installed, and set the audio library."""
+    pytest.importorskip("psychopy")
+    from psychopy import prefs
+
+    prefs.hardware["audioLib"] = ["pygame"]
+
+
+class RetireAfter:
+    """Stopping rule retiring one staircase after a fixed number of trials."""
+
+    def __init__(self, stairCase, nTrials: int):
+        self.stairCase = stairCase
+        self.nTrials = nTrials
+
+    def isDone(self, stairCase, nTrials: int) -> bool:
+        return (stairCase is self.stairCase) and (nTrials >= self.nTrials)
 
 
 class TestHRD(TestCase):
     def test_parameters(self):
         """Test parameters function"""
+        usePsychopy()
 
         parameters = getParameters(
             setup="test", nTrials=80, exteroception=True, stairType="psi"
@@ -46,16 +72,71 @@ class TestHRD(TestCase):
         assert len(parameters["staircaseType"]) == 4
         assert sum(parameters["staircaseType"] == "updown") == 4
 
+    def test_headlessParameters(self):
+        """Test parameters function without PsychoPy"""
+
+        # Single precision Psi staircases, shorter recording in memory
+        backend = HeadlessBackend()
+        parameters = getParameters(
+            setup="test",
+            nTrials=4,
+            stairType="nativePsi",
+            psiDtype="float32",
+            recordingWindow=10.0,
+            soundCacheSize=16.0,
+            posteriorDtype="float32",
+            serialPort=SyntheticSerial(clock=backend.clock, seed=1),
+            backend=backend,
+        )
+        parameters["oxiTask"].close()
+        shutil.rmtree(parameters["resultPath"])
+        assert parameters["stairCase"]["Intero"].posterior.dtype == np.float32
+        assert parameters["oxiTask"].keepLength == 10.0
+        assert parameters["soundCache"].stats["memory"] <= 16.0
+        assert parameters["posteriorDtype"] == "float32"
+        with self.assertRaises(ValueError):
+            getParameters(setup="test", psiDtype="float16", backend="headless")
+        with self.assertRaises(ValueError):
+            getParameters(setup="test", posteriorDtype="float16", backend="headless")
+
+    def test_schedule(self):
+        """Test the trial schedule"""
+        schedule = compileSchedule(nTrials=40, catchTrials=0.2, nBreaking=10, seed=12)
+        assert len(schedule) == 40
+        assert np.sum(schedule.staircaseType == "CatchTrial") == 8
+        assert list(np.flatnonzero(schedule.isBreak)) == [10, 20, 30]
+        assert np.all(np.isnan(schedule.exteroBPM[schedule.modality == "Intero"]))
+        assert np.all(np.isnan(schedule.alpha[schedule.staircaseType == "psi"]))
+        assert not schedule.isi.flags.writeable
+
+        # The catch trials of each modality use the extreme values in turn
+        catch = schedule.trials("Intero", "CatchTrial")
+        assert list(schedule.alpha[catch]) == [-30.0, 10.0, -20.0, 20.0]
+
+        # The same seed gives the same session
+        other = compileSchedule(nTrials=40, catchTrials=0.2, nBreaking=10, seed=12)
+        assert np.array_equal(schedule.modality, other.modality)
+        assert np.array_equal(schedule.isi, other.isi)
+        assert np.array_equal(schedule.bpms(), other.bpms())
+
+        tutorial = compileTutorial(nFeedback=2, nConfidence=3, seed=12)
+        assert len(tutorial) == 10
+        assert np.all(np.abs(tutorial.alpha[tutorial.trials(None, "Feedback")]) == 20)
+
     def test_run(self):
         """Test run function"""
+        usePsychopy()
 
         # VErsion 1
+        backend = HeadlessBackend(events=VirtualParticipant(threshold=5.0, seed=1))
         parameters = getParameters(
             setup="test",
             nTrials=4,
             exteroception=True,
             stairType="psi",
             catchTrials=0.5,
+            serialPort=SyntheticSerial(clock=backend.clock, seed=1),
+            backend=backend,
         )
         parameters["nConfidence"] = 1
         parameters["nFeedback"] = 1
@@ -64,7 +145,14 @@ class TestHRD(TestCase):
         parameters["win"].close()
         shutil.rmtree(parameters["resultPath"])
 
+        # No visual stimulus is constructed during the trials
+        results_df = parameters["trialBuffer"].toDataFrame()
+        assert (results_df.StimuliCreated == 0).all()
+
         # Version 2
+        backend = HeadlessBackend(
+            events=cycle([("space", 0.3), ("up", 0.6), ("down", 0.8)])
+        )
         parameters = getParameters(
             setup="test",
             nTrials=4,
@@ -72,12 +160,89 @@ class TestHRD(TestCase):
             stairType="updown",
             device="keyboard",
             catchTrials=0.0,
+            serialPort=SyntheticSerial(clock=backend.clock, seed=2),
+            backend=backend,
         )
 
         run(parameters, confidenceRating=True, runTutorial=False)
         parameters["win"].close()
         shutil.rmtree(parameters["resultPath"])
 
+    def test_stoppingRule(self):
+        """Test the reallocation of the trials of a retired staircase"""
+
+        # The interoceptive staircase is retired after 2 trials and its remaining
+        # trials are given to the exteroceptive staircase
+        backend = HeadlessBackend(events=VirtualParticipant(threshold=5.0, seed=1))
+        parameters = getParameters(
+            setup="test",
+            nTrials=8,
+            exteroception=True,
+            stairType="nativePsi",
+            stoppingRule="credibleInterval",
+            posteriorDtype="float32",
+            serialPort=SyntheticSerial(clock=backend.clock, seed=1),
+            backend=backend,
+        )
+        parameters["stoppingRule"] = RetireAfter(
+            parameters["stairCase"]["Intero"], nTrials=2
+        )
+
+        run(parameters, confidenceRating=False, runTutorial=False)
+        parameters["win"].close()
+        results_df = parameters["trialBuffer"].toDataFrame()
+        assert (results_df.Modality == "Intero").sum() == 2
+        assert (results_df.Modality == "Extero").sum() == 6
+        posteriors = np.load(
+            parameters["resultPath"]
+            + "/"
+            + parameters["participant"]
+            + "Extero_posterior.npy"
+        )
+        assert len(posteriors) == 6
+        assert posteriors.dtype == np.float32
+        shutil.rmtree(parameters["resultPath"])
+
+    def test_timeBudget(self):
+        """Test a session where the modalities are chosen by the scheduler"""
+        backend = HeadlessBackend(events=VirtualParticipant(threshold=5.0, seed=1))
+        parameters = getParameters(
+            setup="test",
+            nTrials=40,
+            exteroception=True,
+            stairType="nativePsi",
+            catchTrials=0.2,
+            timeBudget=600,
+            serialPort=SyntheticSerial(clock=backend.clock, seed=1),
+            backend=backend,
+        )
+
+        run(parameters, confidenceRating=False, runTutorial=False)
+        parameters["win"].close()
+        results_df = parameters["trialBuffer"].toDataFrame()
+        schedule = parameters["schedule"]
+        for modality in ["Intero", "Extero"]:
+            modality_df = results_df[results_df.Modality == modality]
+
+            # The catch trials are the ones planned for this modality
+            planned = (schedule.modality == modality) & (
+                schedule.staircaseType == "CatchTrial"
+            )
+            catch_df = modality_df[modality_df.TrialType == "CatchTrial"]
+            assert len(catch_df) <= planned.sum()
+            assert np.isin(catch_df.Alpha, schedule.alpha[planned]).all()
+
+            # One posterior per Psi trial
+            posteriors = np.load(
+                parameters["resultPath"]
+                + "/"
+                + parameters["participant"]
+                + modality
+                + "_posterior.npy"
+            )
+            assert len(posteriors) == (modality_df.TrialType == "psi").sum()
+        shutil.rmtree(parameters["resultPath"])
+
 
 if __name__ == "__main__":
     unittest.main(argv=["first-arg-is-ignored"], exit=False)
@@ -0,0 +1,95 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import unittest
+from types import SimpleNamespace
+from unittest import TestCase
+
+import numpy as np
+
+from cardioception.backends import HeadlessBackend
+from cardioception.participant import VirtualParticipant
+
+
+class TestParticipant(TestCase):
+    def test_decide(self):
+        """Test the psychometric function of the VirtualParticipant class"""
+        participant = VirtualParticipant(
+            threshold={"Intero": 10.0, "Extero": 0.0}, slope=5.0, lapse=0.0, seed=1
+        )
+        assert participant.pMore(10.0, "Intero") == 0.5
+        assert participant.pMore(0.0, "Extero") == 0.5
+        assert participant.pMore(5.0, "Extero") > 0.8
+
+        decisions = [participant.decide(5.0, "Extero") for _ in range(2000)]
+        pMore = np.mean([decision == "More" for decision, _ in decisions])
+        assert abs(pMore - participant.pMore(5.0, "Extero")) < 0.03
+
+        # Confidence is higher for easy trials
+        easy = np.mean([participant.decide(30.0, "Extero")[1] for _ in range(200)])
+        hard = np.mean([participant.decide(0.0, "Extero")[1] for _ in range(200)])
+        assert 0.5 <= hard < easy <= 1.0
+
+        with self.assertRaises(ValueError):
+            participant.respond("wait", {})
+
+    def test_respond(self):
+        """Test the responses of the VirtualParticipant through the headless backend"""
+        participant = VirtualParticipant(threshold=0.0, lapse=0.0, seed=2)
+        backend = HeadlessBackend(events=participant)
+        event = backend.event
+        parameters = {
+            "device": "keyboard",
+            "startKey": "space",
+            "response_keys": {"More": "up", "Less": "down"},
+            "confScale": [1, 7],
+            "minRatingTime": 0.5,
+        }
+
+        # Continue to the next screen
+        assert event.waitKeys(keyList=["space"]) == ["space"]
+
+        # Easy decision and confidence rating with the keyboard
+        backend.prompt(
+            "decision", parameters, modality="Intero", listenBPM=60.0, responseBPM=100.0
+        )
+        assert event.waitKeys(keyList=["up", "down"]) == ["up"]
+        ratingScale = backend.visual.RatingScale(
+            low=1, high=7, acceptKeys="down", markerStart=2
+        )
+        backend.prompt("confidence", parameters, scale=ratingScale)
+        while ratingScale.noResponse:
+            ratingScale.draw()
+        assert ratingScale.getRating() == participant.responses[-1]["response"] >= 6
+
+        # With the mouse, the slider follows the position of the click
+        parameters["device"] = "mouse"
+        mouse = event.Mouse()
+        backend.prompt(
+            "decision", parameters, modality="Extero", listenBPM=60.0, responseBPM=40.0
+        )
+        while mouse.getPressed() == [0, 0, 0]:
+            pass
+        assert mouse.getPressed() == [1, 0, 0]
+        mouse.clickReset()
+        backend.prompt("confidence", parameters, scale=None)
+        while mouse.getPressed() == [0, 0, 0]:
+            pass
+        rating = participant.responses[-1]["response"]
+        assert abs(50 + mouse.getPos()[0] / 0.5 * 50 - rating) < 1e-9
+
+        # Heartbeat counting between the event markers
+        oxiTask = SimpleNamespace(
+            peaks=[0, 1] * 50, channels={"Channel_0": [0] * 10 + [1] + [0] * 79 + [2]}
+        )
+        parameters.update({"device": "keyboard", "oxiTask": oxiTask})
+        backend.prompt("count", parameters, duration=25)
+        keys = []
+        while "return" not in keys:
+            keys += event.waitKeys()
+        assert participant.responses[-1]["beats"] == 40
+        assert "".join(keys[:-1]) == str(participant.responses[-1]["response"])
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
@@ -0,0 +1,64 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from cardioception.peaks import StreamingPeakDetector, matchPeaks
+
+
+def pulse(peakTimes: np.ndarray, duration: float, sfreq: float = 75.0) -> np.ndarray:
+    """Simulate a PPG signal with systolic peaks at the given times."""
+    time = np.arange(0, duration, 1 / sfreq)
+    waves = np.exp(-(((time[:, None] - peakTimes[None, :]) / 0.1) ** 2))
+    return 100 + 50 * waves.sum(axis=1)
+
+
+class TestPeaks(TestCase):
+    def test_StreamingPeakDetector(self):
+        """Test the StreamingPeakDetector class"""
+        peakTimes = np.arange(0.5, 30, 60 / 72)  # 72 BPM
+        signal = pulse(peakTimes, duration=30.0)
+
+        # The peaks do not depend on the size of the chunks received
+        detector = StreamingPeakDetector(sfreq=75)
+        for i in range(0, len(signal), 7):
+            detector.update(signal[i : i + 7])  # noqa
+        allAtOnce = StreamingPeakDetector(sfreq=75).update(signal)
+        assert np.allclose(detector.peaks, allAtOnce.peaks)
+
+        # Peaks are found with a precision better than the sampling interval
+        peaks = np.array(detector.peaks)
+        expected = peakTimes[peakTimes < 30 - detector.lag]
+        assert len(peaks) == len(expected)
+        assert np.abs(peaks - expected).max() < 1 / 75
+        assert np.allclose(detector.rr, 60000 / 72, atol=10)
+        assert np.allclose(detector.bpm(window=5.0), 72, atol=1)
+
+        # Read new samples from a recording, and reset when the recording is shorter
+        detector, recording = StreamingPeakDetector(sfreq=75), list(signal[:450])
+        detector.consume(recording)
+        assert detector.nSamples == 450
+        recording += list(signal[450:600])
+        detector.consume(recording)
+        assert detector.nSamples == 600
+        detector.consume(recording[:100])
+        assert detector.nSamples == 100
+
+    def test_matchPeaks(self):
+        """Test the comparison of the peaks with the true heartbeats"""
+        beats = np.arange(1.0, 11.0)
+        peaks = [1.02, 2.0, 2.05, 4.0, 5.3, 6.01, 7.0, 8.0, 9.0, 9.95]
+        scores = matchPeaks(peaks, beats, tolerance=0.1)
+        assert scores["truePositives"] == 8
+        assert scores["falsePositives"] == 2  # 2.05 (duplicate) and 5.3 (too far)
+        assert scores["falseNegatives"] == 2  # 3.0 and 5.0
+        assert scores["sensitivity"] == scores["precision"] == 0.8
+        assert abs(scores["maxError"] - 0.05) < 1e-9
+        assert np.isnan(matchPeaks([], beats)["precision"])
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
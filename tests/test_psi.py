@@ -0,0 +1,141 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from cardioception.HRD.psi import (
+    PsiGrid,
+    PsiStaircase,
+    StaircaseWorker,
+    StoppingRule,
+    openPsiGrid,
+    posterior,
+    posteriorEntropy,
+    thresholdInterval,
+)
+
+
+class TestPsi(TestCase):
+    def test_PsiStaircase(self):
+        """Test the PsiStaircase class"""
+        stairCase = PsiStaircase(nTrials=20)
+        assert stairCase.posterior.shape == (102, 250)
+
+        # Same first intensity as psychopy.data.PsiHandler
+        assert stairCase.next() == -0.5
+        stairCase.addResponse(0, intensity=15)
+        assert stairCase.intensities == [15]
+
+        # Simulated participant with a threshold of 10 BPM
+        rng = np.random.default_rng(0)
+        single = PsiStaircase(nTrials=20, dtype="float32")
+        single.next()
+        single.addResponse(0)
+        for alpha in stairCase:
+            isMore = int(rng.random() < 0.01 + 0.98 * (alpha > 10))
+            stairCase.addResponse(isMore)
+            assert single.next() == alpha
+            single.addResponse(isMore)
+        assert stairCase.finished
+        assert len(stairCase.data) == 20
+        with self.assertRaises(StopIteration):
+            stairCase.next()
+
+        threshold, slope = stairCase.estimateLambda()
+        assert 0 < threshold < 20
+        assert np.isclose(posterior(stairCase).sum(), 1.0)
+        assert stairCase.estimateThreshold(0.5) == threshold
+
+        # Single precision gives the same intensities and a close posterior
+        assert single.posterior.dtype == np.float32
+        assert np.allclose(single.posterior, stairCase.posterior, atol=1e-6)
+        assert np.allclose(single.estimateLambda(), (threshold, slope))
+
+    def test_PsiGrid(self):
+        """Test the PsiGrid class and the grid cache"""
+        path = tempfile.mkdtemp()
+        os.environ["CARDIOCEPTION_CACHE"] = path
+        kwargs = {"intensRange": (-10.5, 10.5), "alphaRange": (-10.5, 10.5)}
+
+        # The tables are computed once, then memory-mapped
+        grid = openPsiGrid(**kwargs)
+        assert os.listdir(path) == [os.path.basename(grid.fileName)]
+        cached = openPsiGrid(**kwargs)
+        assert cached.fileName == grid.fileName
+        assert cached.nbytes == 2 * 22 * 250 * 22 * 8
+        assert not cached.likelihood.flags.writeable
+        assert np.all(cached.likelihood == PsiGrid(**kwargs).likelihood)
+        assert openPsiGrid(dtype="float32", **kwargs).fileName != grid.fileName
+
+        # The staircases share the tables and give the same intensities
+        intero = PsiStaircase(nTrials=5, grid=cached)
+        extero = PsiStaircase(nTrials=5, grid=cached)
+        reference = PsiStaircase(nTrials=5, **kwargs)
+        assert np.shares_memory(intero._likelihood, extero._likelihood)
+        for isMore in [1, 0, 1, 1, 0]:
+            assert intero.next() == reference.next()
+            intero.addResponse(isMore)
+            reference.addResponse(isMore)
+        assert np.all(intero.posterior == reference.posterior)
+        assert np.all(extero.posterior == 1 / (22 * 250))
+
+        del os.environ["CARDIOCEPTION_CACHE"]
+        shutil.rmtree(path)
+
+    def test_StoppingRule(self):
+        """Test the stopping rule of the Psi staircase"""
+        stairCase = PsiStaircase(nTrials=60, dtype="float32")
+        assert np.isclose(posteriorEntropy(stairCase), np.log2(102 * 250), atol=1e-3)
+        assert thresholdInterval(stairCase) == 97.0
+
+        rule = StoppingRule(minTrials=10, target=20.0)
+        entropyRule = StoppingRule("entropy", target=0.0, maxTrials=15)
+        with self.assertRaises(ValueError):
+            StoppingRule("variance")
+
+        # Simulated participant with a threshold of 10 BPM and a steep slope
+        rng = np.random.default_rng(0)
+        widths = []
+        for nTrials, alpha in enumerate(stairCase, start=1):
+            stairCase.addResponse(int(rng.random() < 0.01 + 0.98 * (alpha > 10)))
+            widths.append(thresholdInterval(stairCase))
+            if rule.isDone(stairCase, nTrials):
+                break
+        assert 10 <= nTrials < 60
+        assert widths[-1] <= 20.0
+        assert (nTrials == 10) or (widths[-2] > 20.0)
+        assert rule.measure(stairCase) == widths[-1]
+        assert entropyRule.measure(stairCase) < np.log2(102 * 250)
+        assert not entropyRule.isDone(stairCase, 14)
+        assert entropyRule.isDone(stairCase, 15)
+
+    def test_StaircaseWorker(self):
+        """Test the StaircaseWorker class"""
+        stairCase, reference = PsiStaircase(nTrials=5), PsiStaircase(nTrials=5)
+        worker = StaircaseWorker()
+        with self.assertRaises(RuntimeError):
+            worker.result()
+
+        # Same intensities when the updates run in the background
+        for isMore in [1, 0, 1, 1, 0]:
+            assert stairCase.next() == reference.next()
+            assert worker.submit(stairCase.addResponse, isMore).pending
+            reference.addResponse(isMore)
+            assert worker.result() is stairCase
+        assert np.all(stairCase.posterior == reference.posterior)
+
+        worker.close()
+        summary = worker.summary()
+        assert summary["updates"] == 5
+        assert summary["duration"] > 0
+        assert np.isclose(summary["hidden"], sum(t["hidden"] for t in worker.timing))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
@@ -0,0 +1,67 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from cardioception.clock import VirtualClock
+from cardioception.HRD.psi import PsiStaircase, expectedInformationGain
+from cardioception.HRD.scheduler import SessionScheduler
+
+
+class TestScheduler(TestCase):
+    def test_expectedInformationGain(self):
+        """Test the expected information gain of the next Psi trial"""
+        stairCase = PsiStaircase(nTrials=20)
+        gains = [expectedInformationGain(stairCase)]
+        assert 0 < gains[0] <= 1
+        for alpha in stairCase:
+            stairCase.addResponse(int(alpha > 5))
+            gains.append(expectedInformationGain(stairCase))
+        assert gains[-1] < gains[0]
+
+    def test_SessionScheduler(self):
+        """Test the SessionScheduler class"""
+        stairCases = {"Intero": PsiStaircase(nTrials=50), "Extero": PsiStaircase(50)}
+        clock = VirtualClock()
+        scheduler = SessionScheduler(
+            budget=100.0,
+            modalities=["Intero", "Extero"],
+            expectedDuration=10.0,
+            clock=clock,
+        )
+        assert scheduler.elapsed == 0.0
+
+        # Slower interoceptive trials with the same gain, the fastest modality wins
+        scheduler.record("Intero", 30.0)
+        assert scheduler.duration("Intero") == 20.0
+        assert scheduler.next(stairCases) == "Extero"
+        assert scheduler.next(stairCases, exclude=["Extero"]) == "Intero"
+
+        # The gain of a staircase decreases as it is updated
+        rng = np.random.default_rng(0)
+        for _ in range(15):
+            alpha = stairCases["Extero"].next()
+            stairCases["Extero"].addResponse(int(rng.random() < (alpha > 0)))
+            scheduler.record("Extero", 10.0)
+        assert scheduler.next(stairCases) == "Intero"
+
+        # The session ends when no trial fits in the remaining time
+        scheduler.start()
+        clock.wait(85.0)
+        assert scheduler.remaining == 15.0
+        assert scheduler.next(stairCases) == "Extero"
+        clock.wait(10.0)
+        assert scheduler.next(stairCases) is None
+        assert scheduler.summary()["Extero"] == {"trials": 15, "duration": 10.0}
+
+        # UpDown staircases are balanced
+        scheduler = SessionScheduler(budget=100.0, modalities=["Intero", "Extero"])
+        scheduler.record("Intero", 12.0)
+        assert scheduler.next({"Intero": object(), "Extero": object()}) == "Extero"
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
@@ -0,0 +1,106 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import filecmp
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pkg_resources  # type: ignore
+
+from cardioception.HRD.generate_sound_stimuli import generate_stimuli
+from cardioception.HRD.sounds import (
+    StimulusBank,
+    bankKey,
+    buildStimulusBank,
+    openStimulusBank,
+    reachableBPMs,
+    readWav,
+    synthesize,
+    synthLoader,
+    verifySynthesis,
+)
+
+
+class TestSounds(TestCase):
+    def test_reachableBPMs(self):
+        """Test the reachableBPMs function"""
+        bpms = reachableBPMs(listenRange=(40.0, 120.0), alphaRange=(-50.5, 50.5))
+        assert len(bpms) == len(np.unique(bpms)) == 312
+        assert bpms.min() == 15.0
+        assert bpms.max() == 170.5
+        assert bpms[0] == 80.0  # Center of the listening range first
+
+    def test_readWav(self):
+        """Test the readWav function"""
+        audio, sampleRate = readWav(72.5)
+        assert sampleRate == 44100
+        assert audio.dtype == np.float32
+        assert np.abs(audio).max() <= 0.5
+        assert len(audio) == 5 * (8820 + int((60000 / 72.5 - 200) * 44.1))
+
+    def test_synthesize(self):
+        """Test the synthesize function against the WAV files"""
+        audio = synthesize(72.5)
+        assert audio.dtype == np.int16
+        wavAudio, _ = readWav(72.5)
+        synthAudio, sampleRate = synthLoader(72.5)
+        assert sampleRate == 44100
+        assert np.array_equal(wavAudio, synthAudio)
+        assert verifySynthesis([15.0, 60.5, 199.5]) == []
+
+        # Custom tones
+        audio = synthesize(60.0, freq=880.0, nBeats=2)
+        assert len(audio) == 2 * 44100
+
+    def test_generate_stimuli(self):
+        """Test the generate_stimuli function"""
+        with tempfile.TemporaryDirectory() as output:
+            fileNames = generate_stimuli([60.0, 72.5], output=output, n_jobs=1)
+            assert fileNames == [
+                os.path.join(output, "60.0.wav"),
+                os.path.join(output, "72.5.wav"),
+            ]
+            shipped = pkg_resources.resource_filename(
+                "cardioception.HRD", "Sounds/72.5.wav"
+            )
+            assert filecmp.cmp(fileNames[1], shipped, shallow=False)
+
+    def test_stimulusBank(self):
+        """Test the StimulusBank class"""
+        with tempfile.TemporaryDirectory() as path:
+            fileName = buildStimulusBank(
+                os.path.join(path, "test.bank"), bpms=[60.0, 72.5]
+            )
+            bank = StimulusBank(fileName)
+            assert len(bank) == 2
+            assert 72.5 in bank
+            assert bank.bpms == [60.0, 72.5]
+            audio = bank.get(72.5)
+            assert not audio.flags.writeable
+            assert np.array_equal(audio, synthesize(72.5))
+            assert np.array_equal(bank.loader(72.5)[0], readWav(72.5)[0])
+            del audio
+
+            # The bank is rebuilt if the synthesis parameters changed
+            assert bank.key == bankKey([60.0, 72.5])
+            bank.close()
+            bank = openStimulusBank(fileName, bpms=[60.0, 72.5], volume=0.25)
+            assert bank.key == bankKey([60.0, 72.5], volume=0.25)
+            assert np.array_equal(bank.get(60.0), synthesize(60.0, volume=0.25))
+            bank.close()
+
+            # Default bank built in the cache directory
+            os.environ["CARDIOCEPTION_CACHE"] = path
+            try:
+                bank = openStimulusBank()
+            finally:
+                del os.environ["CARDIOCEPTION_CACHE"]
+            assert os.path.exists(os.path.join(path, f"HRD_stimuli_{bankKey()}.bank"))
+            assert len(bank) == 370
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
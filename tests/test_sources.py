@@ -0,0 +1,152 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cardioception.clock import VirtualClock
+from cardioception.peaks import StreamingPeakDetector, matchPeaks
+from cardioception.sources import (
+    ReplaySerial,
+    SyntheticPPG,
+    SyntheticSerial,
+    loadSession,
+)
+from cardioception.storage import RecordingStore, SignalStore
+
+
+class TestSources(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_loadSession(self):
+        """Test loading the signal from the files saved by the tasks"""
+        signal = np.arange(150.0) % 100
+        recording = np.array([signal, np.zeros(150), np.zeros(150), np.arange(150)])
+
+        # Break files of the HRD task, sorted by trial number
+        for nTrial in [20, 100]:
+            pd.DataFrame(
+                recording.T, columns=["signal", "peaks", "instant_rr", "time"]
+            ).to_csv(os.path.join(self.path, f"Subject_ppg_{nTrial}.txt"), index=False)
+        pd.DataFrame({"signal": [1.0] * 75}).to_csv(
+            os.path.join(self.path, "Subject_ppg_9.txt"), index=False
+        )
+        x = loadSession(os.path.join(self.path, "Subject_ppg_*.txt"))
+        assert len(x) == 375
+        assert np.all(x[:75] == 1.0)
+        assert np.array_equal(x[75:225], signal)
+
+        # Trials of the HBC task, signal store and recording store
+        np.save(os.path.join(self.path, "Subject1_1.npy"), recording)
+        store = SignalStore(os.path.join(self.path, "Subject_signal.bin"))
+        store.append(0, signal[:50]).append(1, signal[50:]).close()
+        recordingStore = RecordingStore(os.path.join(self.path, "Subject_ppg.rec"))
+        recordingStore.append(recording.T).close()
+        for fileName in ["Subject1_1.npy", "Subject_signal.bin", "Subject_ppg.rec"]:
+            x = loadSession(os.path.join(self.path, fileName))
+            assert np.array_equal(x, signal)
+
+        # Signal of the previous versions of the HRD task, interpolated at 1000 Hz
+        pd.DataFrame(
+            {"signal": np.full(2000, 50.0), "nTrial": np.repeat([0, 1], 1000)}
+        ).to_csv(os.path.join(self.path, "Subject_signal.txt"), index=False)
+        x = loadSession([os.path.join(self.path, "Subject_signal.txt")])
+        assert len(x) == 150
+        assert np.all(x == 50.0)
+
+        with self.assertRaises(ValueError):
+            loadSession(os.path.join(self.path, "*.csv"))
+        with self.assertRaises(ValueError):
+            loadSession([os.path.join(self.path, "Subject_signal.idx")])
+
+    def test_ReplaySerial(self):
+        """Test the ReplaySerial class"""
+        fileName = os.path.join(self.path, "Subject1_1.npy")
+        np.save(fileName, np.array([np.arange(7500.0) % 200, np.zeros(7500)]))
+
+        # Replay without irregularities
+        clock = VirtualClock()
+        port = ReplaySerial(fileName, clock=clock, loop=False)
+        clock.wait(2.0)
+        assert port.inWaiting() == 150 * 5
+        assert [port.read(5)[2] for _ in range(150)] == list(np.arange(150.0))
+
+        # Samples delivered late and in bursts, without loss
+        port = ReplaySerial(fileName, clock=clock, jitter=0.5, seed=1)
+        values = []
+        for _ in range(50):
+            clock.wait(0.1)
+            while port.inWaiting():
+                values.append(port.read(5)[2])
+        assert 4.5 * 75 <= len(values) <= 5 * 75
+        assert values == list(np.arange(len(values)) % 200)
+
+        # Gaps in the signal
+        port = ReplaySerial(fileName, clock=clock, dropout=0.1, seed=1)
+        assert 0.07 < 1 - port.kept.mean() < 0.13
+        clock.wait(10.0)
+        nSamples = port.inWaiting() // 5
+        assert nSamples == np.sum(port.kept[:750])
+        values = [port.read(5)[2] for _ in range(nSamples)]
+        assert values == list(np.flatnonzero(port.kept[:750]) % 200)
+
+        with self.assertRaises(ValueError):
+            ReplaySerial(fileName, dropout=1.0)
+
+    def test_SyntheticPPG(self):
+        """Test the SyntheticPPG class"""
+        ppg = SyntheticPPG(heartRate=[(0, 60), (60, 120)], seed=1)
+        signal = np.concatenate([ppg.generate(75) for _ in range(60)])
+        assert len(signal) == ppg.position == 4500
+        assert (signal.min() >= 0) and (signal.max() <= 255)
+
+        # The heart rate follows the trajectory
+        rr = np.diff(ppg.beats)
+        assert abs(60 / rr[ppg.beats[1:] < 10].mean() - 65) < 5
+        assert abs(60 / rr[ppg.beats[1:] > 50].mean() - 115) < 5
+
+        # The peaks found match the ground truth
+        detector = StreamingPeakDetector(history=120).update(signal)
+        scores = matchPeaks(detector.peaks, ppg.beats[ppg.beats < 60 - detector.lag])
+        assert scores["sensitivity"] > 0.95
+        assert scores["precision"] > 0.95
+        assert scores["meanError"] < 0.02
+
+        # Motion artifacts, signal losses and clipping
+        ppg = SyntheticPPG(motionRate=4.0, lossRate=2.0, baseline=230.0, seed=2)
+        signal = ppg.generate(75 * 60)
+        assert (len(ppg.artifacts) > 0) and (len(ppg.losses) > 0)
+        lossStart, lossStop = ppg.losses[0]
+        lost = signal[int(np.ceil(lossStart * 75)) : int(lossStop * 75)]  # noqa
+        assert np.all(lost == 0.0)
+        assert np.any(signal == 255.0)
+
+    def test_SyntheticSerial(self):
+        """Test several synthetic sources streaming in parallel"""
+        clock = VirtualClock()
+        ports = [SyntheticSerial(clock=clock, seed=seed) for seed in range(3)]
+        clock.wait(20.0)
+        signals = []
+        for port in ports:
+            assert port.inWaiting() == 75 * 20 * 5
+            signals.append([port.read(5)[2] for _ in range(75 * 20)])
+            assert len(port.ppg.beats) > 15
+        assert not np.array_equal(signals[0], signals[1])
+
+        # Same signal as the generator
+        ppg = SyntheticPPG(seed=0)
+        assert np.allclose(signals[0], ppg.generate(75 * 20))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
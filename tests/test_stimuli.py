@@ -0,0 +1,56 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import unittest
+from unittest import TestCase
+
+from cardioception.stimuli import StimulusRegistry
+
+
+class Stim:
+    """Minimal stimulus recording the attributes set after creation."""
+
+    def __init__(self, win, **kwargs):
+        for name, value in dict(kwargs, win=win, resets=0).items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "updates", [])
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "updates"):
+            self.updates.append(name)
+        object.__setattr__(self, name, value)
+
+    def reset(self):
+        object.__setattr__(self, "resets", self.resets + 1)
+
+
+class TestStimuli(TestCase):
+    def test_registry(self):
+        """Test the StimulusRegistry class"""
+        stimuli = StimulusRegistry(win="window")
+        stimuli.add("fixation", Stim, size=0.1)
+        stimuli.add("message", Stim, text="Too late", color="red", pos=(0.0, -0.2))
+        stimuli.build()
+        assert len(stimuli) == 2
+        assert "message" in stimuli
+        assert stimuli.countCreated() == 2
+
+        # Existing instances are returned, unchanged attributes are not set again
+        message = stimuli.get("message", text="Too late", pos=(0.0, -0.2))
+        assert message is stimuli.get("message")
+        assert message.win == "window"
+        assert message.updates == []
+        stimuli.get("message", color="blue")
+        stimuli.get("message", color="blue")
+        assert message.updates == ["color"]
+        assert stimuli.countCreated() == 0
+
+        # Response stimuli are reset instead of recreated
+        stimuli.add("ratingScale", Stim, markerStart=1)
+        ratingScale = stimuli.reset("ratingScale", markerStart=4)
+        assert (ratingScale.markerStart, ratingScale.resets) == (4, 1)
+        assert stimuli.countCreated() == 1
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
@@ -0,0 +1,165 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cardioception.HRD.results import HRD_COLUMNS, TrialBuffer, TrialRecord
+from cardioception.storage import (
+    PosteriorStore,
+    RecordingStore,
+    ResultsWriter,
+    SignalStore,
+    loadRecording,
+    loadSignal,
+    signalDataFrame,
+)
+
+
+class TestStorage(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_results_writer(self):
+        """Test the ResultsWriter class"""
+        fileName = os.path.join(self.path, "Subject001.txt")
+        finalName = os.path.join(self.path, "Subject001_final.txt")
+
+        writer = ResultsWriter(fileName, flushEvery=2, maxLatency=60.0)
+        writer.append({"nTrials": 0, "Decision": "More", "Confidence": None})
+
+        # The first row is still in the buffer
+        assert os.path.getsize(fileName) == 0
+
+        writer.append({"nTrials": 1, "Decision": "Less", "Confidence": 50.0})
+        assert len(pd.read_csv(fileName)) == 2
+
+        writer.append({"nTrials": 2, "Decision": None, "Confidence": None})
+        writer.close(finalName=finalName)
+
+        final_df = pd.read_csv(finalName)
+        assert len(writer) == 3
+        assert list(final_df.columns) == ["nTrials", "Decision", "Confidence"]
+        assert final_df.nTrials.tolist() == [0, 1, 2]
+        assert final_df.Decision.isna().sum() == 1
+        assert not os.path.exists(finalName + ".tmp")
+
+        results_df = writer.toDataFrame()
+        assert results_df.shape == (3, 3)
+        assert results_df.Decision.tolist()[:2] == ["More", "Less"]
+
+        # The buffered rows are written after maxLatency, without a new row
+        writer = ResultsWriter(fileName, flushEvery=10, maxLatency=0.05)
+        writer.append({"nTrials": 0, "Decision": "More", "Confidence": None})
+        assert os.path.getsize(fileName) == 0
+        time.sleep(0.5)
+        assert len(pd.read_csv(fileName)) == 1
+        writer.close()
+
+    def test_trial_buffer(self):
+        """Test the TrialRecord and TrialBuffer classes"""
+        record = TrialRecord(condition="More", listenBPM=70.5, alpha=10.0)
+        assert len(tuple(record)) == 17
+        condition, listenBPM, *_ = record
+        assert (condition, listenBPM) == ("More", 70.5)
+        with self.assertRaises(TypeError):
+            TrialRecord(wrongField=1)
+
+        buffer = TrialBuffer(HRD_COLUMNS, size=2)
+        for i in range(3):  # Add more trials than preallocated
+            idx = buffer.add(record, TrialType="psi", nTrials=i)
+        assert len(buffer) == 3
+
+        row = buffer.row(idx)
+        assert row["Alpha"] == 10.0
+        assert row["nTrials"] == 2
+        assert row["Decision"] is None
+        assert row["EstimatedThreshold"] is None
+
+        results_df = buffer.toDataFrame()
+        assert results_df.shape == (3, len(HRD_COLUMNS))
+        assert results_df.nTrials.tolist() == [0, 1, 2]
+        assert np.isnan(results_df.DecisionRT).all()
+
+    def test_signal_store(self):
+        """Test the SignalStore class and the signal loaders"""
+        fileName = os.path.join(self.path, "Subject_signal.bin")
+        store = SignalStore(fileName, sfreq=75)
+        store.append(0, np.arange(450))
+        store.append(2, [1.0, 2.0, 3.0])
+        store.close()
+
+        signals = loadSignal(fileName)
+        assert list(signals.keys()) == [0, 2]
+        assert np.array_equal(signals[0], np.arange(450))
+        assert np.array_equal(signals[2], [1.0, 2.0, 3.0])
+
+        # Resampling to 1000 Hz matches the text files from previous versions
+        signal_df = signalDataFrame(fileName, newSfreq=1000)
+        assert (signal_df.nTrial == 0).sum() == 6000
+        assert signal_df.signal.iloc[0] == 0.0
+        assert list(signal_df.columns) == ["signal", "nTrial"]
+
+    def test_posterior_store(self):
+        """Test the PosteriorStore class"""
+        fileName = os.path.join(self.path, "SubjectIntero_posterior.npy")
+        store = PosteriorStore(fileName, nTrials=10, dtype="float32")
+        for i in range(3):
+            store.append(np.full((5, 4), i, dtype=float))
+        store.close()
+
+        posteriors = np.load(fileName, mmap_mode="r")
+        assert posteriors.shape == (3, 5, 4)
+        assert posteriors.dtype == np.float32
+        assert np.all(posteriors[2] == 2)
+
+        # No posterior recorded (e.g. UpDown staircase)
+        PosteriorStore(fileName, nTrials=10).close()
+        assert np.load(fileName).size == 0
+
+    def test_recording_store(self):
+        """Test the RecordingStore class"""
+        fileName = os.path.join(self.path, "Subject_ppg.rec")
+        store = RecordingStore(fileName, sfreq=75, nChannels=1)
+        data = np.column_stack([np.arange(200.0)] * 5)
+        store.append(data[:150]).append(data[150:180])
+        assert len(store) == 180
+
+        recording_df = loadRecording(fileName)
+        assert list(recording_df.columns) == [
+            "signal",
+            "peaks",
+            "instant_rr",
+            "time",
+            "Channel_0",
+        ]
+        assert np.array_equal(recording_df.values, data[:180])
+
+        # Exported files, with the samples that are still in memory
+        store.export(os.path.join(self.path, "Subject_ppg.txt"), tail=data[180:])
+        ppg_df = pd.read_csv(os.path.join(self.path, "Subject_ppg.txt"))
+        assert np.array_equal(ppg_df.values, data)
+        assert list(ppg_df.columns) == list(recording_df.columns)
+        store.export(os.path.join(self.path, "Subject_ppg"))
+        assert np.array_equal(
+            np.load(os.path.join(self.path, "Subject_ppg.npy")), data[:180].T
+        )
+
+        # Start a new recording
+        store.reset().append(data[:10])
+        assert len(loadRecording(fileName)) == 10
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)
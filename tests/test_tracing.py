@@ -0,0 +1,141 @@
+# Authors: Nicolas Legrand and Micah Allen, 2019-2022. Contact: micah@cfin.au.dk
+# Maintained by the Embodied Computation Group, Aarhus University
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cardioception.backends import NullWindow
+from cardioception.clock import VirtualClock
+from cardioception.tracing import (
+    FrameMonitor,
+    Tracer,
+    getTracer,
+    loadTrace,
+    recordFrames,
+)
+
+
+class TestTracing(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_Tracer(self):
+        """Test the Tracer class"""
+        fileName = os.path.join(self.path, "Subject_trace.jsonl")
+        tracer = Tracer(fileName)
+
+        # Nested spans, saved with the trial number
+        tracer.trial = 0
+        with tracer.span("trial", modality=np.str_("Intero")):
+            with tracer.span("fixation"):
+                time.sleep(0.01)
+            with self.assertRaises(KeyError):
+                with tracer.span("decision"):
+                    raise KeyError
+
+        # Spans of a background thread, ending after the next trial started
+        started, nextTrial = threading.Event(), threading.Event()
+
+        def update():
+            with tracer.span("staircaseUpdate"):
+                started.set()
+                nextTrial.wait()
+
+        thread = threading.Thread(target=update, name="staircase")
+        thread.start()
+        started.wait()
+        tracer.trial = 1
+        nextTrial.set()
+        thread.join()
+
+        # The spans are only written when flushed
+        assert os.path.getsize(fileName) == 0
+        tracer.flush()
+        trace_df = loadTrace(fileName)
+        assert list(trace_df.name) == [
+            "fixation",
+            "decision",
+            "trial",
+            "staircaseUpdate",
+        ]
+        assert list(trace_df.parent[:2]) == ["trial", "trial"]
+        assert pd.isna(trace_df.parent[3])
+        assert trace_df.trial.eq(0).all()  # The trial when the span started
+        assert trace_df.modality[2] == "Intero"
+        assert trace_df.error[1] == "KeyError"
+        assert trace_df.thread[3] == "staircase"
+        assert trace_df.duration[0] >= 0.01
+        assert trace_df.duration[2] >= trace_df.duration[0]
+
+        # Summary of the durations
+        tracer.trial = None
+        for duration in np.arange(1, 101) / 1000:
+            tracer.record("response", 0.0, duration)
+        summary = tracer.close().summary()
+        assert summary["response"]["count"] == 100
+        assert np.isclose(summary["response"]["p50"], 0.0505)
+        assert np.isclose(summary["response"]["p95"], 0.09505)
+        assert np.isclose(summary["response"]["max"], 0.1)
+        assert "response" in tracer.report()
+        assert len(loadTrace(fileName)) == 104
+
+        # Tracer without file
+        parameters: dict = {}
+        tracer = getTracer(parameters)
+        assert parameters["tracer"] is tracer
+        with tracer.span("trial"):
+            pass
+        assert tracer.summary()["trial"]["count"] == 1
+        assert getTracer(parameters) is tracer
+
+    def test_FrameMonitor(self):
+        """Test the FrameMonitor class"""
+        clock = VirtualClock()
+        win = NullWindow(clock, frameRate=60.0)
+        monitor = FrameMonitor(win, budget=2)
+        assert monitor.refreshRate == 60.0
+
+        # Regular frames, only recorded in the monitored phases
+        with monitor.record("decision"):
+            for _ in range(11):
+                win.flip()
+        win.flip()
+        stats = monitor.trialStats(nTrial=0)
+        assert stats["DecisionDroppedFrames"] == 0
+        assert np.isnan(stats["RatingDroppedFrames"])
+        assert stats["FrameJitter"] < 1e-6
+        assert np.isclose(stats["MaxFrameInterval"], 1000 / 60)
+        assert monitor.frames == 10
+
+        # Late frames during the rating, over budget
+        with monitor.record("rating"):
+            for delay in [0.0, 0.0, 0.02, 0.0, 0.04, 0.0]:
+                clock.advance(delay)
+                win.flip()
+        with self.assertWarns(RuntimeWarning):
+            stats = monitor.trialStats(nTrial=1)
+        assert stats["RatingDroppedFrames"] == 1 + 2
+        assert np.isclose(stats["MaxFrameInterval"], 1000 / 60 + 40)
+        assert stats["FrameJitter"] > 10
+        assert monitor.stats() == {"frames": 15, "dropped": 3, "overBudget": [1]}
+
+        # Frame timing disabled
+        with recordFrames({"frameMonitor": None}, "rating"):
+            win.flip()
+        assert not win.recordFrameIntervals
+        assert win.frameIntervals == []
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg-is-ignored"], exit=False)